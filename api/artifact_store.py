@@ -0,0 +1,241 @@
+"""
+成品内容寻址存储与输出目录回收：成品按 sha256 存入 output/artifacts，结果文件以硬链接发布（相同内容只存一份、不重复写盘）；
+后台回收线程按时长与总量配额清理 output/<task_id> 任务目录（仍可断点重试的失败任务只按时长清理），并回收无人引用的成品。
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_ROOT = Path(__file__).resolve().parent.parent / "output"
+ARTIFACTS_DIR = OUTPUT_ROOT / "artifacts"
+# output 下不属于任务目录的子目录
+RESERVED_DIRS = {"results", "hls", "artifacts"}
+# 仍可能续跑或断点重试的任务状态：只按 work_retention_failed_hours 清理，不受配额影响
+_RETRYABLE_STATUSES = {"pending", "running", "failed"}
+
+_stats_lock = threading.Lock()
+_stats = {"published": 0, "deduped": 0, "sweeps": 0, "removed_dirs": 0, "removed_artifacts": 0, "reclaimed_bytes": 0}
+
+
+def _bump(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def file_digest(path: str | Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """原子地把 dst 指向 src 的内容：先硬链接到临时名再 rename 覆盖（跨文件系统时退回复制）。"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def blob_path(digest: str, suffix: str = ".mp4", *, artifacts_dir: Path | None = None) -> Path:
+    """内容哈希对应的成品库文件路径。"""
+    return (artifacts_dir or ARTIFACTS_DIR) / digest[:2] / f"{digest}{suffix}"
+
+
+def publish(src: str | Path, dest: str | Path, *, artifacts_dir: Path | None = None) -> str:
+    """
+    把成品 src 发布到 dest：按内容哈希存入成品库（已有相同内容则复用，不再写盘），dest 为指向库中文件的硬链接。
+    返回内容哈希。
+    """
+    src, dest = Path(src), Path(dest)
+    digest = file_digest(src)
+    blob = blob_path(digest, src.suffix, artifacts_dir=artifacts_dir)
+    if blob.is_file():
+        _bump("deduped")
+        logger.info("[artifacts] 成品内容已存在，复用 %s", blob.name)
+    else:
+        _link_or_copy(src, blob)
+    _link_or_copy(blob, dest)
+    _bump("published")
+    return digest
+
+
+def _dir_usage(path: Path) -> tuple[int, float]:
+    """目录总字节数（同一 inode 只计一次，硬链接到成品库的文件不计入）与最新 mtime。"""
+    total = 0
+    newest = 0.0
+    seen: set[tuple[int, int]] = set()
+    for root, _dirs, files in os.walk(path):
+        try:
+            newest = max(newest, os.stat(root).st_mtime)
+        except OSError:
+            continue
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            newest = max(newest, st.st_mtime)
+            if st.st_nlink > 1 or (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total, newest
+
+
+def _is_digest(name: str) -> bool:
+    return len(name) == 64 and all(c in "0123456789abcdef" for c in name)
+
+
+def _task_status(task_id: str) -> str | None:
+    """任务状态；没有记录时返回空串，查询失败返回 None（按可重试处理，宁可少删）。"""
+    from api.history_store import get_record
+    try:
+        rec = get_record(task_id)
+    except Exception:
+        return None
+    return rec.status if rec else ""
+
+
+def _remove(path: Path, size: int) -> None:
+    shutil.rmtree(path, ignore_errors=True)
+    _bump("removed_dirs")
+    _bump("reclaimed_bytes", size)
+
+
+def sweep(output_root: Path | None = None, *, now: float | None = None) -> dict:
+    """
+    执行一轮回收，返回本轮 {"removed_dirs", "removed_artifacts", "reclaimed_bytes"}：
+    1. 可重试（pending/running/failed）任务目录超过 work_retention_failed_hours 才删除；
+    2. 其余（成功、记录已删除）任务目录超过 work_retention_success_hours 删除；
+    3. 任务目录总量仍超过 output_quota_bytes 时，从最旧的不可重试任务目录开始删除；
+    4. 删除成品库中已无任何链接引用的文件；
+    5. 删除成品已不在库中的 HLS 共享目录（hls/<内容哈希>）与失效的任务 HLS 链接。
+    """
+    settings = get_settings()
+    root = Path(output_root) if output_root else OUTPUT_ROOT
+    now = time.time() if now is None else now
+    before = get_stats()
+    if root.is_dir():
+        candidates: list[tuple[float, int, Path]] = []
+        remaining = 0
+        for task_dir in root.iterdir():
+            if not task_dir.is_dir() or task_dir.name in RESERVED_DIRS:
+                continue
+            size, newest = _dir_usage(task_dir)
+            age_hours = (now - newest) / 3600
+            status = _task_status(task_dir.name)
+            if status is None or status in _RETRYABLE_STATUSES:
+                limit = settings.work_retention_failed_hours
+                if limit > 0 and age_hours > limit:
+                    _remove(task_dir, size)
+                else:
+                    remaining += size
+                continue
+            limit = settings.work_retention_success_hours
+            if limit > 0 and age_hours > limit:
+                _remove(task_dir, size)
+                continue
+            remaining += size
+            candidates.append((newest, size, task_dir))
+        quota = settings.output_quota_bytes
+        if quota > 0 and remaining > quota:
+            for _, size, task_dir in sorted(candidates):
+                if remaining <= quota:
+                    break
+                _remove(task_dir, size)
+                remaining -= size
+    artifacts = root / "artifacts"
+    if artifacts.is_dir():
+        for blob in artifacts.glob("*/*"):
+            try:
+                st = blob.stat()
+            except OSError:
+                continue
+            # 只剩成品库自身这一个链接：结果文件与任务目录都已删除
+            if blob.is_file() and st.st_nlink <= 1:
+                blob.unlink(missing_ok=True)
+                _bump("removed_artifacts")
+                _bump("reclaimed_bytes", st.st_size)
+    hls_root = root / "hls"
+    if hls_root.is_dir():
+        for entry in hls_root.iterdir():
+            if entry.is_symlink():
+                if not entry.exists():
+                    entry.unlink(missing_ok=True)
+            elif entry.is_dir() and _is_digest(entry.name) and not any(artifacts.glob(f"{entry.name[:2]}/{entry.name}.*")):
+                _remove(entry, _dir_usage(entry)[0])
+    _bump("sweeps")
+    after = get_stats()
+    result = {k: after[k] - before[k] for k in ("removed_dirs", "removed_artifacts", "reclaimed_bytes")}
+    if result["removed_dirs"] or result["removed_artifacts"]:
+        logger.info(
+            "[artifacts] 回收任务目录 %d 个、成品 %d 个，释放 %.1f MB",
+            result["removed_dirs"], result["removed_artifacts"], result["reclaimed_bytes"] / 1e6,
+        )
+    return result
+
+
+class RetentionSweeper:
+    """后台回收线程：每 artifact_sweep_interval_minutes 执行一次 sweep()，stop() 后退出。"""
+
+    def __init__(self, interval_seconds: float, output_root: Path | None = None):
+        self.interval = interval_seconds
+        self.output_root = output_root
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="artifact-sweeper", daemon=True)
+
+    def start(self) -> "RetentionSweeper":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                sweep(self.output_root)
+            except Exception as e:
+                logger.warning("[artifacts] 回收失败: %s", e)
+            if self._stop.wait(self.interval):
+                return
+
+
+_sweeper: RetentionSweeper | None = None
+
+
+def start_sweeper() -> RetentionSweeper | None:
+    """按配置启动后台回收线程；间隔 <= 0 时不启动。"""
+    global _sweeper
+    minutes = get_settings().artifact_sweep_interval_minutes
+    if minutes <= 0 or _sweeper is not None:
+        return _sweeper
+    _sweeper = RetentionSweeper(minutes * 60).start()
+    return _sweeper
+
+
+def stop_sweeper() -> None:
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.stop()
+        _sweeper = None
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
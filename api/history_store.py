@@ -22,6 +22,7 @@ class HistoryRecord:
     error: Optional[str] = None
     created_at: str = ""
     updated_at: str = ""
+    work_task_id: Optional[str] = None  # 检查点所在输出目录对应的 task_id（随领头任务失败的跟随者指向领头任务）
 
 
 def _ensure_dir() -> None:
@@ -54,6 +55,9 @@ def init_db() -> None:
         conn.execute(
             "CREATE INDEX IF NOT EXISTS ix_history_created_at ON history(created_at DESC)"
         )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+        if "work_task_id" not in columns:
+            conn.execute("ALTER TABLE history ADD COLUMN work_task_id TEXT")
         conn.commit()
     finally:
         conn.close()
@@ -69,6 +73,7 @@ def _row_to_record(row: sqlite3.Row) -> HistoryRecord:
         error=row["error"],
         created_at=row["created_at"] or "",
         updated_at=row["updated_at"] or "",
+        work_task_id=row["work_task_id"],
     )
 
 
@@ -117,6 +122,20 @@ def update_problem(task_id: str, problem_text: str) -> None:
         conn.close()
 
 
+def inherit_work(task_id: str, work_task_id: str, problem_text: Optional[str]) -> None:
+    """让任务沿用另一任务的检查点目录；自身没有题目文本时一并沿用其题目文本（如仅图片提交的跟随者）。"""
+    now = _now_iso()
+    conn = _get_conn()
+    try:
+        conn.execute(
+            "UPDATE history SET work_task_id = ?, problem_text = COALESCE(problem_text, ?), updated_at = ? WHERE task_id = ?",
+            (work_task_id, problem_text, now, task_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
 def update_status(
     task_id: str,
     status: str,
@@ -0,0 +1,208 @@
+"""
+持久化任务队列（SQLite，可放在多台机器共享的卷上）：execution_mode=queue 时 API 只入队，独立 worker 进程租约领取任务。
+worker 执行期间定期续约并上报当前步骤；租约过期（worker 崩溃或失联）的任务重新入队，由其他 worker 从检查点续跑。
+"""
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from config import get_settings
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DB_PATH = DATA_DIR / "job_queue.db"
+
+_init_lock = threading.Lock()
+_initialized: set[Path] = set()
+
+
+@dataclass
+class Job:
+    job_id: int
+    task_id: str
+    kind: str  # generate | retry
+    payload: dict
+    image: bytes | None
+    attempts: int
+
+
+def _db_path() -> Path:
+    configured = get_settings().job_queue_db
+    return Path(configured) if configured else DB_PATH
+
+
+def _get_conn() -> sqlite3.Connection:
+    path = _db_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    with _init_lock:
+        if path not in _initialized:
+            _init_schema(conn)
+            _initialized.add(path)
+    return conn
+
+
+def _init_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            image BLOB,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            current_step TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs(status, job_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_task ON jobs(task_id)")
+
+
+def pending_count() -> int:
+    conn = _get_conn()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def enqueue(task_id: str, kind: str, payload: dict | None = None, image: bytes | None = None) -> int:
+    """入队，返回排队位置（前面还有多少个等待中的任务）。"""
+    now = time.time()
+    conn = _get_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        ahead = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        conn.execute(
+            "INSERT INTO jobs (task_id, kind, payload, image, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (task_id, kind, json.dumps(payload or {}, ensure_ascii=False), image, now, now),
+        )
+        conn.execute("COMMIT")
+        return ahead
+    finally:
+        conn.close()
+
+
+def requeue_expired(conn: sqlite3.Connection, now: float) -> list[str]:
+    """
+    租约过期的任务：未超过 job_max_attempts 的重新入队（续跑时从检查点继续），否则标记失败。
+    返回被判定失败的 task_id 列表。须在事务内调用。
+    """
+    max_attempts = get_settings().job_max_attempts
+    expired = conn.execute(
+        "SELECT job_id, task_id, attempts FROM jobs WHERE status = 'leased' AND lease_expires < ?", (now,)
+    ).fetchall()
+    failed: list[str] = []
+    for row in expired:
+        if row["attempts"] >= max_attempts:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, updated_at = ? WHERE job_id = ?",
+                (f"worker 租约过期且已重试 {row['attempts']} 次", now, row["job_id"]),
+            )
+            failed.append(row["task_id"])
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE job_id = ?",
+                (now, row["job_id"]),
+            )
+    return failed
+
+
+def lease(owner: str) -> tuple[Job | None, list[str]]:
+    """
+    领取最早入队的任务并加租约（job_lease_seconds）。领取前先处理过期租约。
+    返回 (任务或 None, 因多次租约过期被判定失败的 task_id 列表)。
+    """
+    now = time.time()
+    lease_seconds = get_settings().job_lease_seconds
+    conn = _get_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        failed = requeue_expired(conn, now)
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY job_id LIMIT 1").fetchone()
+        job = None
+        if row is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE job_id = ?",
+                (owner, now + lease_seconds, now, row["job_id"]),
+            )
+            job = Job(
+                job_id=row["job_id"],
+                task_id=row["task_id"],
+                kind=row["kind"],
+                payload=json.loads(row["payload"]),
+                image=row["image"],
+                attempts=row["attempts"] + 1,
+            )
+        conn.execute("COMMIT")
+        return job, failed
+    finally:
+        conn.close()
+
+
+def heartbeat(job_id: int, owner: str, current_step: str | None = None) -> bool:
+    """续约并上报当前步骤；租约已不属于 owner（已过期被重新分配）时返回 False。"""
+    now = time.time()
+    conn = _get_conn()
+    try:
+        cur = conn.execute(
+            "UPDATE jobs SET lease_expires = ?, current_step = COALESCE(?, current_step), updated_at = ? "
+            "WHERE job_id = ? AND lease_owner = ? AND status = 'leased'",
+            (now + get_settings().job_lease_seconds, current_step, now, job_id, owner),
+        )
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def complete(job_id: int, owner: str, error: str | None = None) -> bool:
+    """标记任务结束（error 为空即成功）；租约已不属于 owner 时不修改并返回 False。"""
+    conn = _get_conn()
+    try:
+        cur = conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE job_id = ? AND lease_owner = ? AND status = 'leased'",
+            ("failed" if error else "done", error, time.time(), job_id, owner),
+        )
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def current_step(task_id: str) -> str | None:
+    """该任务最近一个执行中任务上报的步骤（供 API 进程展示进度）。"""
+    conn = _get_conn()
+    try:
+        row = conn.execute(
+            "SELECT current_step FROM jobs WHERE task_id = ? AND status = 'leased' ORDER BY job_id DESC LIMIT 1",
+            (task_id,),
+        ).fetchone()
+        return row["current_step"] if row else None
+    finally:
+        conn.close()
+
+
+def get_stats() -> dict:
+    """各状态任务数与当前持有租约的 worker。"""
+    conn = _get_conn()
+    try:
+        counts = {r["status"]: r["n"] for r in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+        owners = [r["lease_owner"] for r in conn.execute(
+            "SELECT DISTINCT lease_owner FROM jobs WHERE status = 'leased' AND lease_owner IS NOT NULL"
+        )]
+    finally:
+        conn.close()
+    return {"jobs": counts, "workers": owners}
@@ -9,6 +9,7 @@ class GenerateVideoRequest(BaseModel):
 class GenerateVideoResponse(BaseModel):
     task_id: str = Field(..., description="任务 ID，用于轮询状态")
     status: str = Field("pending", description="pending | running | success | failed")
+    queue_position: int | None = Field(None, description="提交时的排队位置，0 表示立即开始")
 
 
 class TaskStatusResponse(BaseModel):
@@ -17,6 +18,7 @@ class TaskStatusResponse(BaseModel):
     video_url: str | None = Field(None, description="成功时的结果视频 URL（相对或绝对）")
     error: str | None = Field(None, description="失败时的错误信息")
     current_step: str | None = Field(None, description="当前执行步骤，用于前端进度显示")
+    hls_url: str | None = Field(None, description="启用 HLS 时的主播放列表 URL（分片可能仍在写出）")
 
 
 class HistoryItem(BaseModel):
@@ -30,8 +32,10 @@ class HistoryItem(BaseModel):
 
 class RegenerateRequest(BaseModel):
     task_id: str = Field(..., description="要基于其题目重新生成的任务 ID")
+    force: bool = Field(True, description="为 false 时允许复用成品结果缓存")
 
 
 class RegenerateResponse(BaseModel):
     task_id: str = Field(..., description="新任务 ID")
-    status: str = Field(default="pending", description="pending")
\ No newline at end of file
+    status: str = Field(default="pending", description="pending；命中成品缓存时为 success")
+    queue_position: int | None = Field(None, description="提交时的排队位置，0 表示立即开始")
\ No newline at end of file
@@ -1,13 +1,17 @@
-"""流水线编排：题目分析 → 脚本生成 → TTS+时长 → 时长注入 → Manim 自愈渲染 → 音频拼接 → 合成。支持断点检查点，失败重试时从当前步骤继续。"""
+"""流水线编排：题目分析 → (脚本生成 ∥ TTS+时长) → (时长注入与 Manim 自愈渲染 ∥ 音频拼接) → 合成。按依赖图并发执行，支持逐阶段断点检查点，失败重试时只执行未完成的阶段。"""
 import logging
+import threading
 from pathlib import Path
 from typing import Callable
 
-from asset_generation.manim_render import render_manim_video_with_self_heal
-from asset_generation.timing import inject_timing_into_code
+from asset_generation import render_cache, tex_cache
+from asset_generation.manim_render import MEDIA_DIR_NAME, render_manim_video_with_self_heal
+from asset_generation.timing import inject_timing_into_code, step_marker_suffix
 from asset_generation.tts import generate_audios_for_steps
 from composition.audio_concat import concat_audio_files
-from composition.ffmpeg_compose import CompositionError, compose_video
+from composition.ffmpeg_compose import CompositionError, compose_video, compose_video_with_audio_segments
+from composition.retime import retime_video
+from config import get_settings
 from problem_analysis.analyzer import analyze_problem
 from script_generation.generator import generate_manim_code_and_prompts
 
@@ -16,9 +20,14 @@ from api.pipeline_checkpoint import (
     load_checkpoint,
     save_step_checkpoint,
 )
+from api.pipeline_graph import GraphNode, run_graph
+from api.scheduler import CPU, IO, stage_slot
 
 logger = logging.getLogger(__name__)
 
+# 流水线版本：提示词、渲染或合成方式的改动会影响成品时递增，使成品结果缓存（api.result_cache）中的旧条目失效
+PIPELINE_VERSION = "1"
+
 # 流水线步骤名称，供进度回调与前端展示
 PIPELINE_STEPS = [
     "题目分析",
@@ -29,6 +38,45 @@ PIPELINE_STEPS = [
     "视频合成",
 ]
 
+# 各阶段的前置依赖（PIPELINE_STEPS 下标）：TTS 只依赖分析结果，音频拼接不依赖渲染
+PIPELINE_DEPS: dict[int, tuple[int, ...]] = {
+    0: (),
+    1: (0,),
+    2: (0,),
+    3: (1, 2),
+    4: (2,),
+    5: (3, 4),
+}
+
+# 各阶段占用的全局阶段池（见 api.scheduler）：LLM/TTS 为 IO 型，Manim/FFmpeg 为 CPU 型
+PIPELINE_STAGE_POOLS: dict[int, str] = {
+    0: IO,
+    1: IO,
+    2: IO,
+    3: CPU,
+    4: CPU,
+    5: CPU,
+}
+
+
+# 渲染前等待公式预热的最长秒数
+TEX_PREWARM_WAIT_SECONDS = 5.0
+
+
+def _retime_at_compose() -> bool:
+    """timing_mode=compose 时渲染不依赖 TTS 时长，改在合成阶段补帧；分段渲染模式不支持，回退为渲染前注入。"""
+    settings = get_settings()
+    if settings.timing_mode != "compose":
+        return False
+    if settings.manim_render_mode == "sharded":
+        logger.warning("[pipeline] 分段渲染模式不支持合成阶段重定时，回退为渲染前注入时长")
+        return False
+    return True
+
+
+class PipelineCancelled(RuntimeError):
+    """流水线被调用方取消（如 worker 租约已失效、任务已由其他 worker 接手）。"""
+
 
 def run_pipeline(
     problem_text: str,
@@ -38,17 +86,19 @@ def run_pipeline(
     image_mime_type: str = "image/jpeg",
     on_step_start: Callable[[int, str], None] | None = None,
     force_restart: bool = False,
+    cancel_event: threading.Event | None = None,
 ) -> Path:
     """
-    依次执行：题目分析 → 脚本生成 → TTS 与时长收集 → 时长注入 → Manim 自愈渲染 → 音频拼接 → 合成。
-    每步成功后写入检查点；若某步失败，重试时从该步直接开始，不重头执行。
+    按依赖图执行：题目分析 → 脚本生成 ∥ TTS 与时长收集 → 时长注入与 Manim 自愈渲染 ∥ 音频拼接 → 合成。
+    每个阶段成功后写入检查点；若某阶段失败，重试时仅执行未完成的阶段，不重头执行。
 
     :param problem_text: 题目文本（已经过 OCR 和公式验证）
     :param output_dir: 输出目录
     :param image_base64: 可选，原始题目图片的 base64 编码（用于让 LLM 看到原图提升图形/公式准确度）
     :param image_mime_type: 图片 MIME 类型
-    :param on_step_start: 进度回调 on_step_start(step_index, step_name)
-    :param force_restart: 为 True 时忽略已有检查点，从头执行
+    :param on_step_start: 进度回调 on_step_start(step_index, step_name)，并发阶段各自回调（可能来自不同线程）
+    :param force_restart: 为 True 时清除已有检查点，从头执行
+    :param cancel_event: 置位后不再开始新阶段，并结束正在运行的 Manim/FFmpeg 进程，抛出 PipelineCancelled
     :return: 最终视频文件路径。任一步失败则向上抛出异常。
     """
     output_dir = Path(output_dir)
@@ -56,100 +106,170 @@ def run_pipeline(
     work = output_dir / "work"
     work.mkdir(parents=True, exist_ok=True)
 
-    def _step(i: int, name: str) -> None:
+    def _step(node: GraphNode) -> None:
+        if cancel_event is not None and cancel_event.is_set():
+            raise PipelineCancelled(f"流水线已取消，未开始阶段: {node.name}")
         if on_step_start:
-            on_step_start(i, name)
-        logger.info("[pipeline] 阶段%d/6 %s…", i + 1, name)
-
-    # ---------- 断点恢复：加载检查点，决定起始步骤 ----------
-    start_step = 0
-    steps = None
-    script_out = None
-    manim_code = ""
-    durations: list[float] = []
-
-    if not force_restart:
-        last_done, steps_ck, script_ck, durations_ck = load_checkpoint(work)
-        if last_done >= 0 and steps_ck is not None:
-            start_step = last_done + 1
-            steps = steps_ck
+            on_step_start(node.index, node.name)
+        logger.info("[pipeline] 阶段%d/6 %s…", node.index + 1, node.name)
+
+    # ---------- 断点恢复：加载检查点，决定已完成阶段 ----------
+    completed: set[int] = set()
+    state: dict = {"steps": None, "manim_code": "", "durations": [], "tex_prewarm": None}
+
+    if force_restart:
+        clear_checkpoint(work)
+    else:
+        completed, steps_ck, script_ck, durations_ck = load_checkpoint(work)
+        if completed and steps_ck is not None:
+            state["steps"] = steps_ck
             if script_ck is not None:
-                script_out = script_ck
-                manim_code = script_ck.manim_code
+                state["manim_code"] = script_ck.manim_code
             if durations_ck is not None:
-                durations = durations_ck
-            logger.info("[pipeline] 从检查点恢复，从步骤 %d/%s 继续", start_step, PIPELINE_STEPS[start_step - 1] if start_step else "无")
+                state["durations"] = durations_ck
+            logger.info(
+                "[pipeline] 从检查点恢复，已完成阶段: %s",
+                [PIPELINE_STEPS[i] for i in sorted(completed)] or "无",
+            )
+        else:
+            completed = set()
 
     audio_dir = work / "audio"
+    manim_video = work / "manim.mp4"
+    manim_media = work / MEDIA_DIR_NAME
+    full_audio = work / "full_audio.mp3"
+    timed_video = work / "manim_timed.mp4"
+    retime = _retime_at_compose()
+    fused = get_settings().compose_fused
+    final_video = output_dir / "final.mp4"
+
+    def _require_steps():
+        steps = state["steps"]
+        if steps is None or not steps:
+            raise ValueError("题目分析结果不可用，无法继续流水线")
+        return steps
 
     # ---------- 阶段 0：题目分析 ----------
-    if start_step <= 0:
-        _step(0, PIPELINE_STEPS[0])
+    def analyze() -> None:
         steps = analyze_problem(
             problem_text,
             image_base64=image_base64,
             image_mime_type=image_mime_type,
         )
         logger.info("[pipeline] 题目分析完成 步骤数=%d", len(steps))
+        state["steps"] = steps
+        _require_steps()
         save_step_checkpoint(work, 0, steps)
-
-    if steps is None or not steps:
-        raise ValueError("题目分析结果不可用，无法继续流水线")
+        # 公式预编译与脚本生成、TTS 并行
+        state["tex_prewarm"] = tex_cache.prewarm_in_background(steps)
 
     # ---------- 阶段 1：脚本生成 ----------
-    if start_step <= 1:
-        _step(1, PIPELINE_STEPS[1])
+    def generate_script() -> None:
         script_out = generate_manim_code_and_prompts(
-            steps,
+            _require_steps(),
             image_base64=image_base64,
             image_mime_type=image_mime_type,
         )
-        manim_code = script_out.manim_code
-        logger.info("[pipeline] 脚本生成完成 manim_code 长度=%d", len(manim_code))
+        state["manim_code"] = script_out.manim_code
+        logger.info("[pipeline] 脚本生成完成 manim_code 长度=%d", len(script_out.manim_code))
         save_step_checkpoint(work, 1, script_out)
 
     # ---------- 阶段 2：TTS 与时长收集 ----------
-    if start_step <= 2:
-        _step(2, PIPELINE_STEPS[2])
+    def synthesize_audio() -> None:
         audio_dir.mkdir(parents=True, exist_ok=True)
-        durations = generate_audios_for_steps(steps, output_dir=audio_dir, prefix="step")
+        durations = generate_audios_for_steps(_require_steps(), output_dir=audio_dir, prefix="step")
+        state["durations"] = durations
         logger.info("[pipeline] TTS 完成 时长列表=%s", durations)
         save_step_checkpoint(work, 2, durations)
 
     # ---------- 阶段 3：时长注入与 Manim 渲染 ----------
-    if start_step <= 3:
-        _step(3, PIPELINE_STEPS[3])
-        final_code = inject_timing_into_code(manim_code, durations)
-        manim_video = work / "manim.mp4"
-        render_manim_video_with_self_heal(final_code, manim_video)
+    def render() -> None:
+        if state["tex_prewarm"] is not None:
+            # 预热通常在脚本生成期间已完成；未完成时只短暂等待，之后与渲染并行（共享缓存经原子替换写入，可安全并发）
+            state["tex_prewarm"].join(timeout=TEX_PREWARM_WAIT_SECONDS)
+        if retime:
+            # 以标记 wait 渲染，与旁白时长无关；补帧留到合成阶段。同一份代码（如换音色重新生成）直接复用缓存的渲染产物
+            suffix = step_marker_suffix()
+            cache_key = render_cache.make_key(state["manim_code"], suffix) if render_cache.is_enabled() else None
+            if cache_key and render_cache.fetch(cache_key, manim_video, manim_media / "cached_partials"):
+                logger.info("[pipeline] 命中渲染缓存，跳过 Manim 渲染")
+            else:
+                render_manim_video_with_self_heal(
+                    state["manim_code"], manim_video, manim_media, code_suffix=suffix, cancel_event=cancel_event
+                )
+                if cache_key:
+                    render_cache.store(cache_key, manim_video)
+        else:
+            final_code = inject_timing_into_code(state["manim_code"], state["durations"])
+            render_manim_video_with_self_heal(final_code, manim_video, manim_media, cancel_event=cancel_event)
         logger.info("[pipeline] Manim 渲染完成 %s", manim_video)
         save_step_checkpoint(work, 3, None)
 
-    manim_video = work / "manim.mp4"
+    def _audio_files() -> list[Path]:
+        return sorted(audio_dir.glob("step_*.mp3"), key=lambda p: int(p.stem.split("_")[1]))
 
     # ---------- 阶段 4：音频拼接 ----------
-    if start_step <= 4:
-        _step(4, PIPELINE_STEPS[4])
-        audio_files = sorted(audio_dir.glob("step_*.mp3"), key=lambda p: int(p.stem.split("_")[1]))
-        full_audio = work / "full_audio.mp3"
-        concat_audio_files(audio_files, full_audio)
+    def concat_audio() -> None:
+        audio_files = _audio_files()
+        if fused:
+            # 拼接并入合成阶段的单次 FFmpeg 调用，这里只确认各步音频齐全
+            if not audio_files:
+                raise ValueError("没有可用的分步音频，无法合成")
+            logger.info("[pipeline] 音频拼接并入合成阶段，共 %d 段", len(audio_files))
+            save_step_checkpoint(work, 4, None)
+            return
+        concat_audio_files(audio_files, full_audio, cancel_event=cancel_event)
         logger.info("[pipeline] 音频拼接完成 %s", full_audio)
         save_step_checkpoint(work, 4, None)
 
-    full_audio = work / "full_audio.mp3"
-
     # ---------- 阶段 5：视频合成 ----------
-    if start_step <= 5:
-        _step(5, PIPELINE_STEPS[5])
-        final_video = output_dir / "final.mp4"
-        compose_video(manim_video, full_audio, final_video)
+    def compose() -> None:
+        video = manim_video
+        if retime:
+            retime_video(manim_video, state["durations"], timed_video, cancel_event=cancel_event)
+            video = timed_video
+        if fused:
+            try:
+                compose_video_with_audio_segments(video, _audio_files(), final_video, cancel_event=cancel_event)
+            except CompositionError as e:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise
+                logger.warning("[pipeline] 单次合成失败，回退为先拼接音频再合成: %s", e)
+                concat_audio_files(_audio_files(), full_audio, cancel_event=cancel_event)
+                compose_video(video, full_audio, final_video, cancel_event=cancel_event)
+        else:
+            compose_video(video, full_audio, final_video, cancel_event=cancel_event)
         logger.info("[pipeline] 流水线全部完成 %s", final_video)
         save_step_checkpoint(work, 5, None)
-        clear_checkpoint(work)
-        return final_video
 
-    final_video = output_dir / "final.mp4"
+    deps = dict(PIPELINE_DEPS)
+    if retime:
+        deps[3] = (1,)
+
+    def _pooled(i: int, fn: Callable[[], None]) -> Callable[[], None]:
+        def run() -> None:
+            with stage_slot(PIPELINE_STAGE_POOLS[i]):
+                try:
+                    fn()
+                except Exception as e:
+                    # 取消时被结束的 Manim/FFmpeg 进程以普通错误返回，统一转为 PipelineCancelled
+                    if cancel_event is not None and cancel_event.is_set() and not isinstance(e, PipelineCancelled):
+                        raise PipelineCancelled(f"流水线已取消，阶段中止: {PIPELINE_STEPS[i]}") from e
+                    raise
+        return run
+
+    runners = [analyze, generate_script, synthesize_audio, render, concat_audio, compose]
+    nodes = [
+        GraphNode(index=i, name=PIPELINE_STEPS[i], run=_pooled(i, fn), deps=deps[i])
+        for i, fn in enumerate(runners)
+    ]
+    max_workers = 2 if get_settings().pipeline_concurrent_stages else 1
+    run_graph(nodes, completed=completed, max_workers=max_workers, on_node_start=_step)
+
     if final_video.exists():
         clear_checkpoint(work)
+        if get_settings().manim_media_retention == "on_success":
+            import shutil
+            shutil.rmtree(manim_media, ignore_errors=True)
         return final_video
     raise RuntimeError("流水线未执行到视频合成步骤且无成品文件")
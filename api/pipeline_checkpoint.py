@@ -1,6 +1,7 @@
-"""流水线检查点：按步骤持久化中间结果，支持失败后从断点重试。"""
+"""流水线检查点：按步骤持久化中间结果，支持失败后从断点重试。各阶段可能并发完成，manifest 记录已完成步骤集合。"""
 import json
 import logging
+import threading
 from pathlib import Path
 from typing import Any
 
@@ -15,45 +16,59 @@ STEP_0_FILE = "step_0_steps.json"
 STEP_1_FILE = "step_1_script.json"
 STEP_2_FILE = "step_2_durations.json"
 
+# 并发阶段同时写 manifest 时串行化读-改-写
+_manifest_lock = threading.Lock()
+
 
 def _checkpoint_dir(work_dir: Path) -> Path:
     return work_dir / CHECKPOINT_DIR_NAME
 
 
-def get_last_completed_step(work_dir: Path) -> int:
-    """返回已完成的最后一步索引 (0..5)，无检查点或损坏时返回 -1。"""
+def get_completed_steps(work_dir: Path) -> set[int]:
+    """返回已完成的步骤下标集合 (0..5)，无检查点或损坏时返回空集合。兼容仅有 last_completed_step 的旧 manifest。"""
     cp_dir = _checkpoint_dir(work_dir)
     manifest_path = cp_dir / MANIFEST_FILE
     if not manifest_path.is_file():
-        return -1
+        return set()
     try:
         data = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if "completed_steps" in data:
+            return {int(x) for x in data["completed_steps"] if 0 <= int(x) <= 5}
         step = int(data.get("last_completed_step", -1))
-        return step if -1 <= step <= 5 else -1
-    except (json.JSONDecodeError, OSError, ValueError) as e:
+        return set(range(step + 1)) if -1 <= step <= 5 else set()
+    except (json.JSONDecodeError, OSError, ValueError, TypeError) as e:
         logger.warning("[checkpoint] 读取 manifest 失败: %s", e)
-        return -1
+        return set()
+
+
+def get_last_completed_step(work_dir: Path) -> int:
+    """返回从 0 起连续完成的最后一步索引 (0..5)，无检查点或损坏时返回 -1。"""
+    completed = get_completed_steps(work_dir)
+    last = -1
+    while last + 1 in completed:
+        last += 1
+    return last
 
 
 def load_checkpoint(
     work_dir: Path,
-) -> tuple[int, list[StepItem] | None, ScriptGenerationOutput | None, list[float] | None]:
+) -> tuple[set[int], list[StepItem] | None, ScriptGenerationOutput | None, list[float] | None]:
     """
     加载检查点数据。
-    :return: (last_completed_step, steps, script_out, durations)
-     若某步未持久化则对应为 None；last_completed_step 为 -1 表示无有效检查点。
+    :return: (completed_steps, steps, script_out, durations)
+     若某步未完成或未持久化则对应为 None；completed_steps 为空表示无有效检查点。
     """
     work_dir = Path(work_dir)
-    last = get_last_completed_step(work_dir)
-    if last < 0:
-        return -1, None, None, None
+    completed = get_completed_steps(work_dir)
+    if not completed:
+        return set(), None, None, None
 
     cp_dir = _checkpoint_dir(work_dir)
     steps: list[StepItem] | None = None
     script_out: ScriptGenerationOutput | None = None
     durations: list[float] | None = None
 
-    if last >= 0:
+    if 0 in completed:
         p0 = cp_dir / STEP_0_FILE
         if p0.is_file():
             try:
@@ -61,9 +76,9 @@ def load_checkpoint(
                 steps = [StepItem.model_validate(x) for x in raw]
             except (json.JSONDecodeError, OSError, ValueError) as e:
                 logger.warning("[checkpoint] 加载 step_0 失败: %s", e)
-                return -1, None, None, None
+                return set(), None, None, None
 
-    if last >= 1:
+    if 1 in completed:
         p1 = cp_dir / STEP_1_FILE
         if p1.is_file():
             try:
@@ -71,9 +86,9 @@ def load_checkpoint(
                 script_out = ScriptGenerationOutput.model_validate(raw)
             except (json.JSONDecodeError, OSError, ValueError) as e:
                 logger.warning("[checkpoint] 加载 step_1 失败: %s", e)
-                return -1, None, None, None
+                return set(), None, None, None
 
-    if last >= 2:
+    if 2 in completed:
         p2 = cp_dir / STEP_2_FILE
         if p2.is_file():
             try:
@@ -81,9 +96,9 @@ def load_checkpoint(
                 durations = [float(x) for x in raw]
             except (json.JSONDecodeError, OSError, ValueError, TypeError) as e:
                 logger.warning("[checkpoint] 加载 step_2 失败: %s", e)
-                return -1, None, None, None
+                return set(), None, None, None
 
-    return last, steps, script_out, durations
+    return completed, steps, script_out, durations
 
 
 def save_step_checkpoint(
@@ -92,7 +107,7 @@ def save_step_checkpoint(
     payload: Any,
 ) -> None:
     """
-    保存指定步骤的检查点并更新 manifest。
+    保存指定步骤的检查点并将该步加入 manifest 的已完成集合（线程安全，供并发阶段调用）。
     step_index: 0=steps, 1=script, 2=durations；3/4/5 仅更新 manifest（无额外 JSON）。
     """
     work_dir = Path(work_dir)
@@ -113,8 +128,14 @@ def save_step_checkpoint(
         durations: list[float] = payload
         (cp_dir / STEP_2_FILE).write_text(json.dumps(durations), encoding="utf-8")
 
-    manifest = {"last_completed_step": step_index}
-    (cp_dir / MANIFEST_FILE).write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    with _manifest_lock:
+        completed = get_completed_steps(work_dir) | {step_index}
+        last = -1
+        while last + 1 in completed:
+            last += 1
+        # last_completed_step 保留给旧版本读取
+        manifest = {"completed_steps": sorted(completed), "last_completed_step": last}
+        (cp_dir / MANIFEST_FILE).write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
     logger.info("[checkpoint] 已保存步骤 %d 检查点", step_index)
 
 
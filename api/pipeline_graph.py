@@ -0,0 +1,67 @@
+"""流水线依赖图执行器：按阶段间依赖关系调度，互不依赖的阶段在线程池中并发执行。"""
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GraphNode:
+    """依赖图中的一个阶段：index 与 PIPELINE_STEPS 下标一致，deps 为前置阶段下标。"""
+
+    index: int
+    name: str
+    run: Callable[[], None]
+    deps: tuple[int, ...] = field(default_factory=tuple)
+
+
+def run_graph(
+    nodes: list[GraphNode],
+    *,
+    completed: set[int] | None = None,
+    max_workers: int = 4,
+    on_node_start: Callable[[GraphNode], None] | None = None,
+) -> set[int]:
+    """
+    执行依赖图：所有前置阶段完成后即提交该阶段；completed 中的阶段视为已完成（断点恢复）直接跳过。
+    任一阶段失败后不再提交新阶段，等待已运行阶段结束后抛出第一个异常。
+    :return: 全部完成的阶段下标集合
+    """
+    by_index = {n.index: n for n in nodes}
+    for n in nodes:
+        missing = [d for d in n.deps if d not in by_index]
+        if missing:
+            raise ValueError(f"阶段 {n.name} 依赖不存在的阶段 {missing}")
+    done = {i for i in (completed or set()) if i in by_index}
+    pending = [n for n in nodes if n.index not in done]
+    running: dict[Future, GraphNode] = {}
+    first_error: BaseException | None = None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="pipeline") as pool:
+        while pending or running:
+            if first_error is None:
+                ready = [n for n in pending if all(d in done for d in n.deps)]
+                for n in ready:
+                    pending.remove(n)
+                    if on_node_start:
+                        on_node_start(n)
+                    running[pool.submit(n.run)] = n
+            if not running:
+                if first_error is None and pending:
+                    raise ValueError(f"依赖图存在环或无法满足的依赖: {[n.name for n in pending]}")
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                n = running.pop(fut)
+                err = fut.exception()
+                if err is not None:
+                    logger.error("[pipeline] 阶段 %s 失败: %s", n.name, err)
+                    if first_error is None:
+                        first_error = err
+                else:
+                    done.add(n.index)
+    if first_error is not None:
+        raise first_error
+    return done
@@ -0,0 +1,137 @@
+"""
+成品结果缓存：按题目指纹（归一化文本哈希 + 图片指纹）与版本标签（流水线版本、模型、音色、时长对齐方式）索引已发布的成品，
+相同题目再次提交时直接复用成品、立即完成任务。版本标签变化后旧条目失效；提交时可用 force 跳过缓存。
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import get_settings
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DB_PATH = DATA_DIR / "result_cache.db"
+
+_init_lock = threading.Lock()
+_initialized: set[Path] = set()
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "stale": 0}
+
+
+def _bump(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def is_enabled() -> bool:
+    return get_settings().result_cache_enabled
+
+
+def _get_conn() -> sqlite3.Connection:
+    path = DB_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=10)
+    conn.row_factory = sqlite3.Row
+    with _init_lock:
+        if path not in _initialized:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    artifact TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            _initialized.add(path)
+    return conn
+
+
+def version_tag() -> str:
+    """影响成品内容的配置组成的版本标签；任何一项变化都会使已有条目失效。"""
+    from api.pipeline import PIPELINE_VERSION
+    s = get_settings()
+    return f"{PIPELINE_VERSION}|{s.llm_model}|{s.tts_voice}|{s.timing_mode}"
+
+
+def image_fingerprint(image_bytes: bytes | None) -> str:
+    """
+    图片指纹：内容 sha256，只有同一份图片文件才命中。题图版式相近（同一模板、只改数字）的感知哈希会碰撞，
+    而纯图片提交时文本部分为空、无法区分，故不用感知哈希。无图片返回空串。
+    """
+    if not image_bytes:
+        return ""
+    return "s" + hashlib.sha256(image_bytes).hexdigest()
+
+
+def fingerprint(problem_text: str | None, image_bytes: bytes | None = None) -> tuple[str, str]:
+    """(归一化文本哈希, 图片指纹)。"""
+    from asset_generation.tts_cache import normalize_text
+    text_hash = hashlib.sha256(normalize_text(problem_text or "").encode("utf-8")).hexdigest()
+    return text_hash, image_fingerprint(image_bytes)
+
+
+def make_key(problem_text: str | None, image_bytes: bytes | None = None) -> str:
+    text_hash, image_hash = fingerprint(problem_text, image_bytes)
+    return hashlib.sha256(f"{text_hash}|{image_hash}|{version_tag()}".encode("utf-8")).hexdigest()
+
+
+def lookup(key: str) -> Path | None:
+    """命中且成品文件仍在时返回其路径；成品已被回收的条目顺带删除。"""
+    conn = _get_conn()
+    try:
+        row = conn.execute("SELECT artifact FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            _bump("misses")
+            return None
+        artifact = Path(row["artifact"])
+        if not artifact.is_file():
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+            _bump("stale")
+            _bump("misses")
+            return None
+        conn.execute("UPDATE results SET hits = hits + 1 WHERE key = ?", (key,))
+        conn.commit()
+    finally:
+        conn.close()
+    _bump("hits")
+    return artifact
+
+
+def store(key: str, task_id: str, artifact: str | Path) -> None:
+    """登记成品（artifact 为成品库中的文件，见 artifact_store.blob_path）。"""
+    conn = _get_conn()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, version, task_id, artifact, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, version_tag(), task_id, str(artifact), time.time()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    _bump("stores")
+
+
+def purge_stale() -> int:
+    """删除版本标签与当前不一致的条目，返回删除条数。"""
+    conn = _get_conn()
+    try:
+        cur = conn.execute("DELETE FROM results WHERE version != ?", (version_tag(),))
+        conn.commit()
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def get_stats() -> dict:
+    conn = _get_conn()
+    try:
+        entries = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    finally:
+        conn.close()
+    with _stats_lock:
+        return {**_stats, "entries": entries, "version": version_tag()}
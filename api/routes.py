@@ -1,8 +1,10 @@
-"""FastAPI 路由：POST /generate_video，GET /tasks/{task_id}，结果视频静态或下载。"""
+"""FastAPI 路由：POST /generate_video，GET /tasks/{task_id}（及其 SSE 推送 /events），结果视频静态或下载。"""
+import asyncio
+import json
 import logging
-from pathlib import Path
 
-from fastapi import APIRouter, BackgroundTasks, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
 
 from api.models import (
     GenerateVideoResponse,
@@ -11,143 +13,109 @@ from api.models import (
     RegenerateResponse,
     TaskStatusResponse,
 )
-from api.pipeline import run_pipeline
+from api.task_runner import HLS_DIR, RESULTS_DIR, publish_result, run_generate_task, run_retry_task
 from api.task_store import (
+    coalesce_key,
     create_task,
     delete_task,
+    finish_inflight,
+    get_coalesce_stats,
     get_task,
+    join_inflight,
     set_failed,
-    set_progress,
-    set_running,
-    set_success,
-    update_task_problem,
+    set_pending,
+    work_task_id,
 )
+from api import artifact_store, job_queue, result_cache, scheduler, task_events
 from api.history_store import delete_record as history_delete, get_record as history_get, list_history
-from problem_analysis.formula_verifier import verify_and_fix_formulas
-from problem_analysis.image_to_text import extract_problem_text_from_image, image_to_base64
+import llm_cache
+from asset_generation import fix_kb, render_cache, tts_cache
+from asset_generation.manim_render import get_render_stats
+from asset_generation.manim_worker import get_worker_pool
+from composition import hls
+from config import get_settings
+from llm_runner import get_llm_pool_stats
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # 允许的题目图片类型
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+# SSE 无状态变化时发送注释行的间隔（秒），防止代理因空闲断开连接
+SSE_KEEPALIVE_SECONDS = 15.0
 
-# 生成结果存放目录（与 main 中挂载的 results 目录一致）
-RESULTS_DIR = Path(__file__).resolve().parent.parent / "output" / "results"
-RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
+def _hls_url(task_id: str) -> str | None:
+    return f"/hls/{task_id}/{hls.MASTER_PLAYLIST}" if (HLS_DIR / task_id / hls.MASTER_PLAYLIST).is_file() else None
 
-def _run_pipeline_task_retry(task_id: str) -> None:
-    """断点重试：仅用历史中的题目文本重新跑流水线，从检查点继续（不传图、不重新 OCR）。"""
-    rec = history_get(task_id)
-    if not rec:
-        set_failed(task_id, "任务记录不存在")
-        return
-    problem_text = (rec.problem_text or "").strip()
-    if not problem_text:
-        set_failed(task_id, "无题目文本，无法断点重试")
-        return
-    output_dir = Path(__file__).resolve().parent.parent / "output" / task_id
-    logger.info("[retry] 断点重试 task_id=%s", task_id)
+
+def _serve_from_cache(task_id: str, problem_text: str | None, image_bytes: bytes | None = None) -> bool:
+    """成品结果缓存命中时直接以缓存成品完成任务，返回 True；未启用或未命中返回 False。"""
+    if not result_cache.is_enabled():
+        return False
     try:
-        set_running(task_id)
-
-        def on_step_start(step_index: int, step_name: str) -> None:
-            set_progress(task_id, step_name)
-
-        video_path = run_pipeline(
-            problem_text,
-            output_dir,
-            image_base64=None,
-            image_mime_type="image/jpeg",
-            on_step_start=on_step_start,
-            force_restart=False,
-        )
-        result_path = RESULTS_DIR / f"{task_id}.mp4"
-        import shutil
-        shutil.copy(str(video_path), str(result_path))
-        set_success(task_id, f"/results/{task_id}.mp4")
-        logger.info("[retry] task_id=%s 重试成功 path=%s", task_id, result_path)
+        artifact = result_cache.lookup(result_cache.make_key(problem_text, image_bytes))
+        if artifact is None:
+            return False
+        publish_result(task_id, artifact)
     except Exception as e:
-        logger.exception("[retry] task_id=%s 重试失败: %s", task_id, e)
-        set_failed(task_id, str(e))
+        logger.warning("[result_cache] task_id=%s 复用缓存成品失败，改为正常生成: %s", task_id, e)
+        return False
+    logger.info("[result_cache] task_id=%s 命中成品缓存，直接完成", task_id)
+    return True
 
 
-def _run_pipeline_task(
+def _submit(
+    kind: str,
     task_id: str,
-    problem_text: str | None,
+    problem_text: str | None = None,
     image_bytes: bytes | None = None,
     image_mime_type: str = "image/jpeg",
-) -> None:
-    """后台执行：若有图片则先识别题目 → 公式验证 → 带原图跑流水线。"""
-    output_dir = Path(__file__).resolve().parent.parent / "output" / task_id
-    logger.info("[generate_video] 后台任务开始 task_id=%s 有图片=%s", task_id, bool(image_bytes))
-
-    # 原图 base64（贯穿流水线，让后续 LLM 调用都能看到原图）
-    img_b64: str | None = None
-
+    *,
+    new_task: bool = True,
+    coalesce: bool = True,
+) -> int:
+    """
+    提交任务（kind 为 generate 或 retry），返回排队位置。execution_mode=local 时交给进程内调度器，
+    queue 时写入持久化队列由 worker 领取。队列已满时返回 429（附当前排队数与 Retry-After）；
+    new_task 为 True 时一并删除刚创建的任务记录，避免留下永远 pending 的历史。
+    启用 coalesce_enabled 且 coalesce 为 True（force 提交时为 False）时，与进行中任务题目相同的新任务挂为其跟随者，
+    不再单独执行；断点重试按检查点目录合并，共用同一检查点目录的任务不会同时写入（仅 local 模式）。
+    """
+    settings = get_settings()
+    if kind == "retry":
+        set_pending(task_id)
+    if coalesce and settings.coalesce_enabled and settings.execution_mode != "queue":
+        if kind == "retry":
+            key = f"retry\0{work_task_id(task_id)}"
+        else:
+            key = coalesce_key(problem_text, image_bytes)
+        leader = join_inflight(key, task_id)
+        if leader is not None:
+            logger.info("[%s] task_id=%s 与进行中的 %s 合并执行", kind, task_id, leader)
+            return 0
     try:
-        set_running(task_id)
-
-        # ---------- 有图片：OCR → 公式验证 → 保留 base64 ----------
-        if image_bytes:
-            img_b64 = image_to_base64(image_bytes)
-
-            set_progress(task_id, "识别题目图片")
-            logger.info("[generate_video] task_id=%s 正在识别题目图片…", task_id)
-            try:
-                problem_text = extract_problem_text_from_image(image_bytes, mime_type=image_mime_type)
-                logger.info("[generate_video] task_id=%s 图片识别完成 题目长度=%d", task_id, len(problem_text or ""))
-            except Exception as e:
-                logger.exception("[generate_video] task_id=%s 图片识别失败: %s", task_id, e)
-                set_failed(task_id, f"图片识别失败: {e}")
-                return
-
-            if not (problem_text or "").strip():
-                logger.warning("[generate_video] task_id=%s 图片未识别出文字", task_id)
-                set_failed(task_id, "未能从图片中识别出题目文字")
-                return
-
-            # ---------- 公式交叉验证（P2）：用原图校正 OCR 文本 ----------
-            set_progress(task_id, "公式交叉验证")
-            logger.info("[generate_video] task_id=%s 开始公式交叉验证", task_id)
-            try:
-                problem_text = verify_and_fix_formulas(
-                    problem_text,
-                    image_base64=img_b64,
-                    image_mime_type=image_mime_type,
-                )
-                logger.info("[generate_video] task_id=%s 公式验证完成 验证后长度=%d", task_id, len(problem_text or ""))
-            except Exception as e:
-                logger.warning("[generate_video] task_id=%s 公式验证失败（不阻塞）: %s", task_id, e)
-                # 验证失败不阻塞流水线，继续使用 OCR 原始文本
-
-        if not (problem_text or "").strip():
-            set_failed(task_id, "题目为空")
-            return
-        # 持久化题目文本，便于历史列表展示与重新生成
-        update_task_problem(task_id, problem_text.strip())
-        logger.info("[generate_video] task_id=%s 开始执行流水线 题目前50字=%s", task_id, (problem_text or "")[:50])
-
-        def on_step_start(step_index: int, step_name: str) -> None:
-            set_progress(task_id, step_name)
-
-        # ---------- 执行流水线（传入原图 base64） ----------
-        video_path = run_pipeline(
-            problem_text.strip(),
-            output_dir,
-            image_base64=img_b64,
-            image_mime_type=image_mime_type,
-            on_step_start=on_step_start,
-        )
-        result_path = RESULTS_DIR / f"{task_id}.mp4"
-        import shutil
-        shutil.copy(str(video_path), str(result_path))
-        set_success(task_id, f"/results/{task_id}.mp4")
-        logger.info("[generate_video] task_id=%s 生成成功 path=%s", task_id, result_path)
-    except Exception as e:
-        logger.exception("[generate_video] task_id=%s 生成失败: %s", task_id, e)
-        set_failed(task_id, str(e))
+        if settings.execution_mode == "queue":
+            waiting = job_queue.pending_count()
+            if waiting >= settings.scheduler_queue_size:
+                raise scheduler.QueueFullError(waiting)
+            payload = {"problem_text": problem_text, "image_mime_type": image_mime_type}
+            return job_queue.enqueue(task_id, kind, payload, image_bytes)
+        if kind == "retry":
+            return scheduler.get_scheduler().submit(run_retry_task, task_id)
+        return scheduler.get_scheduler().submit(run_generate_task, task_id, problem_text, image_bytes, image_mime_type)
+    except scheduler.QueueFullError as e:
+        if new_task:
+            finish_inflight(task_id)
+            delete_task(task_id)
+            history_delete(task_id)
+        elif kind == "retry":
+            set_failed(task_id, "任务队列已满，请稍后重试")
+        raise HTTPException(
+            status_code=429,
+            detail={"message": "任务队列已满，请稍后再试", "queue_position": e.queue_position},
+            headers={"Retry-After": "30"},
+        ) from e
 
 
 def _normalize_problem(problem: str | None) -> str | None:
@@ -156,9 +124,9 @@ def _normalize_problem(problem: str | None) -> str | None:
 
 @router.post("/generate_video", response_model=GenerateVideoResponse)
 async def generate_video(
-    background_tasks: BackgroundTasks,
     problem: str | None = Form(None, description="题目文本，与图片二选一或同时提供（有图片时以识别结果为准）"),
     image: UploadFile | None = File(None, description="题目图片，将使用视觉模型识别题目文字"),
+    force: bool = Form(False, description="为 true 时跳过成品结果缓存，强制重新生成"),
 ):
     """支持 multipart：仅文本、仅图片、或文本+图片。图片识别在后台执行，请求立即返回 task_id，避免 nginx 等代理超时。"""
     problem_text: str | None = _normalize_problem(problem)
@@ -183,8 +151,10 @@ async def generate_video(
     problem_preview = (problem_text or "").strip()[:120] if problem_text else "图片上传"
     task_id = create_task(problem_preview=problem_preview, problem_text=problem_text)
     logger.info("[generate_video] 收到请求 task_id=%s 有文字=%s 有图片=%s", task_id, bool(problem_text), bool(image_bytes))
-    background_tasks.add_task(_run_pipeline_task, task_id, problem_text, image_bytes, image_mime_type)
-    return GenerateVideoResponse(task_id=task_id, status="pending")
+    if not force and _serve_from_cache(task_id, problem_text, image_bytes):
+        return GenerateVideoResponse(task_id=task_id, status="success", queue_position=0)
+    position = _submit("generate", task_id, problem_text, image_bytes, image_mime_type, coalesce=not force)
+    return GenerateVideoResponse(task_id=task_id, status="pending", queue_position=position)
 
 
 @router.get("/tasks/{task_id}", response_model=TaskStatusResponse)
@@ -198,11 +168,52 @@ async def get_task_status(task_id: str):
         video_url=task.video_path if task.status == "success" else None,
         error=task.error,
         current_step=task.current_step,
+        hls_url=_hls_url(task_id) if task.status == "success" else None,
+    )
+
+
+@router.get("/tasks/{task_id}/events")
+async def stream_task_events(task_id: str):
+    """
+    以 SSE 推送任务状态：连接后先发送当前状态，之后每次 status 或 current_step 变化推送一条（data 与 GET /tasks/{task_id} 相同），
+    任务成功或失败后结束。同一任务的所有连接共享一路扇出（见 api.task_events），不逐个轮询。
+    """
+    hub = task_events.get_hub()
+    if task_events.snapshot(task_id) is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    def _event(state: dict) -> str:
+        payload = {**state, "hls_url": _hls_url(task_id) if state["status"] == "success" else None}
+        return "data: " + json.dumps(payload, ensure_ascii=False) + "\n\n"
+
+    async def stream():
+        queue = hub.subscribe(task_id)
+        try:
+            # 订阅后再取一次快照，避免漏掉两次读取之间的变化
+            state = task_events.snapshot(task_id)
+            if state is None:
+                return
+            yield _event(state)
+            while state["status"] not in task_events.TERMINAL_STATUSES:
+                try:
+                    state = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _event(state)
+        finally:
+            hub.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering 让 nginx 不缓冲事件流
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 @router.post("/tasks/{task_id}/retry", response_model=GenerateVideoResponse)
-async def retry_task(background_tasks: BackgroundTasks, task_id: str):
+async def retry_task(task_id: str):
     """失败任务的断点重试：从上次中断的步骤继续，不重新执行已完成步骤。"""
     task = get_task(task_id)
     if not task:
@@ -215,8 +226,8 @@ async def retry_task(background_tasks: BackgroundTasks, task_id: str):
     rec = history_get(task_id)
     if not rec or not (rec.problem_text or "").strip():
         raise HTTPException(status_code=400, detail="该记录无题目文本，无法断点重试")
-    background_tasks.add_task(_run_pipeline_task_retry, task_id)
-    return GenerateVideoResponse(task_id=task_id, status="pending")
+    position = _submit("retry", task_id, new_task=False)
+    return GenerateVideoResponse(task_id=task_id, status="pending", queue_position=position)
 
 
 @router.get("/history", response_model=list[HistoryItem])
@@ -248,12 +259,19 @@ async def delete_history(task_id: str):
             result_file.unlink()
         except OSError:
             pass
+    # HLS 目录按成品内容共享，只删除本任务的链接；共享目录随成品回收（见 artifact_store.sweep）
+    hls_entry = HLS_DIR / task_id
+    if hls_entry.is_symlink():
+        hls_entry.unlink(missing_ok=True)
+    else:
+        import shutil
+        shutil.rmtree(hls_entry, ignore_errors=True)
     return {"ok": True}
 
 
 @router.post("/regenerate", response_model=RegenerateResponse)
-async def regenerate(background_tasks: BackgroundTasks, body: RegenerateRequest):
-    """根据历史任务 ID 使用其题目文本重新生成视频（仅文本，无原图）。"""
+async def regenerate(body: RegenerateRequest):
+    """根据历史任务 ID 使用其题目文本重新生成视频（仅文本，无原图）。默认 force=true，不复用成品缓存。"""
     rec = history_get(body.task_id)
     if not rec:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -265,5 +283,29 @@ async def regenerate(background_tasks: BackgroundTasks, body: RegenerateRequest)
         )
     problem_preview = (problem_text or "")[:120]
     new_task_id = create_task(problem_preview=problem_preview, problem_text=problem_text)
-    background_tasks.add_task(_run_pipeline_task, new_task_id, problem_text, None, "image/jpeg")
-    return RegenerateResponse(task_id=new_task_id, status="pending")
+    if not body.force and _serve_from_cache(new_task_id, problem_text):
+        return RegenerateResponse(task_id=new_task_id, status="success", queue_position=0)
+    position = _submit("generate", new_task_id, problem_text, coalesce=not body.force)
+    return RegenerateResponse(task_id=new_task_id, status="pending", queue_position=position)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """运行指标：LLM 客户端池、LLM 响应缓存、TTS 音频缓存与 Manim 渲染缓存的命中统计，Manim 常驻进程池状态与预演/编码耗时，修复知识库各签名命中数，HLS 各档位编码耗时，成品去重与目录回收字节数，任务队列与各阶段池利用率，同题请求合并比例，成品结果缓存命中数，状态推送的订阅数。"""
+    worker_pool = get_worker_pool()
+    return {
+        "llm_pool": get_llm_pool_stats(),
+        "llm_cache": llm_cache.get_stats(),
+        "tts_cache": tts_cache.get_stats(),
+        "render_cache": render_cache.get_stats(),
+        "manim_workers": worker_pool.get_stats() if worker_pool else None,
+        "manim_render": get_render_stats(),
+        "fix_kb": fix_kb.get_stats(),
+        "hls": hls.get_stats(),
+        "artifacts": artifact_store.get_stats(),
+        "scheduler": scheduler.get_stats(),
+        "coalesce": get_coalesce_stats(),
+        "result_cache": result_cache.get_stats(),
+        "task_events": task_events.get_stats(),
+        "job_queue": job_queue.get_stats() if get_settings().execution_mode == "queue" else None,
+    }
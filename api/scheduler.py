@@ -0,0 +1,197 @@
+"""
+任务调度：有界队列 + 固定数量的任务线程执行流水线，队列满时拒绝（由路由返回 429 与排队位置）；
+流水线各阶段再按类型占用全局阶段池的槽位——IO 型（LLM、TTS）与 CPU 型（Manim、FFmpeg）分开限流，
+多个任务可交错推进：一个任务在渲染时，其他任务的 LLM 调用照常进行，同时渲染进程数不超过 CPU 池容量。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+IO = "io"
+CPU = "cpu"
+
+
+class QueueFullError(RuntimeError):
+    """调度队列已满；queue_position 为当前排队任务数。"""
+
+    def __init__(self, queue_position: int):
+        super().__init__(f"任务队列已满（排队 {queue_position} 个）")
+        self.queue_position = queue_position
+
+
+class StagePool:
+    """一类阶段的并发槽位：acquire 超出容量时阻塞等待，记录占用时长用于利用率统计。"""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self._sem = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._waiting = 0
+        self._busy_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._acquired = 0
+        self._started = time.monotonic()
+
+    @contextmanager
+    def slot(self):
+        t0 = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        self._sem.acquire()
+        t1 = time.monotonic()
+        with self._lock:
+            self._waiting -= 1
+            self._busy += 1
+            self._acquired += 1
+            self._wait_seconds += t1 - t0
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - t1
+            self._sem.release()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            elapsed = max(1e-9, time.monotonic() - self._started)
+            return {
+                "capacity": self.capacity,
+                "busy": self._busy,
+                "waiting": self._waiting,
+                "acquired": self._acquired,
+                "busy_seconds": round(self._busy_seconds, 3),
+                "wait_seconds": round(self._wait_seconds, 3),
+                # 启动以来的平均利用率（占用时长 / (容量 × 运行时长)），不含正在占用的部分
+                "utilization": round(self._busy_seconds / (self.capacity * elapsed), 4),
+            }
+
+
+class JobScheduler:
+    """有界任务队列：max_jobs 个线程依次取出任务执行；队列中最多 queue_size 个等待任务。"""
+
+    def __init__(self, max_jobs: int, queue_size: int):
+        self.max_jobs = max(1, max_jobs)
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._active = 0
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def _ensure_threads(self) -> None:
+        with self._lock:
+            while len(self._threads) < self.max_jobs:
+                t = threading.Thread(target=self._worker, name=f"job-{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, fn: Callable, *args) -> int:
+        """提交任务，返回排队位置（0 表示有空闲线程，将立即开始）；队列已满时抛出 QueueFullError。"""
+        self._ensure_threads()
+        with self._lock:
+            try:
+                self._queue.put_nowait((fn, args))
+            except queue.Full:
+                self._stats["rejected"] += 1
+                raise QueueFullError(self._queue.qsize()) from None
+            self._stats["submitted"] += 1
+            idle = self.max_jobs - self._active
+            return max(0, self._queue.qsize() - idle)
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            fn, args = item
+            with self._lock:
+                self._active += 1
+            try:
+                fn(*args)
+                outcome = "completed"
+            except Exception as e:
+                logger.exception("[scheduler] 任务执行异常: %s", e)
+                outcome = "failed"
+            finally:
+                with self._lock:
+                    self._active -= 1
+            with self._lock:
+                self._stats[outcome] += 1
+
+    def shutdown(self) -> None:
+        """通知任务线程在处理完手头任务后退出（不等待）。"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_jobs": self.max_jobs,
+                "active": self._active,
+                "queued": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                **self._stats,
+            }
+
+
+_init_lock = threading.Lock()
+_pools: dict[str, StagePool] = {}
+_scheduler: JobScheduler | None = None
+
+
+def get_stage_pool(kind: str) -> StagePool:
+    """返回全局阶段池（io / cpu），首次调用时按配置创建。"""
+    with _init_lock:
+        if not _pools:
+            settings = get_settings()
+            cpu = settings.stage_pool_cpu or max(1, (os.cpu_count() or 2) // 2)
+            _pools[IO] = StagePool(IO, settings.stage_pool_io)
+            _pools[CPU] = StagePool(CPU, cpu)
+        return _pools[kind]
+
+
+@contextmanager
+def stage_slot(kind: str):
+    """在对应阶段池中占用一个槽位执行阶段。"""
+    with get_stage_pool(kind).slot():
+        yield
+
+
+def get_scheduler() -> JobScheduler:
+    global _scheduler
+    with _init_lock:
+        if _scheduler is None:
+            settings = get_settings()
+            _scheduler = JobScheduler(settings.scheduler_max_jobs, settings.scheduler_queue_size)
+        return _scheduler
+
+
+def shutdown_scheduler() -> None:
+    global _scheduler
+    with _init_lock:
+        sched, _scheduler = _scheduler, None
+    if sched is not None:
+        sched.shutdown()
+
+
+def get_stats() -> dict:
+    """调度器队列/执行状态与各阶段池的占用、等待与利用率。"""
+    sched = _scheduler
+    with _init_lock:
+        pools = {name: pool.get_stats() for name, pool in _pools.items()}
+    return {"jobs": sched.get_stats() if sched else None, "stage_pools": pools}
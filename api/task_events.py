@@ -0,0 +1,129 @@
+"""
+任务状态推送：按 task_id 共享一路扇出，供 SSE 接口（GET /api/tasks/{task_id}/events）把状态与当前步骤的变化推给各个打开的页面。
+local 模式下监听 task_store 的状态回调，每次变化只生成一份快照再分发给该任务的全部订阅者；
+queue 模式下任务在 worker 进程中执行，本进程收不到回调，改由一个后台线程按 task_events_poll_seconds 轮询有订阅者的任务，
+每个任务每轮只读一次库，与打开的页面数无关。
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from api import task_store
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("success", "failed")
+
+
+def snapshot(task_id: str) -> dict | None:
+    """任务当前状态快照；任务不存在时返回 None。"""
+    task = task_store.get_task(task_id)
+    if task is None:
+        return None
+    return {
+        "task_id": task.task_id,
+        "status": task.status,
+        "video_url": task.video_path if task.status == "success" else None,
+        "error": task.error,
+        "current_step": task.current_step,
+    }
+
+
+class TaskEventHub:
+    """每个 task_id 一组订阅者（asyncio 队列）与最近一次推送的快照；快照未变化时不重复推送。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: dict[str, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._last: dict[str, dict] = {}
+        self._listening = False
+        self._poller: threading.Thread | None = None
+        self._stats = {"published": 0, "delivered": 0, "polls": 0}
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """在事件循环中调用，返回接收快照的队列。"""
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(entry)
+            if not self._listening:
+                task_store.add_listener(self._on_task_event)
+                self._listening = True
+            if get_settings().execution_mode == "queue" and self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name="task-events-poll", daemon=True)
+                self._poller.start()
+        return entry[1]
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subs = self._subscribers.get(task_id)
+            if subs is None:
+                return
+            subs.difference_update({e for e in subs if e[1] is queue})
+            if not subs:
+                del self._subscribers[task_id]
+                self._last.pop(task_id, None)
+
+    def publish(self, task_id: str, state: dict) -> None:
+        """把快照分发给该任务的全部订阅者（可在任意线程调用）。"""
+        with self._lock:
+            subs = list(self._subscribers.get(task_id, ()))
+            if not subs or self._last.get(task_id) == state:
+                return
+            self._last[task_id] = state
+            self._stats["published"] += 1
+            self._stats["delivered"] += len(subs)
+        for loop, queue in subs:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, state)
+            except RuntimeError:
+                # 事件循环已关闭（连接随进程退出），忽略
+                pass
+
+    def _on_task_event(self, task_id: str, event: dict) -> None:
+        with self._lock:
+            if task_id not in self._subscribers:
+                return
+        state = snapshot(task_id)
+        if state is not None:
+            self.publish(task_id, state)
+
+    def _poll_loop(self) -> None:
+        interval = get_settings().task_events_poll_seconds
+        while True:
+            with self._lock:
+                task_ids = list(self._subscribers)
+                if not task_ids:
+                    self._poller = None
+                    return
+            for task_id in task_ids:
+                try:
+                    state = snapshot(task_id)
+                except Exception as e:
+                    logger.warning("[task_events] 轮询 task_id=%s 失败: %s", task_id, e)
+                    continue
+                if state is not None:
+                    self.publish(task_id, state)
+            with self._lock:
+                self._stats["polls"] += 1
+            time.sleep(interval)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "tasks": len(self._subscribers),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                **self._stats,
+            }
+
+
+_hub = TaskEventHub()
+
+
+def get_hub() -> TaskEventHub:
+    return _hub
+
+
+def get_stats() -> dict:
+    return _hub.get_stats()
@@ -0,0 +1,226 @@
+"""任务执行：OCR 与公式验证 → 流水线 → 发布成品并更新任务状态。由 API 进程内的调度器或独立 worker 进程调用。"""
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from api import artifact_store, result_cache, scheduler
+from api.history_store import get_record as history_get
+from api.pipeline import PipelineCancelled, run_pipeline
+from api.pipeline_checkpoint import get_completed_steps
+from api.task_store import (
+    finish_inflight,
+    set_failed,
+    set_progress,
+    set_running,
+    set_success,
+    update_task_problem,
+)
+from composition import hls
+from config import get_settings
+from problem_analysis.formula_verifier import verify_and_fix_formulas
+from problem_analysis.image_to_text import extract_problem_text_from_image, image_to_base64
+
+logger = logging.getLogger(__name__)
+
+# 生成结果存放目录（与 main 中挂载的 results 目录一致）
+RESULTS_DIR = Path(__file__).resolve().parent.parent / "output" / "results"
+RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+# HLS 输出目录（main 中挂载为 /hls）：按成品内容哈希打包，每个任务的 <task_id> 是指向其成品目录的符号链接，入口为 master.m3u8
+HLS_DIR = RESULTS_DIR.parent / "hls"
+HLS_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def _publish_hls(digest: str, video_path: Path, task_ids: list[str]) -> None:
+    """
+    HLS 按成品内容打包到 HLS_DIR/<内容哈希>/：同一成品（缓存命中、合并执行的同题任务）只编码一次，
+    已打包或正在打包时直接复用；各任务的 HLS_DIR/<task_id> 指向该目录（相对符号链接）。
+    """
+    shared = HLS_DIR / digest
+    try:
+        shared.mkdir()
+    except FileExistsError:
+        logger.info("[hls] 成品 %s 已打包或正在打包，复用", digest[:12])
+    else:
+        try:
+            hls.package_hls_in_background(video_path, shared)
+        except ValueError as e:
+            shared.rmdir()
+            logger.warning("[hls] 码率阶梯配置无效，跳过 HLS: %s", e)
+            return
+    for tid in task_ids:
+        link = HLS_DIR / tid
+        tmp = HLS_DIR / f".{tid}.link"
+        try:
+            tmp.unlink(missing_ok=True)
+            os.symlink(digest, tmp, target_is_directory=True)
+            if link.is_dir() and not link.is_symlink():
+                shutil.rmtree(link)
+            os.replace(tmp, link)
+        except OSError as e:
+            logger.warning("[hls] task_id=%s 链接 HLS 目录失败（不影响 MP4）: %s", tid, e)
+
+
+def publish_result(task_id: str, video_path: Path, cache_key: str | None = None) -> Path:
+    """
+    以硬链接把成品发布到结果目录（内容寻址去重，见 artifact_store）；启用 HLS 时在后台打包（各档首个分片就绪后写出主播放列表，分片随编码逐步写出），再标记成功。
+    合并执行的跟随者与缓存命中的任务共享同一份成品与 HLS。给出 cache_key 时把成品登记到结果缓存，之后相同题目的提交直接复用。
+    """
+    result_path = RESULTS_DIR / f"{task_id}.mp4"
+    digest = artifact_store.publish(video_path, result_path)
+    if cache_key:
+        try:
+            result_cache.store(cache_key, task_id, artifact_store.blob_path(digest, result_path.suffix))
+        except Exception as e:
+            logger.warning("[result_cache] task_id=%s 登记成品失败（不影响结果）: %s", task_id, e)
+    followers = finish_inflight(task_id)
+    if get_settings().hls_enabled:
+        _publish_hls(digest, result_path, [task_id, *followers])
+    # 合并执行的同题任务共享成品：各自的结果文件都是指向同一内容的硬链接
+    for follower in followers:
+        artifact_store.publish(result_path, RESULTS_DIR / f"{follower}.mp4")
+        set_success(follower, f"/results/{follower}.mp4")
+    set_success(task_id, f"/results/{task_id}.mp4")
+    return result_path
+
+
+def _fail(task_id: str, error: str) -> str:
+    set_failed(task_id, error)
+    return error
+
+
+def _cancelled(task_id: str, e: PipelineCancelled) -> str:
+    """被取消的任务已由其他执行者接手：不改任务状态、不发布成品，只返回原因。"""
+    logger.warning("[task_runner] task_id=%s 已取消，放弃执行: %s", task_id, e)
+    return str(e)
+
+
+def run_retry_task(task_id: str, cancel_event: threading.Event | None = None) -> str | None:
+    """
+    断点重试：仅用历史中的题目文本重新跑流水线，从检查点继续（不传图、不重新 OCR）。
+    返回失败原因，成功时为 None；cancel_event 置位后不再开始新阶段，也不发布成品。
+    """
+    rec = history_get(task_id)
+    if not rec:
+        return _fail(task_id, "任务记录不存在")
+    problem_text = (rec.problem_text or "").strip()
+    if not problem_text:
+        return _fail(task_id, "无题目文本，无法断点重试")
+    output_root = Path(__file__).resolve().parent.parent / "output"
+    output_dir = output_root / task_id
+    # 随领头任务失败的跟随者从领头任务的检查点继续；领头目录已无检查点（已成功或已回收）时用自己的目录
+    work_id = rec.work_task_id or task_id
+    if work_id != task_id and get_completed_steps(output_root / work_id / "work"):
+        output_dir = output_root / work_id
+    logger.info("[retry] 断点重试 task_id=%s 检查点目录=%s", task_id, output_dir.name)
+    try:
+        set_running(task_id)
+
+        def on_step_start(step_index: int, step_name: str) -> None:
+            set_progress(task_id, step_name)
+
+        video_path = run_pipeline(
+            problem_text,
+            output_dir,
+            image_base64=None,
+            image_mime_type="image/jpeg",
+            on_step_start=on_step_start,
+            force_restart=False,
+            cancel_event=cancel_event,
+        )
+        if cancel_event is not None and cancel_event.is_set():
+            raise PipelineCancelled("流水线已取消，不发布成品")
+        result_path = publish_result(task_id, video_path)
+        logger.info("[retry] task_id=%s 重试成功 path=%s", task_id, result_path)
+    except PipelineCancelled as e:
+        return _cancelled(task_id, e)
+    except Exception as e:
+        logger.exception("[retry] task_id=%s 重试失败: %s", task_id, e)
+        return _fail(task_id, str(e))
+    return None
+
+
+def run_generate_task(
+    task_id: str,
+    problem_text: str | None,
+    image_bytes: bytes | None = None,
+    image_mime_type: str = "image/jpeg",
+    cancel_event: threading.Event | None = None,
+) -> str | None:
+    """
+    后台执行：若有图片则先识别题目 → 公式验证 → 带原图跑流水线。
+    返回失败原因，成功时为 None；cancel_event 置位后不再开始新阶段，也不发布成品。
+    """
+    output_dir = Path(__file__).resolve().parent.parent / "output" / task_id
+    logger.info("[generate_video] 后台任务开始 task_id=%s 有图片=%s", task_id, bool(image_bytes))
+    # 缓存键按提交时的原始输入计算（OCR 之前），与提交时的查找一致
+    cache_key = result_cache.make_key(problem_text, image_bytes) if result_cache.is_enabled() else None
+
+    # 原图 base64（贯穿流水线，让后续 LLM 调用都能看到原图）
+    img_b64: str | None = None
+
+    try:
+        set_running(task_id)
+
+        # ---------- 有图片：OCR → 公式验证 → 保留 base64 ----------
+        if image_bytes:
+            img_b64 = image_to_base64(image_bytes)
+
+            set_progress(task_id, "识别题目图片")
+            logger.info("[generate_video] task_id=%s 正在识别题目图片…", task_id)
+            try:
+                with scheduler.stage_slot(scheduler.IO):
+                    problem_text = extract_problem_text_from_image(image_bytes, mime_type=image_mime_type)
+                logger.info("[generate_video] task_id=%s 图片识别完成 题目长度=%d", task_id, len(problem_text or ""))
+            except Exception as e:
+                logger.exception("[generate_video] task_id=%s 图片识别失败: %s", task_id, e)
+                return _fail(task_id, f"图片识别失败: {e}")
+
+            if not (problem_text or "").strip():
+                logger.warning("[generate_video] task_id=%s 图片未识别出文字", task_id)
+                return _fail(task_id, "未能从图片中识别出题目文字")
+
+            # ---------- 公式交叉验证（P2）：用原图校正 OCR 文本 ----------
+            set_progress(task_id, "公式交叉验证")
+            logger.info("[generate_video] task_id=%s 开始公式交叉验证", task_id)
+            try:
+                with scheduler.stage_slot(scheduler.IO):
+                    problem_text = verify_and_fix_formulas(
+                        problem_text,
+                        image_base64=img_b64,
+                        image_mime_type=image_mime_type,
+                    )
+                logger.info("[generate_video] task_id=%s 公式验证完成 验证后长度=%d", task_id, len(problem_text or ""))
+            except Exception as e:
+                logger.warning("[generate_video] task_id=%s 公式验证失败（不阻塞）: %s", task_id, e)
+                # 验证失败不阻塞流水线，继续使用 OCR 原始文本
+
+        if not (problem_text or "").strip():
+            return _fail(task_id, "题目为空")
+        # 持久化题目文本，便于历史列表展示与重新生成
+        update_task_problem(task_id, problem_text.strip())
+        logger.info("[generate_video] task_id=%s 开始执行流水线 题目前50字=%s", task_id, (problem_text or "")[:50])
+
+        def on_step_start(step_index: int, step_name: str) -> None:
+            set_progress(task_id, step_name)
+
+        # ---------- 执行流水线（传入原图 base64） ----------
+        video_path = run_pipeline(
+            problem_text.strip(),
+            output_dir,
+            image_base64=img_b64,
+            image_mime_type=image_mime_type,
+            on_step_start=on_step_start,
+            cancel_event=cancel_event,
+        )
+        if cancel_event is not None and cancel_event.is_set():
+            raise PipelineCancelled("流水线已取消，不发布成品")
+        result_path = publish_result(task_id, video_path, cache_key)
+        logger.info("[generate_video] task_id=%s 生成成功 path=%s", task_id, result_path)
+    except PipelineCancelled as e:
+        return _cancelled(task_id, e)
+    except Exception as e:
+        logger.exception("[generate_video] task_id=%s 生成失败: %s", task_id, e)
+        return _fail(task_id, str(e))
+    return None
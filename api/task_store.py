@@ -1,10 +1,17 @@
-"""内存任务状态存储：task_id -> status, video_path, error, current_step。与 history_store 联动持久化。"""
+"""
+内存任务状态存储：task_id -> status, video_path, error, current_step。与 history_store 联动持久化。
+相同题目（归一化文本 + 图片摘要）的并发请求合并执行：后来者作为跟随者挂到进行中的领头任务上，进度与结果随领头任务更新。
+"""
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Optional
+import hashlib
+import logging
+import threading
 import uuid
 
 from api.history_store import (
     create_record as history_create,
+    inherit_work as history_inherit_work,
     update_problem as history_update_problem,
     update_status as history_update_status,
     get_record as history_get_record,
@@ -20,6 +27,90 @@ class TaskState:
 
 
 _tasks: dict[str, TaskState] = {}
+# 状态变化监听：fn(task_id, {"status", "current_step", ...})，如 worker 进程把进度写回任务队列
+_listeners: list[Callable[[str, dict], None]] = []
+
+logger = logging.getLogger(__name__)
+
+
+def add_listener(fn: Callable[[str, dict], None]) -> None:
+    _listeners.append(fn)
+
+
+def remove_listener(fn: Callable[[str, dict], None]) -> None:
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def _notify(task_id: str, **event) -> None:
+    for fn in list(_listeners):
+        try:
+            fn(task_id, event)
+        except Exception as e:
+            logger.warning("[task_store] 状态监听回调失败: %s", e)
+
+
+# ---------- 同题请求合并（single-flight） ----------
+_coalesce_lock = threading.Lock()
+_inflight: dict[str, str] = {}  # 合并键 -> 领头 task_id
+_leader_key: dict[str, str] = {}  # 领头 task_id -> 合并键
+_followers: dict[str, list[str]] = {}  # 领头 task_id -> 跟随者 task_id
+_coalesce_stats = {"leaders": 0, "followers": 0}
+
+
+def coalesce_key(problem_text: Optional[str], image_bytes: Optional[bytes] = None) -> str:
+    """合并键：归一化题目文本（NFKC、合并空白）与图片内容摘要。"""
+    from asset_generation.tts_cache import normalize_text
+    image_digest = hashlib.sha256(image_bytes).hexdigest() if image_bytes else ""
+    raw = f"{normalize_text(problem_text or '')}\0{image_digest}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def join_inflight(key: str, task_id: str) -> Optional[str]:
+    """
+    有相同合并键的任务正在进行时，把 task_id 挂为其跟随者并返回领头 task_id（调用方不再提交执行）；
+    否则登记 task_id 为领头任务并返回 None。
+    """
+    with _coalesce_lock:
+        leader = _inflight.get(key)
+        if leader is not None and leader in _tasks and _tasks[leader].status in ("pending", "running"):
+            _followers.setdefault(leader, []).append(task_id)
+            _coalesce_stats["followers"] += 1
+            state = _tasks[leader]
+            if task_id in _tasks:
+                _tasks[task_id].status = state.status
+                _tasks[task_id].current_step = state.current_step
+            return leader
+        _inflight[key] = task_id
+        _leader_key[task_id] = key
+        _coalesce_stats["leaders"] += 1
+        return None
+
+
+def finish_inflight(leader: str) -> list[str]:
+    """领头任务结束：注销合并键（此后的同题请求不再挂靠），返回其跟随者列表。"""
+    with _coalesce_lock:
+        key = _leader_key.pop(leader, None)
+        if key is not None and _inflight.get(key) == leader:
+            del _inflight[key]
+        return _followers.pop(leader, [])
+
+
+def followers_of(task_id: str) -> list[str]:
+    with _coalesce_lock:
+        return list(_followers.get(task_id, []))
+
+
+def get_coalesce_stats() -> dict:
+    """领头/跟随任务数与合并比例（跟随者占全部合并登记的比例）。"""
+    with _coalesce_lock:
+        leaders, followers = _coalesce_stats["leaders"], _coalesce_stats["followers"]
+        return {
+            "leaders": leaders,
+            "followers": followers,
+            "inflight": len(_inflight),
+            "ratio": round(followers / (leaders + followers), 4) if leaders + followers else 0.0,
+        }
 
 
 def create_task(problem_preview: str = "", problem_text: Optional[str] = None) -> str:
@@ -30,15 +121,19 @@ def create_task(problem_preview: str = "", problem_text: Optional[str] = None) -
 
 
 def set_running(task_id: str) -> None:
-    if task_id in _tasks:
-        _tasks[task_id].status = "running"
-    history_update_status(task_id, "running")
+    for tid in (task_id, *followers_of(task_id)):
+        if tid in _tasks:
+            _tasks[tid].status = "running"
+        history_update_status(tid, "running")
+        _notify(tid, status="running")
 
 
 def set_progress(task_id: str, current_step: str) -> None:
-    """更新任务当前步骤，供前端进度显示。"""
-    if task_id in _tasks:
-        _tasks[task_id].current_step = current_step
+    """更新任务当前步骤，供前端进度显示（同步到跟随者）。"""
+    for tid in (task_id, *followers_of(task_id)):
+        if tid in _tasks:
+            _tasks[tid].current_step = current_step
+        _notify(tid, status="running", current_step=current_step)
 
 
 def set_success(task_id: str, video_path: str) -> None:
@@ -48,38 +143,84 @@ def set_success(task_id: str, video_path: str) -> None:
         _tasks[task_id].error = None
         _tasks[task_id].current_step = None
     history_update_status(task_id, "success", video_path=video_path)
+    _notify(task_id, status="success", video_path=video_path)
+
+
+def work_task_id(task_id: str) -> str:
+    """任务检查点所在输出目录对应的 task_id：随领头任务失败的跟随者为领头任务，其余为自身。"""
+    rec = history_get_record(task_id)
+    return (rec.work_task_id if rec else None) or task_id
+
+
+def set_pending(task_id: str) -> None:
+    """重新排队（如断点重试）：状态回到 pending。"""
+    if task_id in _tasks:
+        _tasks[task_id].status = "pending"
+        _tasks[task_id].error = None
+        _tasks[task_id].current_step = None
+    else:
+        _tasks[task_id] = TaskState(task_id=task_id, status="pending")
+    history_update_status(task_id, "pending")
+    _notify(task_id, status="pending")
 
 
 def set_failed(task_id: str, error: str) -> None:
+    """
+    标记失败；领头任务失败时其跟随者一并失败。跟随者自己的输出目录里没有检查点，
+    因此记下领头任务的检查点目录与题目文本，断点重试时从领头任务的进度继续（并与领头任务的重试合并执行）。
+    """
+    followers = finish_inflight(task_id)
+    if followers:
+        rec = history_get_record(task_id)
+        work = (rec.work_task_id if rec else None) or task_id
+        for follower in followers:
+            history_inherit_work(follower, work, rec.problem_text if rec else None)
+    for follower in followers:
+        set_failed(follower, error)
     if task_id in _tasks:
         _tasks[task_id].status = "failed"
         _tasks[task_id].error = error
         _tasks[task_id].video_path = None
         _tasks[task_id].current_step = None
     history_update_status(task_id, "failed", error=error)
+    _notify(task_id, status="failed", error=error)
 
 
 def update_task_problem(task_id: str, problem_text: str) -> None:
-    """OCR 或流程中得到题目文本后更新历史记录，便于重新生成。"""
-    history_update_problem(task_id, problem_text)
+    """OCR 或流程中得到题目文本后更新历史记录（同步到跟随者），便于重新生成。"""
+    for tid in (task_id, *followers_of(task_id)):
+        history_update_problem(tid, problem_text)
 
 
 def get_task(task_id: str) -> Optional[TaskState]:
-    """先查内存，未命中则从持久化历史恢复为 TaskState（无 current_step）。"""
-    if task_id in _tasks:
+    """
+    先查内存，未命中则从持久化历史恢复为 TaskState（无 current_step）。
+    execution_mode=queue 时任务在其他 worker 进程中执行，本进程内存中的状态不会更新：直接读历史，步骤取自任务队列。
+    """
+    from config import get_settings
+    queue_mode = get_settings().execution_mode == "queue"
+    if task_id in _tasks and not queue_mode:
         return _tasks[task_id]
     rec = history_get_record(task_id)
     if not rec:
         return None
+    current_step = None
+    if queue_mode and rec.status == "running":
+        from api import job_queue
+        current_step = job_queue.current_step(task_id)
     return TaskState(
         task_id=rec.task_id,
         status=rec.status,
         video_path=rec.video_path,
         error=rec.error,
-        current_step=None,
+        current_step=current_step,
     )
 
 
 def delete_task(task_id: str) -> None:
     """从内存中移除任务（与删除历史记录时配合使用）。"""
     _tasks.pop(task_id, None)
+    with _coalesce_lock:
+        for followers in _followers.values():
+            if task_id in followers:
+                followers.remove(task_id)
@@ -0,0 +1,161 @@
+"""音频时长探测：直接解析 MP3 帧头与 Xing/Info(LAME) 标签计算精确时长，无需整段解码；无法解析时回退 pydub / ffprobe。"""
+import logging
+import subprocess
+import warnings
+from pathlib import Path
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 比特率表（kbps），按 (MPEG1?, layer) 索引；下标为帧头中的 bitrate index
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# 采样率表，按版本位 (3=MPEG1, 2=MPEG2, 0=MPEG2.5) 索引
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _parse_frame_header(data: bytes, pos: int) -> tuple[int, int, int, bool, bool] | None:
+    """解析 pos 处的帧头，返回 (帧长, 每帧采样数, 采样率, 是否 MPEG1, 是否单声道)；非法帧头返回 None。"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = (b1 >> 3) & 0x3
+    layer_bits = (b1 >> 1) & 0x3
+    bitrate_idx = b2 >> 4
+    sr_idx = (b2 >> 2) & 0x3
+    if version == 1 or layer_bits == 0 or bitrate_idx in (0, 15) or sr_idx == 3:
+        return None
+    layer = 4 - layer_bits
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version][sr_idx]
+    padding = (b2 >> 1) & 0x1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or mpeg1:
+        samples, length = 1152, 144 * bitrate // sample_rate + padding
+    else:
+        samples, length = 576, 72 * bitrate // sample_rate + padding
+    mono = (b3 >> 6) == 3
+    return length, samples, sample_rate, mpeg1, mono
+
+
+def _skip_id3v2(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _read_xing(data: bytes, pos: int, mpeg1: bool, mono: bool) -> tuple[int, int, int] | None:
+    """读取首帧中的 Xing/Info 标签，返回 (帧数, LAME 编码延迟, LAME 尾部填充)；无标签或无帧数返回 None。"""
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    tag = pos + 4 + side_info
+    if data[tag:tag + 4] not in (b"Xing", b"Info"):
+        return None
+    flags = int.from_bytes(data[tag + 4:tag + 8], "big")
+    if not flags & 0x1:
+        return None
+    frames = int.from_bytes(data[tag + 8:tag + 12], "big")
+    offset = tag + 12
+    if flags & 0x2:
+        offset += 4
+    if flags & 0x4:
+        offset += 100
+    if flags & 0x8:
+        offset += 4
+    delay = padding = 0
+    # LAME 扩展：9 字节编码器版本后第 12 字节起 3 字节，高 12 位为 delay、低 12 位为 padding
+    if data[offset:offset + 4] in (b"LAME", b"Lavf", b"Lavc") and offset + 24 <= len(data):
+        raw = int.from_bytes(data[offset + 21:offset + 24], "big")
+        delay, padding = raw >> 12, raw & 0xFFF
+    return frames, delay, padding
+
+
+def probe_mp3_duration(path: str | Path) -> float | None:
+    """
+    解析 MP3 帧头计算时长（秒），与解码后的采样数一致并按毫秒取整（与 pydub len()/1000 相同）。
+    有 Xing/Info 帧数时直接使用并扣除 LAME delay/padding，否则逐帧累加采样数。非 MP3 或无法解析返回 None。
+    """
+    try:
+        data = Path(path).read_bytes()
+    except OSError:
+        return None
+    pos = _skip_id3v2(data)
+    # 容忍首帧前少量垃圾字节
+    limit = min(len(data), pos + 4096)
+    while pos < limit and _parse_frame_header(data, pos) is None:
+        pos += 1
+    first = _parse_frame_header(data, pos)
+    if first is None:
+        return None
+    length, samples_per_frame, sample_rate, mpeg1, mono = first
+    xing = _read_xing(data, pos, mpeg1, mono)
+    if xing is not None:
+        frames, delay, padding = xing
+        total = frames * samples_per_frame - delay - padding
+    else:
+        total = 0
+        while True:
+            header = _parse_frame_header(data, pos)
+            if header is None or header[0] <= 0 or pos + header[0] > len(data):
+                break
+            total += header[1]
+            pos += header[0]
+    if total <= 0:
+        return None
+    return round(1000 * total / sample_rate) / 1000.0
+
+
+def _decode_duration(path: Path) -> float:
+    """整段解码测量时长（秒）：优先 pydub，未安装时用 ffprobe，都不可用则返回默认时长。"""
+    try:
+        from pydub import AudioSegment
+        seg = AudioSegment.from_file(str(path))
+        return len(seg) / 1000.0
+    except ImportError:
+        default_sec = get_settings().default_wait_seconds
+        try:
+            result = subprocess.run(
+                ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(path)],
+                capture_output=True,
+                text=True,
+                timeout=30,
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                return float(result.stdout.strip())
+        except FileNotFoundError:
+            warnings.warn(
+                "未找到 ffprobe（请安装 FFmpeg 以获得准确语音时长）。当前使用默认时长。",
+                UserWarning,
+                stacklevel=3,
+            )
+        except subprocess.TimeoutExpired:
+            warnings.warn(
+                "ffprobe 获取时长超时，使用默认时长。建议安装 pydub: uv add pydub",
+                UserWarning,
+                stacklevel=3,
+            )
+        return default_sec
+
+
+def probe_duration(path: str | Path) -> float:
+    """测量单个音频文件时长（秒）：先解析帧头，失败再整段解码。"""
+    fast = probe_mp3_duration(path)
+    if fast is not None:
+        return fast
+    logger.info("[audio_probe] 帧头解析失败，回退解码测量 %s", path)
+    return _decode_duration(Path(path))
+
+
+def probe_durations(paths: list[str | Path]) -> list[float]:
+    """批量测量多个音频文件时长，顺序与 paths 一致。"""
+    return [probe_duration(p) for p in paths]
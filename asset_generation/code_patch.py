@@ -0,0 +1,133 @@
+"""
+自愈请求瘦身：从报错中截取与 scene.py 相关的 traceback 帧与异常行，取出错行附近的代码窗口；
+解析 LLM 返回的 unified diff 并在本地应用到原代码。
+"""
+import re
+
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+# 普通 traceback（File ".../scene.py", line 12）、Rich traceback（scene.py:12 in construct）与静态检查（(line 12)）
+_SCENE_LINE_RE = re.compile(r"scene\w*\.py(?:\", line |:)(\d+)|\(line (\d+)\)")
+_EXC_RE = re.compile(r"\b[A-Z]\w*(?:Error|Exception|Warning)\b.*:")
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+_DIFF_BLOCK_RE = re.compile(r"```(?:diff|patch)?\s*\n(.*?)```", re.S)
+
+# 截取后的错误信息最多保留的行数
+_MAX_ERROR_LINES = 30
+
+
+class PatchError(ValueError):
+    """diff 无法解析或与原代码对不上。"""
+
+
+def _clean(line: str) -> str:
+    """去掉 ANSI 颜色与 Rich 边框字符。"""
+    return _ANSI_RE.sub("", line).strip().strip("│╭╮╰╯─|").strip()
+
+
+def trim_traceback(error_msg: str) -> tuple[str, list[int]]:
+    """
+    保留指向 scene.py 的帧（及其下一行源码）、异常行与静态检查结果，丢弃 manim/库内部帧与 Rich 装饰。
+    返回 (截取后的错误信息, 出错行号列表)；什么都没匹配到时保留末尾若干行。
+    """
+    lines = [_clean(raw) for raw in (error_msg or "").splitlines()]
+    lines = [line for line in lines if line]
+    kept: list[str] = []
+    line_nos: list[int] = []
+    for i, line in enumerate(lines):
+        m = _SCENE_LINE_RE.search(line)
+        if m:
+            line_nos.append(int(m.group(1) or m.group(2)))
+            kept.append(line)
+            # 普通 traceback 下一行是出错源码
+            if m.group(1) and i + 1 < len(lines) and not _SCENE_LINE_RE.search(lines[i + 1]) and "File " not in lines[i + 1]:
+                kept.append("    " + lines[i + 1])
+        elif _EXC_RE.match(line) or line.startswith(("Manim ", "SyntaxError")):
+            kept.append(line)
+    if not kept:
+        kept = lines[-_MAX_ERROR_LINES:]
+    # 去掉相邻重复行，限制总行数（保留最后的异常信息）
+    deduped = [line for i, line in enumerate(kept) if i == 0 or line != kept[i - 1]]
+    return "\n".join(deduped[-_MAX_ERROR_LINES:]), sorted(set(line_nos))
+
+
+def code_window(code: str, line_nos: list[int], radius: int = 6) -> str:
+    """取出错行前后 radius 行（区间合并），带行号输出，如 ` 12| self.play(...)`。"""
+    lines = code.splitlines()
+    ranges: list[list[int]] = []
+    for n in sorted(line_nos):
+        lo, hi = max(1, n - radius), min(len(lines), n + radius)
+        if lo > hi:
+            continue
+        if ranges and lo <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], hi)
+        else:
+            ranges.append([lo, hi])
+    width = len(str(len(lines)))
+    blocks = [
+        "\n".join(f"{i:>{width}}| {lines[i - 1]}" for i in range(lo, hi + 1))
+        for lo, hi in ranges
+    ]
+    return "\n...\n".join(blocks)
+
+
+def extract_diff(text: str) -> str:
+    """取 LLM 回复中的 diff 代码块；没有代码块时原样返回。"""
+    m = _DIFF_BLOCK_RE.search(text)
+    return m.group(1) if m else text
+
+
+def _parse_hunks(diff: str) -> list[tuple[int, list[str], list[str]]]:
+    hunks: list[tuple[int, list[str], list[str]]] = []
+    current: tuple[int, list[str], list[str]] | None = None
+    for line in diff.splitlines():
+        m = _HUNK_RE.match(line)
+        if m:
+            current = (int(m.group(1)), [], [])
+            hunks.append(current)
+            continue
+        if current is None or line.startswith(("---", "+++", "\\")):
+            continue
+        tag, body = (line[0], line[1:]) if line else (" ", "")
+        if tag == " ":
+            current[1].append(body)
+            current[2].append(body)
+        elif tag == "-":
+            current[1].append(body)
+        elif tag == "+":
+            current[2].append(body)
+        else:
+            # 模型漏掉了上下文行前的空格
+            current[1].append(line)
+            current[2].append(line)
+    if not hunks:
+        raise PatchError("回复中没有 @@ hunk")
+    return hunks
+
+
+def _find_block(lines: list[str], block: list[str], hint: int, start: int) -> int:
+    """在 lines[start:] 中找 block，优先靠近 hint 的位置；先精确匹配，再忽略行尾空白。"""
+    if not block:
+        return max(start, min(hint, len(lines)))
+    for norm in (lambda s: s, lambda s: s.rstrip()):
+        target = [norm(s) for s in block]
+        candidates = [
+            i for i in range(start, len(lines) - len(block) + 1)
+            if [norm(s) for s in lines[i:i + len(block)]] == target
+        ]
+        if candidates:
+            return min(candidates, key=lambda i: abs(i - hint))
+    raise PatchError(f"hunk 上下文与原代码不符（约第 {hint + 1} 行）")
+
+
+def apply_unified_diff(code: str, diff: str) -> str:
+    """把 unified diff 应用到 code；hunk 按内容定位（行号只作提示），对不上时抛出 PatchError。"""
+    lines = code.splitlines()
+    out: list[str] = []
+    cursor = 0
+    for old_start, old_block, new_block in _parse_hunks(diff):
+        pos = _find_block(lines, old_block, old_start - 1, cursor)
+        out.extend(lines[cursor:pos])
+        out.extend(new_block)
+        cursor = pos + len(old_block)
+    out.extend(lines[cursor:])
+    return "\n".join(out)
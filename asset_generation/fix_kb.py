@@ -0,0 +1,274 @@
+"""
+Manim 报错修复知识库：把报错归一化为签名，记录哪些代码替换修好了它（SQLite 持久化）。
+自愈时先按签名确定性地套用已知修复，命中则不调用 LLM；LLM 修复成功后从前后代码的差异中学习替换规则，
+规则只记到出错行被改动的签名下，并在多次独立修复中得到验证后才直接套用。
+"""
+import difflib
+import hashlib
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+from config import get_settings
+
+from .code_patch import _SCENE_LINE_RE
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DB_PATH = DATA_DIR / "fix_kb.db"
+
+# 从一次 LLM 修复中最多学习的替换条数；改动更多说明是大面积重写，不具备可复用性
+_MAX_LEARNED_RULES = 3
+_MAX_FRAGMENT_LEN = 120
+# 学到的规则至少被这么多次 LLM 修复验证后才直接套用（一次修复可能只是碰巧）；内置规则不受限
+_MIN_LEARNED_SUCCESSES = 2
+
+# 内置修复：manim 社区版中已移除/改名的常见 API（签名为归一化后的报错）
+_BUILTIN_RULES: list[tuple[str, str, str]] = [
+    ("NameError: name 'ShowCreation' is not defined", "ShowCreation(", "Create("),
+    ("NameError: name 'TextMobject' is not defined", "TextMobject(", "Tex("),
+    ("NameError: name 'TexMobject' is not defined", "TexMobject(", "MathTex("),
+    ("AttributeError: 'Axes' object has no attribute 'get_graph'", ".get_graph(", ".plot("),
+]
+
+_EXC_LINE_RE = re.compile(r"\b([A-Z]\w*(?:Error|Exception)): (.+)$")
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+_init_lock = threading.Lock()
+_initialized: set[Path] = set()
+
+
+def is_enabled() -> bool:
+    return get_settings().manim_fix_kb_enabled
+
+
+def _get_conn() -> sqlite3.Connection:
+    path = DB_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=10)
+    conn.row_factory = sqlite3.Row
+    with _init_lock:
+        if path not in _initialized:
+            _init_schema(conn)
+            _initialized.add(path)
+    return conn
+
+
+def _init_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fix_signatures (
+            signature TEXT PRIMARY KEY,
+            seen INTEGER NOT NULL DEFAULT 0,
+            kb_hits INTEGER NOT NULL DEFAULT 0,
+            llm_fixes INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fix_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            signature TEXT NOT NULL,
+            old TEXT NOT NULL,
+            new TEXT NOT NULL,
+            source TEXT NOT NULL,
+            successes INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            UNIQUE(signature, old, new)
+        )
+    """)
+    conn.executemany(
+        "INSERT OR IGNORE INTO fix_rules (signature, old, new, source, successes) VALUES (?, ?, ?, 'builtin', 1)",
+        _BUILTIN_RULES,
+    )
+    conn.commit()
+
+
+def normalize_error(line: str) -> str:
+    """归一化单条异常信息：去掉行号、数字、内存地址与文件路径，保留异常类型与标识符。"""
+    s = re.sub(r"\s*\(line \d+\)", "", line.strip())
+    s = re.sub(r"0x[0-9a-fA-F]+", "0x?", s)
+    s = re.sub(r"(['\"])(?:[A-Za-z]:)?[/\\][^'\"]*\1", "'<path>'", s)
+    s = re.sub(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])", "N", s)
+    return re.sub(r"\s+", " ", s)
+
+
+def signatures(error_text: str) -> list[str]:
+    """从报错文本（traceback / stderr / 静态检查结果）中提取去重后的签名列表。"""
+    found: dict[str, None] = {}
+    for raw in _ANSI_RE.sub("", error_text or "").splitlines():
+        line = raw.strip(" │|\t")
+        m = _EXC_LINE_RE.search(line)
+        if m:
+            found.setdefault(normalize_error(f"{m.group(1)}: {m.group(2)}"), None)
+    return list(found)
+
+
+def signature_lines(error_text: str) -> dict[str, set[int]]:
+    """
+    各签名对应的 scene.py 出错行：traceback 中该异常之前最近的 scene.py 帧，或静态检查结果行内的 (line N)。
+    找不到出错行的签名不出现在结果中。
+    """
+    result: dict[str, set[int]] = {}
+    last: int | None = None
+    for raw in _ANSI_RE.sub("", error_text or "").splitlines():
+        line = raw.strip(" │|\t")
+        frame = _SCENE_LINE_RE.search(line)
+        if frame:
+            last = int(frame.group(1) or frame.group(2))
+        m = _EXC_LINE_RE.search(line)
+        if m:
+            if last is not None:
+                result.setdefault(normalize_error(f"{m.group(1)}: {m.group(2)}"), set()).add(last)
+            last = None
+    return result
+
+
+def signature_key(signature: str) -> str:
+    return hashlib.sha256(signature.encode("utf-8")).hexdigest()[:16]
+
+
+def _replace_fragment(code: str, old: str, new: str) -> tuple[str, int]:
+    """替换所有 old 片段；片段首尾是标识符字符时要求在标识符边界上，避免 Tex 误改 MathTex。"""
+    pattern = re.escape(old)
+    if old[:1].isalnum() or old[:1] == "_":
+        pattern = r"(?<![\w])" + pattern
+    if old[-1:].isalnum() or old[-1:] == "_":
+        pattern += r"(?![\w])"
+    return re.subn(pattern, lambda _: new, code)
+
+
+def apply_known_fixes(code: str, error_text: str) -> tuple[str, list[int]] | None:
+    """
+    按报错签名查找成功次数多于失败次数的替换规则并依次套用（学到的规则还需至少 _MIN_LEARNED_SUCCESSES 次成功）。
+    代码有变化时返回 (新代码, 使用的规则 id)，没有可用规则返回 None。同时累计各签名的出现次数。
+    """
+    sigs = signatures(error_text)
+    if not sigs:
+        return None
+    conn = _get_conn()
+    try:
+        conn.executemany(
+            "INSERT INTO fix_signatures (signature, seen) VALUES (?, 1) "
+            "ON CONFLICT(signature) DO UPDATE SET seen = seen + 1",
+            [(s,) for s in sigs],
+        )
+        rows = conn.execute(
+            f"SELECT id, signature, old, new FROM fix_rules WHERE signature IN ({','.join('?' * len(sigs))}) "
+            "AND successes > failures AND (source = 'builtin' OR successes >= ?) ORDER BY successes - failures DESC",
+            [*sigs, _MIN_LEARNED_SUCCESSES],
+        ).fetchall()
+        fixed = code
+        used: list[int] = []
+        hit_sigs: set[str] = set()
+        for row in rows:
+            fixed, n = _replace_fragment(fixed, row["old"], row["new"])
+            if n:
+                used.append(row["id"])
+                hit_sigs.add(row["signature"])
+        if used:
+            conn.executemany(
+                "UPDATE fix_signatures SET kb_hits = kb_hits + 1 WHERE signature = ?",
+                [(s,) for s in hit_sigs],
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    if not used or fixed == code:
+        return None
+    return fixed, used
+
+
+def _identifier_bounds(a: str, b: str) -> tuple[str, str] | None:
+    """求两行的最小差异片段，并扩展到完整标识符边界；无差异返回 None。"""
+    if a == b:
+        return None
+    p = 0
+    while p < min(len(a), len(b)) and a[p] == b[p]:
+        p += 1
+    s = 0
+    while s < min(len(a), len(b)) - p and a[len(a) - 1 - s] == b[len(b) - 1 - s]:
+        s += 1
+    while p > 0 and (a[p - 1].isalnum() or a[p - 1] == "_"):
+        p -= 1
+    while s > 0 and (a[len(a) - s].isalnum() or a[len(a) - s] == "_"):
+        s -= 1
+    return a[p:len(a) - s], b[p:len(b) - s]
+
+
+def _learned_edits(bad_code: str, fixed_code: str) -> list[tuple[str, str, int]]:
+    """逐行替换 (old, new, 改动所在的原代码行号)；改动过多、片段过长或涉及增删行时返回空列表。"""
+    a, b = bad_code.splitlines(), fixed_code.splitlines()
+    edits: list[tuple[str, str, int]] = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        if tag != "replace" or i2 - i1 != j2 - j1:
+            return []
+        for offset, (old_line, new_line) in enumerate(zip(a[i1:i2], b[j1:j2])):
+            frag = _identifier_bounds(old_line, new_line)
+            if frag is None:
+                continue
+            old, new = frag
+            if not old.strip() or len(old) > _MAX_FRAGMENT_LEN or len(new) > _MAX_FRAGMENT_LEN:
+                return []
+            edits.append((old, new, i1 + offset + 1))
+    return edits if len({(old, new) for old, new, _ in edits}) <= _MAX_LEARNED_RULES else []
+
+
+def learn_rules(bad_code: str, fixed_code: str) -> list[tuple[str, str]]:
+    """从修复前后代码中提取逐行替换规则 (old, new)；改动过多、片段过长或涉及增删行时不学习。"""
+    return list(dict.fromkeys((old, new) for old, new, _ in _learned_edits(bad_code, fixed_code)))
+
+
+def record_outcome(
+    resolved: list[str],
+    unresolved: list[str],
+    *,
+    bad_code: str,
+    fixed_code: str,
+    rule_ids: list[int],
+    source: str,
+    error_lines: dict[str, set[int]] | None = None,
+) -> None:
+    """
+    根据修复后的下一次尝试结果更新知识库：resolved 为已消失的签名，unresolved 为仍然出现的签名。
+    source 为 kb 时累计所用规则的成功/失败次数；为 llm 时从差异中学习规则，只记到出错行（error_lines，
+    见 signature_lines）被改动的已解决签名下。
+    """
+    conn = _get_conn()
+    try:
+        if source == "kb":
+            column = "successes" if resolved and not unresolved else "failures"
+            conn.executemany(f"UPDATE fix_rules SET {column} = {column} + 1 WHERE id = ?", [(i,) for i in rule_ids])
+        elif resolved:
+            edits = _learned_edits(bad_code, fixed_code)
+            for sig in resolved:
+                conn.execute(
+                    "INSERT INTO fix_signatures (signature, llm_fixes) VALUES (?, 1) "
+                    "ON CONFLICT(signature) DO UPDATE SET llm_fixes = llm_fixes + 1",
+                    (sig,),
+                )
+                lines = (error_lines or {}).get(sig, set())
+                rules = list(dict.fromkeys((old, new) for old, new, n in edits if n in lines))
+                conn.executemany(
+                    "INSERT INTO fix_rules (signature, old, new, source, successes) VALUES (?, ?, ?, 'learned', 1) "
+                    "ON CONFLICT(signature, old, new) DO UPDATE SET successes = successes + 1",
+                    [(sig, old, new) for old, new in rules],
+                )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_stats(limit: int = 50) -> list[dict]:
+    """按出现次数返回各签名的统计：seen / kb_hits（知识库直接修复次数）/ llm_fixes / 规则数。"""
+    conn = _get_conn()
+    try:
+        rows = conn.execute(
+            "SELECT s.signature, s.seen, s.kb_hits, s.llm_fixes, "
+            "(SELECT COUNT(*) FROM fix_rules r WHERE r.signature = s.signature AND r.successes > r.failures "
+            "AND (r.source = 'builtin' OR r.successes >= ?)) AS rules "
+            "FROM fix_signatures s ORDER BY s.seen DESC LIMIT ?",
+            (_MIN_LEARNED_SUCCESSES, limit),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [{**dict(row), "key": signature_key(row["signature"])} for row in rows]
@@ -1,19 +1,37 @@
-"""Manim 渲染与自愈：写临时文件、subprocess 调用、失败时 LLM 修复并重试。"""
+"""Manim 渲染与自愈：写场景文件、subprocess 调用（或常驻 worker 池）、失败时 LLM 修复并重试。"""
+import contextlib
+import functools
+import logging
+import sqlite3
+import subprocess
 import sys
 import tempfile
+import threading
+import time
 from pathlib import Path
 
 from config import get_settings
-from llm_runner import invoke_plain
+from llm_runner import invoke_plain_with_usage
+
+logger = logging.getLogger(__name__)
 
 
 def _get_manim_args() -> list[str]:
     """
     返回用于 subprocess 的 manim 命令列表。
     优先用「当前 Python -m manim」或项目 .venv 内的 manim，不依赖 PATH。
+    结果按配置的 manim_command 缓存，避免每次渲染重复探测（可能另起解释器测试 import manim）。
     """
+    return list(_resolve_manim_args(get_settings().manim_command.strip()))
+
+
+@functools.lru_cache(maxsize=8)
+def _resolve_manim_args(configured: str) -> tuple[str, ...]:
+    return tuple(_probe_manim_args(configured))
+
+
+def _probe_manim_args(configured: str) -> list[str]:
     import shutil
-    configured = get_settings().manim_command.strip()
     # 配置为绝对路径且存在时，直接作为可执行文件用
     if Path(configured).is_absolute() and Path(configured).exists():
         return [configured]
@@ -35,7 +53,6 @@ def _get_manim_args() -> list[str]:
         return [str(uv_venv_manim)]
     if uv_venv_python.exists():
         try:
-            import subprocess
             subprocess.run(
                 [str(uv_venv_python), "-c", "import manim"],
                 capture_output=True,
@@ -65,48 +82,258 @@ def _strip_markdown_code_block(code: str) -> str:
     return "\n".join(lines)
 
 
-def render_manim_video(code_string: str, output_file: str | Path) -> None:
-    """
-    将代码写入临时目录的 .py 文件，subprocess 调用 manim CLI 渲染 SolutionScene。
-    渲染成功后从 manim 输出目录找到生成的 .mp4 并复制到 output_file。
-    若退出码非 0，抛出 RuntimeError 并附带 stderr（供自愈使用）。
-    """
-    import shutil
-    import subprocess
+def _require_manim_args() -> list[str]:
+    """返回 manim 命令，未找到时抛出 FileNotFoundError（自愈循环据此判定为环境问题、不重试）。"""
     manim_args = _get_manim_args()
     if not manim_args:
-        configured = get_settings().manim_command
         raise FileNotFoundError(
             f"未找到 manim。请在本项目中执行: uv sync（并先装 Manim 系统依赖，见 README），并使用 uv run 启动服务（如 uv run uvicorn main:app ...）。"
             f"或设置 MANIM_COMMAND 为 manim 可执行文件的绝对路径。"
         )
+    return manim_args
+
+
+def _run_manim(
+    scene_py: Path,
+    cwd: Path,
+    extra_args: list[str] | None = None,
+    *,
+    timeout: float = 300,
+    env: dict[str, str] | None = None,
+    cancel_event: threading.Event | None = None,
+) -> subprocess.CompletedProcess[str]:
+    """
+    在 cwd 下以 -ql 渲染 scene_py 中的 SolutionScene，extra_args 追加到命令行末尾，env 追加到当前环境变量。
+    启用 LaTeX 缓存时 tex_dir 指向跨任务共享目录。
+    cancel_event 被设置时结束 manim 进程，返回码为 -9、stderr 为「已取消」。
+    """
+    import os
+
+    from . import tex_cache
+    cmd = [*_require_manim_args(), str(scene_py), "SolutionScene", "-ql", *tex_cache.manim_cli_args(), *(extra_args or [])]
+    run_env = {**os.environ, **env} if env else None
+    if cancel_event is None:
+        return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, cwd=str(cwd), env=run_env)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=str(cwd), env=run_env)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            stdout, stderr = proc.communicate(timeout=0.2)
+            return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set() or time.monotonic() > deadline:
+                proc.kill()
+                stdout, _ = proc.communicate()
+                if not cancel_event.is_set():
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                return subprocess.CompletedProcess(cmd, -9, stdout, "已取消")
+
+
+def _find_rendered_mp4(media_dir: Path) -> Path | None:
+    """在 manim 输出目录中找到成片 mp4（排除 partial_movie_files 下的分段文件）。"""
+    videos = media_dir / "videos"
+    mp4s = [p for p in videos.rglob("*.mp4") if "partial_movie_files" not in p.parts]
+    return mp4s[0] if mp4s else None
+
+
+def _worker_pool():
+    """启用常驻 worker 池时返回池对象，否则返回 None。"""
+    from .manim_worker import get_worker_pool
+    return get_worker_pool()
+
+
+# 任务工作目录下的 Manim 渲染目录名；保留其中的 partial_movie_files，使未改动的动画跨尝试复用
+MEDIA_DIR_NAME = "manim_media"
+
+
+def _render_dir(work_dir: str | Path | None):
+    """work_dir 给定时返回该固定目录（跨自愈尝试与断点重试复用 Manim 分段缓存），否则返回一次性临时目录。"""
+    if work_dir is None:
+        return tempfile.TemporaryDirectory()
+    path = Path(work_dir).resolve()
+    path.mkdir(parents=True, exist_ok=True)
+    return contextlib.nullcontext(str(path))
+
+
+_phase_lock = threading.Lock()
+_phase_stats = {
+    "dry_runs": 0,
+    "dry_run_failures": 0,
+    "dry_run_seconds": 0.0,
+    "encodes": 0,
+    "encode_failures": 0,
+    "encode_seconds": 0.0,
+}
+
+
+_fix_stats = {"patch_calls": 0, "full_calls": 0, "patch_fallbacks": 0, "input_tokens": 0, "output_tokens": 0}
+
+
+def _record_phase(phase: str, seconds: float, ok: bool) -> None:
+    """累计渲染阶段耗时，phase 为 dry_run（预演）或 encode（正式编码）。"""
+    with _phase_lock:
+        _phase_stats[f"{phase}s"] += 1
+        _phase_stats[f"{phase}_seconds"] += seconds
+        if not ok:
+            _phase_stats[f"{phase}_failures"] += 1
+
+
+def get_render_stats() -> dict:
+    """
+    返回预演/编码两阶段的次数、失败数与累计耗时，以及估算节省的编码时间：
+    预演失败的次数 × 成功编码的平均耗时（这些尝试没有进入编码阶段）。
+    fix 为 LLM 自愈调用次数（patch / full）、diff 回退次数与累计 token 数。
+    """
+    with _phase_lock:
+        stats = dict(_phase_stats)
+    ok_encodes = stats["encodes"] - stats["encode_failures"]
+    avg_encode = stats["encode_seconds"] / ok_encodes if ok_encodes else 0.0
+    stats["dry_run_seconds"] = round(stats["dry_run_seconds"], 2)
+    stats["encode_seconds"] = round(stats["encode_seconds"], 2)
+    stats["encode_seconds_saved_estimate"] = round(stats["dry_run_failures"] * avg_encode, 2)
+    with _phase_lock:
+        stats["fix"] = dict(_fix_stats)
+    return stats
+
+
+def _execute_scene(
+    scene_py: Path,
+    cwd: Path,
+    *,
+    dry_run: bool,
+    cancel_event: threading.Event | None = None,
+) -> Path | None:
+    """
+    执行 scene_py 中的 SolutionScene：启用 worker 池时在常驻进程内执行，池不可用则回退 subprocess。
+    dry_run 时只跑 construct()、不写帧，返回 None；否则返回成片 mp4 路径。失败抛出 RuntimeError（附 stderr / traceback）。
+    传入 cancel_event 时（可被中途取消的渲染）不使用 worker 池，直接 subprocess。
+    """
+    from . import tex_cache
+    pool = _worker_pool() if cancel_event is None else None
+    if pool is not None:
+        from .manim_worker import WorkerUnavailable
+        config = tex_cache.manim_config()
+        if dry_run:
+            config["dry_run"] = True
+        try:
+            return pool.render(scene_py, cwd, config=config)
+        except WorkerUnavailable as e:
+            pool.bump("fallbacks")
+            logger.warning("[manim] worker 池不可用，回退 subprocess 渲染: %s", str(e).splitlines()[-1])
+    proc = _run_manim(scene_py, cwd, ["--dry_run"] if dry_run else None, cancel_event=cancel_event)
+    if proc.returncode != 0:
+        label = "预演" if dry_run else "渲染"
+        raise RuntimeError(f"Manim {label}失败 (exit {proc.returncode}): {proc.stderr or proc.stdout}")
+    if dry_run:
+        return None
+    # manim 输出到 <cwd>/media/videos/scene/480p15/SolutionScene.mp4 等
+    mp4 = _find_rendered_mp4(cwd / "media")
+    if mp4 is None:
+        raise RuntimeError("Manim 未生成 mp4 文件")
+    return mp4
+
+
+def _timed_phase(
+    phase: str,
+    scene_py: Path,
+    cwd: Path,
+    cancel_event: threading.Event | None = None,
+) -> tuple[Path | None, float]:
+    start = time.monotonic()
+    try:
+        result = _execute_scene(scene_py, cwd, dry_run=phase == "dry_run", cancel_event=cancel_event)
+    except RuntimeError:
+        _record_phase(phase, time.monotonic() - start, ok=False)
+        raise
+    elapsed = time.monotonic() - start
+    _record_phase(phase, elapsed, ok=True)
+    return result, elapsed
+
+
+def render_manim_video(
+    code_string: str,
+    output_file: str | Path,
+    work_dir: str | Path | None = None,
+    *,
+    cancel_event: threading.Event | None = None,
+    code_suffix: str = "",
+) -> None:
+    """
+    将代码写入渲染目录的 scene.py，subprocess 调用 manim CLI 渲染 SolutionScene（启用 worker 池时在常驻进程内渲染，池不可用则回退 subprocess）。
+    启用 manim_dry_run_first 时先以 --dry_run 预演（只执行 construct、不写帧），运行时错误几秒内即可暴露，通过后再正式编码。
+    渲染成功后从 manim 输出目录找到生成的 .mp4 并复制到 output_file。
+    work_dir 为任务级固定目录时，Manim 按动画内容哈希复用上次渲染的分段，只重渲改动过的动画；不传则使用临时目录。
+    若退出码非 0，抛出 RuntimeError 并附带 stderr（供自愈使用）。cancel_event 被设置时中止渲染并抛出 RuntimeError。
+    code_suffix 在写入 scene.py 时追加到代码末尾（如步骤标记），不参与自愈修复；渲染产物旁的 .steps.json 一并复制。
+    启用 LaTeX 缓存时还会追加共享缓存访问钩子（见 tex_cache.scene_suffix）。
+    """
     out_path = Path(output_file).resolve()
     out_path.parent.mkdir(parents=True, exist_ok=True)
     code_clean = _strip_markdown_code_block(code_string)
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with _render_dir(work_dir) as tmpdir:
         tmpdir = Path(tmpdir)
         scene_py = tmpdir / "scene.py"
-        scene_py.write_text(code_clean, encoding="utf-8")
-        proc = subprocess.run(
-            [*manim_args, str(scene_py), "SolutionScene", "-ql"],
-            capture_output=True,
-            text=True,
-            timeout=300,
-            cwd=str(tmpdir),
-        )
-        if proc.returncode != 0:
-            raise RuntimeError(f"Manim 渲染失败 (exit {proc.returncode}): {proc.stderr or proc.stdout}")
-        # manim 输出到 <cwd>/media/videos/scene/720p30/SolutionScene.mp4 等
-        media = tmpdir / "media" / "videos"
-        mp4s = list(media.rglob("*.mp4"))
-        if not mp4s:
-            raise RuntimeError("Manim 未生成 mp4 文件")
-        shutil.copy(str(mp4s[0]), str(out_path))
+        from . import tex_cache
+        scene_py.write_text(code_clean + tex_cache.scene_suffix() + code_suffix, encoding="utf-8")
+        dry_seconds = 0.0
+        if get_settings().manim_dry_run_first:
+            _, dry_seconds = _timed_phase("dry_run", scene_py, tmpdir, cancel_event)
+        mp4, encode_seconds = _timed_phase("encode", scene_py, tmpdir, cancel_event)
+        _publish_video(mp4, out_path)
+        logger.info("[manim] 渲染完成：预演 %.1fs，编码 %.1fs", dry_seconds, encode_seconds)
+
+
+def _publish_video(mp4: Path, out_path: Path) -> None:
+    """
+    复制渲染产物到 out_path；有步骤标记 sidecar（<mp4>.steps.json）时一并复制，没有则删掉旧的。
+    先删除旧文件再复制：out_path 可能是渲染缓存条目的硬链接，原地覆盖会写穿缓存。
+    """
+    import shutil
+    out_path.unlink(missing_ok=True)
+    shutil.copy(str(mp4), str(out_path))
+    marks = Path(f"{mp4}.steps.json")
+    target = Path(f"{out_path}.steps.json")
+    if marks.is_file():
+        shutil.copy(str(marks), str(target))
+    else:
+        target.unlink(missing_ok=True)
+
+
+def prune_media_dirs(output_root: str | Path, max_age_hours: float) -> int:
+    """
+    删除 output_root/<task_id>/work/ 下超过 max_age_hours 未更新的 Manim 渲染目录（失败后未再重试的任务），返回删除个数。
+    max_age_hours <= 0 时不清理。
+    """
+    import shutil
+    root = Path(output_root)
+    if max_age_hours <= 0 or not root.is_dir():
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for media in root.glob(f"*/work/{MEDIA_DIR_NAME}"):
+        try:
+            if media.stat().st_mtime >= cutoff:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(media, ignore_errors=True)
+        removed += 1
+    if removed:
+        logger.info("[manim] 清理过期渲染目录 %d 个", removed)
+    return removed
+
 
+# 推测式并行自愈时各候选修复的附加提示，与不同温度配合，使候选之间有差异
+_FIX_VARIANT_HINTS = [
+    "",
+    "\n注意：尽量只做最小改动，不要调整与报错无关的代码。",
+    "\n注意：若报错涉及不确定的 API 或参数，改用 manim 社区版中更基础、确定存在的写法。",
+    "\n注意：先推断报错的根本原因（可能不在报错行本身），再修复所有同类问题。",
+]
 
-def fix_code_with_llm(bad_code: str, error_msg: str) -> str:
-    """通过 LangChain 将错误信息与代码发 LLM 请求修复，返回新代码。"""
-    prompt = f"""这段 Manim 代码运行报错，请修复后只返回完整可运行的 Python 代码，不要解释。
+
+def _full_fix_prompt(bad_code: str, error_msg: str) -> str:
+    return f"""这段 Manim 代码运行报错，请修复后只返回完整可运行的 Python 代码，不要解释。
 
 错误信息:
 {error_msg}
@@ -117,20 +344,323 @@ def fix_code_with_llm(bad_code: str, error_msg: str) -> str:
 ```
 
 请直接输出修复后的完整代码（保留 SolutionScene 类和 self.wait() 占位）。"""
-    return invoke_plain(prompt)
 
 
-def render_manim_video_with_self_heal(code_string: str, output_file: str | Path) -> None:
+def _patch_fix_prompt(window: str, error_msg: str) -> str:
+    return f"""这段 Manim 代码运行报错。请只输出修复用的 unified diff，放在 ```diff 代码块中，不要输出完整文件，不要解释。
+
+错误信息（已截取与 scene.py 相关的部分）:
+{error_msg}
+
+出错位置附近的代码（格式为「行号| 代码」，行号只用于定位，不属于代码）:
+```
+{window}
+```
+
+要求：每个 hunk 以 @@ -起始行,行数 +起始行,行数 @@ 开头，带 2~3 行未改动的上下文；只改必要的行；保留 SolutionScene 类和 self.wait() 占位。"""
+
+
+def _record_fix(mode: str, usage: dict) -> None:
+    with _phase_lock:
+        _fix_stats[f"{mode}_calls"] += 1
+        _fix_stats["input_tokens"] += usage.get("input_tokens") or 0
+        _fix_stats["output_tokens"] += usage.get("output_tokens") or 0
+
+
+def fix_code_with_llm(bad_code: str, error_msg: str, *, variant: int = 0) -> str:
+    """
+    通过 LangChain 将错误信息与代码发 LLM 请求修复，返回新代码。
+    manim_fix_mode 为 patch（默认）时只发送截取后的 traceback 与出错行附近的代码窗口，要求模型返回 unified diff 并在本地应用；
+    无法定位出错行、diff 解析或应用失败时回退为整文件修复。每次调用记录输入/输出 token 数。
+    variant > 0 时追加不同的修复提示并提高温度，用于推测式并行自愈生成互不相同的候选。
+    修复请求不读 LLM 响应缓存：同一 (代码, 报错) 的重试需要新的采样，而不是重放已失败的修复。
+    """
+    from .code_patch import PatchError, apply_unified_diff, code_window, extract_diff, trim_traceback
+    code = _strip_markdown_code_block(bad_code)
+    trimmed, line_nos = trim_traceback(error_msg)
+    hint = _FIX_VARIANT_HINTS[variant % len(_FIX_VARIANT_HINTS)]
+    temperature = min(1.0, 0.3 + 0.25 * variant) if variant else None
+    if get_settings().manim_fix_mode == "patch" and line_nos:
+        reply, usage = invoke_plain_with_usage(
+            _patch_fix_prompt(code_window(code, line_nos), trimmed) + hint, temperature=temperature, use_cache=False
+        )
+        _record_fix("patch", usage)
+        logger.info(
+            "[manim] 自愈修复 mode=patch tokens_in=%s tokens_out=%s",
+            usage.get("input_tokens"), usage.get("output_tokens"),
+        )
+        try:
+            return apply_unified_diff(code, extract_diff(reply))
+        except PatchError as e:
+            with _phase_lock:
+                _fix_stats["patch_fallbacks"] += 1
+            logger.info("[manim] diff 无法应用，回退整文件修复: %s", e)
+    reply, usage = invoke_plain_with_usage(
+        _full_fix_prompt(code, trimmed) + hint, temperature=temperature, use_cache=False
+    )
+    _record_fix("full", usage)
+    logger.info(
+        "[manim] 自愈修复 mode=full tokens_in=%s tokens_out=%s",
+        usage.get("input_tokens"), usage.get("output_tokens"),
+    )
+    return reply
+
+
+class CodeFixer:
     """
-    自愈循环：执行渲染，失败则用 LLM 修复代码后重试，最多 N 次（配置项）。
+    自愈修复入口：先按报错签名套用知识库（fix_kb）中的已知修复，没有可用修复再调用 LLM。
+    下一次尝试的结果通过 report 反馈给知识库：已知修复是否有效、LLM 修复可以学到哪些替换。
     """
+
+    def __init__(self):
+        self._pending: dict | None = None
+        self._kb_enabled = False
+
+    def fix(self, code: str, error: str) -> str:
+        return self.candidates(code, error, 1)[0]
+
+    def candidates(self, code: str, error: str, k: int) -> list[str]:
+        """
+        返回修复候选：知识库命中时只返回这一份；否则并发请求 k 份提示与温度各不相同的 LLM 修复，去重后返回。
+        只有一份候选时自动采用；多份时由调用方通过 adopt 指明最终采用哪一份。
+        """
+        from . import fix_kb
+        self.report(error)
+        self._kb_enabled = fix_kb.is_enabled()
+        if self._kb_enabled:
+            try:
+                known = fix_kb.apply_known_fixes(code, error)
+            except sqlite3.Error as e:
+                logger.warning("[manim] 修复知识库不可用: %s", e)
+                known, self._kb_enabled = None, False
+            if known is not None:
+                fixed, rule_ids = known
+                logger.info("[manim] 命中已知修复 %d 条，跳过 LLM", len(rule_ids))
+                self._remember(code, fixed, error, rule_ids, "kb")
+                return [fixed]
+        if k <= 1:
+            results = [fix_code_with_llm(code, error)]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=k) as pool:
+                futures = [pool.submit(fix_code_with_llm, code, error, variant=i) for i in range(k)]
+            results = []
+            for fut in futures:
+                try:
+                    results.append(_strip_markdown_code_block(fut.result()))
+                except Exception as e:
+                    logger.warning("[manim] 候选修复请求失败: %s", e)
+            if not results:
+                raise RuntimeError("所有候选修复请求均失败")
+            results = list(dict.fromkeys(results))
+        if len(results) == 1:
+            self.adopt(code, results[0], error)
+        return results
+
+    def adopt(self, code: str, fixed: str, error: str) -> None:
+        """指明采用的 LLM 修复候选，其效果随后由 report 反馈给知识库。已记录知识库修复时不覆盖。"""
+        if self._kb_enabled and self._pending is None:
+            self._remember(code, fixed, error, [], "llm")
+
+    def report(self, error: str | None) -> None:
+        """反馈上一次修复后的尝试结果：error 为 None 表示渲染成功。"""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        from . import fix_kb
+        remaining = set(fix_kb.signatures(error)) if error else set()
+        try:
+            fix_kb.record_outcome(
+                [sig for sig in pending["signatures"] if sig not in remaining],
+                [sig for sig in pending["signatures"] if sig in remaining],
+                bad_code=pending["bad_code"],
+                fixed_code=pending["fixed_code"],
+                rule_ids=pending["rule_ids"],
+                source=pending["source"],
+                error_lines=pending["error_lines"],
+            )
+        except sqlite3.Error as e:
+            logger.warning("[manim] 修复知识库写入失败: %s", e)
+
+    def _remember(self, bad_code: str, fixed_code: str, error: str, rule_ids: list[int], source: str) -> None:
+        from . import fix_kb
+        sigs = fix_kb.signatures(error)
+        if sigs:
+            self._pending = {
+                "signatures": sigs,
+                "bad_code": _strip_markdown_code_block(bad_code),
+                "fixed_code": _strip_markdown_code_block(fixed_code),
+                "rule_ids": rule_ids,
+                "source": source,
+                "error_lines": fix_kb.signature_lines(error),
+            }
+
+
+def precheck_manim_code(code_string: str) -> None:
+    """
+    启用 manim_static_check 时在渲染前做静态检查（语法、SolutionScene、self.wait()、未定义名字等），
+    不通过则抛出 ManimCodeError，自愈循环直接交给 LLM 修复而不启动 manim。
+    """
+    if not get_settings().manim_static_check:
+        return
+    from .manim_validate import ManimCodeError, check_manim_code
+    try:
+        check_manim_code(_strip_markdown_code_block(code_string))
+    except ManimCodeError as e:
+        logger.info("[manim] 静态检查未通过，跳过渲染直接修复: %s", str(e).splitlines()[1:3])
+        raise
+
+
+def render_manim_video_with_self_heal(
+    code_string: str,
+    output_file: str | Path,
+    work_dir: str | Path | None = None,
+    *,
+    code_suffix: str = "",
+    cancel_event: threading.Event | None = None,
+) -> None:
+    """
+    自愈循环：执行渲染，失败则修复代码后重试（先查修复知识库，未命中再调用 LLM），最多 N 次（配置项）。
+    manim_speculative_fixes > 1 时每轮并发请求多份候选修复并行渲染，取第一个成功的。
+    manim_render_mode 为 sharded 时改用分段并行渲染，失败时只重渲失败的分段。
+    work_dir 为任务级固定渲染目录（见 render_manim_video），各次尝试共用其中的分段缓存。
+    code_suffix 每次渲染时追加到代码末尾（不交给修复）；分段模式不支持，传入时抛出 ValueError。
+    cancel_event 被设置时结束正在运行的 manim 进程、不再修复重试，抛出 RuntimeError。
+    结束后按容量淘汰共享 LaTeX 缓存。
+    """
+    from . import tex_cache
+    try:
+        _render_with_self_heal(code_string, output_file, work_dir, code_suffix, cancel_event)
+    finally:
+        tex_cache.evict()
+
+
+def _raise_if_cancelled(cancel_event: threading.Event | None) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise RuntimeError("Manim 渲染已取消")
+
+
+def _speculative_parallelism(candidates: int) -> int:
+    import os
+    budget = get_settings().manim_speculative_max_renders
+    if budget <= 0:
+        budget = os.cpu_count() or 1
+    return max(1, min(candidates, budget))
+
+
+def _race_candidates(
+    candidates: list[str],
+    output_file: str | Path,
+    work_dir: str | Path | None,
+    code_suffix: str = "",
+    cancel_event: threading.Event | None = None,
+) -> tuple[str, str | None]:
+    """
+    推测式自愈的一轮：静态检查各候选后并行渲染（并行数受 manim_speculative_max_renders 限制），
+    第一个成功的候选写入 output_file 并取消其余渲染，返回 (该候选, None)；
+    全部失败时返回 (排在最前的候选, 其报错)，供下一轮继续修复。cancel_event 被设置时取消全部候选并抛出 RuntimeError。
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    from .manim_validate import ManimCodeError
+    failures: dict[str, str] = {}
+    runnable: list[str] = []
+    for cand in candidates:
+        try:
+            precheck_manim_code(cand)
+            runnable.append(cand)
+        except ManimCodeError as e:
+            failures[cand] = str(e)
+    if runnable:
+        cancel = threading.Event()
+        if cancel_event is not None:
+            # 外部取消转发到本轮的取消信号；本轮结束（cancel 被置位）后线程退出
+            def _forward() -> None:
+                while not cancel.wait(0.2):
+                    if cancel_event.is_set():
+                        cancel.set()
+            threading.Thread(target=_forward, daemon=True).start()
+        parallel = _speculative_parallelism(len(runnable))
+        logger.info("[manim] 推测式自愈：%d 个候选，并行渲染 %d 个", len(runnable), parallel)
+        spec_dir = Path(work_dir) / "speculative" if work_dir is not None else None
+        with _render_dir(spec_dir) as base:
+            base = Path(base)
+
+            def run(i: int, cand: str) -> Path:
+                out = base / f"candidate_{i}.mp4"
+                render_manim_video(cand, out, base / f"candidate_{i}", cancel_event=cancel, code_suffix=code_suffix)
+                return out
+
+            winner: tuple[str, Path] | None = None
+            try:
+                with ThreadPoolExecutor(max_workers=parallel) as pool:
+                    futures = {pool.submit(run, i, cand): cand for i, cand in enumerate(runnable)}
+                    for fut in as_completed(futures):
+                        try:
+                            path = fut.result()
+                        except FileNotFoundError:
+                            cancel.set()
+                            raise
+                        except Exception as e:
+                            if not cancel.is_set():
+                                failures[futures[fut]] = str(e)
+                            continue
+                        if winner is None:
+                            winner = (futures[fut], path)
+                            cancel.set()
+                            for other in futures:
+                                other.cancel()
+            finally:
+                cancel.set()
+            _raise_if_cancelled(cancel_event)
+            if winner is not None:
+                out_path = Path(output_file).resolve()
+                out_path.parent.mkdir(parents=True, exist_ok=True)
+                _publish_video(winner[1], out_path)
+                logger.info("[manim] 推测式自愈：候选 %d 渲染成功，其余已取消", candidates.index(winner[0]) + 1)
+                return winner[0], None
+    first = next(cand for cand in candidates if cand in failures)
+    return first, failures[first]
+
+
+def _render_with_self_heal(
+    code_string: str,
+    output_file: str | Path,
+    work_dir: str | Path | None,
+    code_suffix: str = "",
+    cancel_event: threading.Event | None = None,
+) -> None:
     settings = get_settings()
+    if settings.manim_render_mode == "sharded":
+        if code_suffix:
+            raise ValueError("分段渲染不支持追加 code_suffix")
+        from .manim_shard import render_manim_video_sharded_with_self_heal
+        return render_manim_video_sharded_with_self_heal(code_string, output_file, work_dir, cancel_event=cancel_event)
     max_attempts = settings.manim_self_heal_max_attempts
+    # 推测式自愈：每轮并发请求 k 份候选修复并行渲染，取第一个成功的
+    k = settings.manim_speculative_fixes
     current_code = code_string
     last_error: str | None = None
+    fixer = CodeFixer()
     for attempt in range(max_attempts):
+        _raise_if_cancelled(cancel_event)
+        candidates = [current_code]
+        if attempt > 0:
+            candidates = fixer.candidates(current_code, last_error, max(1, k))
         try:
-            render_manim_video(current_code, output_file)
+            if len(candidates) > 1:
+                chosen, error = _race_candidates(candidates, output_file, work_dir, code_suffix, cancel_event)
+                fixer.adopt(current_code, chosen, last_error)
+                current_code = chosen
+                if error is None:
+                    fixer.report(None)
+                    return
+                last_error = error
+                continue
+            current_code = candidates[0]
+            precheck_manim_code(current_code)
+            render_manim_video(current_code, output_file, work_dir, cancel_event=cancel_event, code_suffix=code_suffix)
+            fixer.report(None)
             return
         except FileNotFoundError as e:
             # 未安装 manim 等环境问题，不重试
@@ -139,8 +669,8 @@ def render_manim_video_with_self_heal(code_string: str, output_file: str | Path)
                 "请安装 Manim: uv sync（见 README 系统依赖）或 pip install manim，并用 uv run 启动服务。"
             ) from e
         except Exception as e:
+            # 被取消的渲染不是代码错误，不记入修复知识库、也不再修复
+            _raise_if_cancelled(cancel_event)
             last_error = str(e)
-            if attempt == max_attempts - 1:
-                raise RuntimeError(f"Manim 自愈已达最大重试次数 {max_attempts}，最后错误: {last_error}") from e
-            current_code = fix_code_with_llm(current_code, last_error)
-    raise RuntimeError(f"Manim 自愈失败: {last_error}")
+    fixer.report(last_error)
+    raise RuntimeError(f"Manim 自愈已达最大重试次数 {max_attempts}，最后错误: {last_error}")
@@ -0,0 +1,228 @@
+"""
+Manim 分段并行渲染：先 dry-run 预演场景，记录每次 self.wait() 结束时的动画序号作为步骤边界；
+按边界把场景切成若干段，各段以 `manim -n 起,止` 在独立进程中并行渲染（其余动画只执行不出帧，场景状态保持一致），
+最后用 FFmpeg concat 无损拼接为一个 mp4。某段失败时修复代码后重渲；已成功的分段仅在代码未变时复用，避免拼接出新旧两版代码的画面。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from config import get_settings
+
+from . import tex_cache
+from .manim_render import (
+    CodeFixer,
+    _find_rendered_mp4,
+    _raise_if_cancelled,
+    _record_phase,
+    _render_dir,
+    _run_manim,
+    _strip_markdown_code_block,
+    precheck_manim_code,
+)
+
+logger = logging.getLogger(__name__)
+
+# 追加到预演场景末尾：包装 Scene.wait / tear_down，把步骤边界写到 MANIM_SHARD_PROBE 指定的文件
+_PROBE_SUFFIX = '''
+
+# ---- 分段渲染边界探测（由 manim_shard 追加）----
+def _shard_probe_install():
+    import json as _json
+    import os as _os
+    from manim import Scene as _Scene
+    out = _os.environ.get("MANIM_SHARD_PROBE")
+    if not out or getattr(_Scene, "_shard_probe_installed", False):
+        return
+    marks = []
+    orig_wait = _Scene.wait
+    orig_tear_down = _Scene.tear_down
+
+    def wait(self, *args, **kwargs):
+        result = orig_wait(self, *args, **kwargs)
+        marks.append(self.renderer.num_plays)
+        return result
+
+    def tear_down(self):
+        orig_tear_down(self)
+        with open(out, "w", encoding="utf-8") as f:
+            _json.dump({"marks": marks, "num_plays": self.renderer.num_plays}, f)
+
+    _Scene.wait = wait
+    _Scene.tear_down = tear_down
+    _Scene._shard_probe_installed = True
+
+
+_shard_probe_install()
+'''
+
+
+@dataclass(frozen=True)
+class Segment:
+    """一个渲染分段：动画序号闭区间 [start, end]（从 0 开始，与 manim -n 一致）。"""
+
+    index: int
+    start: int
+    end: int
+
+
+def probe_step_boundaries(
+    code: str, work_dir: Path, cancel_event: threading.Event | None = None
+) -> tuple[list[int], int]:
+    """
+    dry-run 预演场景，返回 (每次 self.wait() 后已播放的动画数列表, 动画总数)。
+    预演失败（语法/运行时错误）抛出 RuntimeError，信息供自愈使用。
+    """
+    work_dir.mkdir(parents=True, exist_ok=True)
+    scene_py = work_dir / "scene_probe.py"
+    probe_out = work_dir / "boundaries.json"
+    probe_out.unlink(missing_ok=True)
+    scene_py.write_text(code + tex_cache.scene_suffix() + _PROBE_SUFFIX, encoding="utf-8")
+    start = time.monotonic()
+    proc = _run_manim(scene_py, work_dir, ["--dry_run"], env={"MANIM_SHARD_PROBE": str(probe_out)}, cancel_event=cancel_event)
+    _record_phase("dry_run", time.monotonic() - start, ok=proc.returncode == 0)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Manim 预演失败 (exit {proc.returncode}): {proc.stderr or proc.stdout}")
+    if not probe_out.is_file():
+        raise RuntimeError("Manim 预演未产生步骤边界信息（场景是否为 SolutionScene？）")
+    data = json.loads(probe_out.read_text(encoding="utf-8"))
+    return [int(m) for m in data["marks"]], int(data["num_plays"])
+
+
+def plan_segments(marks: list[int], num_plays: int, workers: int) -> list[Segment]:
+    """
+    在步骤边界中挑选至多 workers-1 个切点，使各段动画数尽量均衡。
+    切点需 ≥2：manim 把 upto_animation_number=0 视为不限制，首段至少包含两个动画。
+    """
+    if num_plays <= 0:
+        return [Segment(0, 0, 0)]
+    candidates = sorted({m for m in marks if 2 <= m < num_plays})
+    cuts: list[int] = []
+    for j in range(1, max(1, workers)):
+        if not candidates:
+            break
+        target = num_plays * j / workers
+        best = min(candidates, key=lambda m: abs(m - target))
+        if best not in cuts:
+            cuts.append(best)
+    cuts.sort()
+    bounds = [0, *cuts, num_plays]
+    return [Segment(i, bounds[i], bounds[i + 1] - 1) for i in range(len(bounds) - 1)]
+
+
+def _render_segment(
+    scene_py: Path, seg: Segment, work_dir: Path, cancel_event: threading.Event | None = None
+) -> Path:
+    """在独立目录中渲染单个分段，返回分段 mp4 路径；失败抛出 RuntimeError。同一起止序号的分段跨尝试使用同一目录，复用 Manim 分段缓存。"""
+    seg_dir = work_dir / f"seg_{seg.index}_{seg.start}_{seg.end}"
+    seg_dir.mkdir(parents=True, exist_ok=True)
+    proc = _run_manim(scene_py, seg_dir, ["-n", f"{seg.start},{seg.end}"], cancel_event=cancel_event)
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f"Manim 分段 {seg.index}（动画 {seg.start}-{seg.end}）渲染失败 (exit {proc.returncode}): {proc.stderr or proc.stdout}"
+        )
+    mp4 = _find_rendered_mp4(seg_dir / "media")
+    if mp4 is None:
+        raise RuntimeError(f"Manim 分段 {seg.index} 未生成 mp4 文件")
+    return mp4
+
+
+def concat_segments(paths: list[Path], output_file: Path, cancel_event: threading.Event | None = None) -> None:
+    """FFmpeg concat demuxer 流拷贝拼接各分段（编码参数一致，无需重编码）。"""
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    if len(paths) == 1:
+        import shutil
+        shutil.copy(str(paths[0]), str(output_file))
+        return
+    list_path = output_file.parent / f".{output_file.stem}_segments.txt"
+    list_path.write_text("".join(f"file '{p.resolve()}'\n" for p in paths), encoding="utf-8")
+    from composition.ffmpeg_compose import run_command
+    try:
+        proc = run_command(
+            [get_settings().ffmpeg_command, "-y", "-f", "concat", "-safe", "0", "-i", str(list_path), "-c", "copy", str(output_file)],
+            timeout=300,
+            cancel_event=cancel_event,
+        )
+    finally:
+        list_path.unlink(missing_ok=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"分段拼接失败 (exit {proc.returncode}): {proc.stderr or proc.stdout}")
+
+
+def _shard_workers() -> int:
+    configured = get_settings().manim_shard_workers
+    return configured if configured > 0 else (os.cpu_count() or 1)
+
+
+def render_manim_video_sharded_with_self_heal(
+    code_string: str,
+    output_file: str | Path,
+    work_dir: str | Path | None = None,
+    *,
+    cancel_event: threading.Event | None = None,
+) -> None:
+    """
+    分段并行渲染 + 分段自愈：预演失败则整体修复；部分分段失败时只把失败信息交给 LLM 修复。
+    已成功的分段按 (代码哈希, 起止序号) 复用：修复改动了代码时全部分段以新代码重渲，只有代码未变（如偶发失败后原样重试）时才复用。
+    最多 manim_self_heal_max_attempts 次。
+    work_dir 为任务级固定渲染目录时，分段目录跨断点重试保留。
+    cancel_event 被设置时结束正在运行的 manim/FFmpeg 进程、不再修复重试，抛出 RuntimeError。
+    """
+    max_attempts = get_settings().manim_self_heal_max_attempts
+    workers = _shard_workers()
+    out_path = Path(output_file).resolve()
+    current_code = _strip_markdown_code_block(code_string)
+    done: dict[tuple[str, int, int], Path] = {}
+    last_error: str | None = None
+    fixer = CodeFixer()
+    with _render_dir(work_dir) as tmpdir:
+        tmp = Path(tmpdir)
+        for attempt in range(max_attempts):
+            _raise_if_cancelled(cancel_event)
+            attempt_dir = tmp / f"attempt_{attempt}"
+            try:
+                precheck_manim_code(current_code)
+                marks, num_plays = probe_step_boundaries(current_code, attempt_dir, cancel_event)
+                segments = plan_segments(marks, num_plays, workers)
+                scene_py = attempt_dir / "scene.py"
+                scene_py.write_text(current_code + tex_cache.scene_suffix(), encoding="utf-8")
+                code_hash = hashlib.sha256(current_code.encode("utf-8")).hexdigest()
+                todo = [seg for seg in segments if (code_hash, seg.start, seg.end) not in done]
+                logger.info(
+                    "[manim_shard] 第 %d 次：共 %d 段，复用 %d 段，渲染 %d 段（并行 %d）",
+                    attempt + 1, len(segments), len(segments) - len(todo), len(todo), workers,
+                )
+                errors: list[str] = []
+                with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+                    futures = {seg: pool.submit(_render_segment, scene_py, seg, tmp, cancel_event) for seg in todo}
+                    for seg, fut in futures.items():
+                        try:
+                            done[(code_hash, seg.start, seg.end)] = fut.result()
+                        except RuntimeError as e:
+                            errors.append(str(e))
+                if not errors:
+                    concat_segments([done[(code_hash, seg.start, seg.end)] for seg in segments], out_path, cancel_event)
+                    fixer.report(None)
+                    return
+                # 第一个失败分段的错误最接近出错的步骤
+                last_error = errors[0]
+            except FileNotFoundError as e:
+                raise RuntimeError(
+                    f"Manim 渲染失败（环境问题）: {e}. "
+                    "请安装 Manim: uv sync（见 README 系统依赖）或 pip install manim，并用 uv run 启动服务。"
+                ) from e
+            except Exception as e:
+                _raise_if_cancelled(cancel_event)
+                last_error = str(e)
+            _raise_if_cancelled(cancel_event)
+            if attempt == max_attempts - 1:
+                fixer.report(last_error)
+                raise RuntimeError(f"Manim 自愈已达最大重试次数 {max_attempts}，最后错误: {last_error}")
+            current_code = _strip_markdown_code_block(fixer.fix(current_code, last_error))
+    raise RuntimeError(f"Manim 自愈失败: {last_error}")
@@ -0,0 +1,212 @@
+"""
+渲染前的 Manim 代码静态检查：用 ast 解析，检查 SolutionScene / construct / self.wait() 是否存在，
+并对照已安装 manim 的命名空间找出未定义的名字和 Scene 上不存在的 self.xxx() 调用。
+检查不通过时直接把错误交给 LLM 修复，省去一次 manim 进程启动。
+"""
+import ast
+import builtins
+import functools
+import json
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# 在装有 manim 的解释器中导出 manim 顶层名字与各 Scene 子类（Scene、MovingCameraScene 等）的属性
+_NAMESPACE_SCRIPT = """
+import json, manim
+names = sorted(set(getattr(manim, "__all__", None) or []) | set(dir(manim)))
+scenes = {}
+for n in names:
+    obj = getattr(manim, n, None)
+    if isinstance(obj, type) and issubclass(obj, manim.Scene):
+        scenes[n] = dir(obj)
+print(json.dumps({"names": names, "scenes": scenes}))
+"""
+
+Namespace = tuple[frozenset[str], dict[str, frozenset[str]]]
+
+
+class ManimCodeError(RuntimeError):
+    """静态检查发现的代码问题（错误信息格式与运行时报错相近，直接供自愈使用）。"""
+
+
+@functools.lru_cache(maxsize=4)
+def _load_manim_namespace(python: str) -> Namespace | None:
+    try:
+        proc = subprocess.run([python, "-c", _NAMESPACE_SCRIPT], capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.info("[manim_validate] 读取 manim 命名空间失败: %s", e)
+        return None
+    if proc.returncode != 0:
+        return None
+    data = json.loads(proc.stdout)
+    return frozenset(data["names"]), {k: frozenset(v) for k, v in data["scenes"].items()}
+
+
+def manim_namespace() -> Namespace | None:
+    """返回 (manim 顶层名字, {Scene 子类名: 属性})；找不到 manim 时返回 None（此时只做语法与结构检查）。"""
+    from .tex_cache import _manim_python
+    python = _manim_python()
+    return _load_manim_namespace(python) if python else None
+
+
+class _Binder(ast.NodeVisitor):
+    """收集模块内所有绑定的名字（不区分作用域，宁可漏报不误报）与 star import 来源。"""
+
+    def __init__(self):
+        self.bound: set[str] = set()
+        self.star_modules: list[str] = []
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            self.bound.add(alias.asname or alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        for alias in node.names:
+            if alias.name == "*":
+                self.star_modules.append(node.module or "")
+            else:
+                self.bound.add(alias.asname or alias.name)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, (ast.Store, ast.Del)):
+            self.bound.add(node.id)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self.bound.add(node.name)
+        self._bind_args(node.args)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node: ast.Lambda) -> None:
+        self._bind_args(node.args)
+        self.generic_visit(node)
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> None:
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Global(self, node: ast.Global) -> None:
+        self.bound.update(node.names)
+
+    def visit_MatchAs(self, node: ast.MatchAs) -> None:
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def _bind_args(self, args: ast.arguments) -> None:
+        for a in (*args.posonlyargs, *args.args, *args.kwonlyargs, args.vararg, args.kwarg):
+            if a is not None:
+                self.bound.add(a.arg)
+
+
+def _find_scene(tree: ast.Module) -> ast.ClassDef | None:
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == "SolutionScene":
+            return node
+    return None
+
+
+def _self_attrs(scene: ast.ClassDef) -> set[str]:
+    """SolutionScene 自身定义的方法/类属性，以及 self.xxx = ... 赋值的属性。"""
+    attrs: set[str] = set()
+    for stmt in scene.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            attrs.add(stmt.name)
+        elif isinstance(stmt, ast.Assign):
+            attrs.update(t.id for t in stmt.targets if isinstance(t, ast.Name))
+        elif isinstance(stmt, ast.AnnAssign) and isinstance(stmt.target, ast.Name):
+            attrs.add(stmt.target.id)
+    for node in ast.walk(scene):
+        if (
+            isinstance(node, ast.Attribute)
+            and isinstance(node.ctx, ast.Store)
+            and isinstance(node.value, ast.Name)
+            and node.value.id == "self"
+        ):
+            attrs.add(node.attr)
+    return attrs
+
+
+def _base_attrs(scene: ast.ClassDef, scenes: dict[str, frozenset[str]]) -> frozenset[str] | None:
+    """SolutionScene 各基类（须都是 manim 的 Scene 子类）属性的并集；有无法识别的基类时返回 None。"""
+    attrs: set[str] = set()
+    for base in scene.bases:
+        name = base.id if isinstance(base, ast.Name) else base.attr if isinstance(base, ast.Attribute) else None
+        if name not in scenes:
+            return None
+        attrs |= scenes[name]
+    return frozenset(attrs) if scene.bases else None
+
+
+def validate_manim_code(code: str, namespace: Namespace | None = None) -> list[str]:
+    """
+    静态检查 Manim 代码，返回错误信息列表（空列表表示通过）。
+    namespace 见 manim_namespace()，为 None 时跳过名字解析，只检查语法与场景结构。
+    """
+    try:
+        tree = ast.parse(code, filename="scene.py")
+    except SyntaxError as e:
+        line = (e.text or "").rstrip()
+        return [f'File "scene.py", line {e.lineno}\n    {line}\nSyntaxError: {e.msg}']
+
+    errors: list[str] = []
+    scene = _find_scene(tree)
+    if scene is None:
+        errors.append("缺少 SolutionScene 类：渲染命令固定渲染 SolutionScene，请定义 class SolutionScene(Scene)。")
+    elif not any(isinstance(n, ast.FunctionDef) and n.name == "construct" for n in scene.body):
+        errors.append("SolutionScene 缺少 construct(self) 方法。")
+    waits = [
+        n for n in ast.walk(tree)
+        if isinstance(n, ast.Call) and isinstance(n.func, ast.Attribute) and n.func.attr == "wait"
+        and isinstance(n.func.value, ast.Name) and n.func.value.id == "self"
+    ]
+    if not waits:
+        errors.append("代码中没有 self.wait()：每个讲解步骤结束处需保留 self.wait() 占位，用于与旁白时长对齐。")
+
+    if namespace is None:
+        return errors
+    manim_names, scenes = namespace
+    binder = _Binder()
+    binder.visit(tree)
+    # 除 manim 外的 star import 无法确定引入了哪些名字，跳过未定义名字检查
+    if all(m == "manim" or m.startswith("manim.") for m in binder.star_modules):
+        known = binder.bound | set(dir(builtins)) | {"__name__", "__file__"}
+        if binder.star_modules:
+            known |= manim_names
+        reported: set[str] = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in known:
+                if node.id not in reported:
+                    reported.add(node.id)
+                    errors.append(f"NameError: name '{node.id}' is not defined (line {node.lineno})")
+    scene_attrs = _base_attrs(scene, scenes) if scene is not None else None
+    if scene_attrs is not None:
+        own = _self_attrs(scene)
+        for node in ast.walk(scene):
+            if (
+                isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Attribute)
+                and isinstance(node.func.value, ast.Name)
+                and node.func.value.id == "self"
+                and node.func.attr not in scene_attrs
+                and node.func.attr not in own
+            ):
+                errors.append(
+                    f"AttributeError: 'SolutionScene' object has no attribute '{node.func.attr}' (line {node.lineno})"
+                )
+    return errors
+
+
+def check_manim_code(code: str) -> None:
+    """静态检查不通过时抛出 ManimCodeError（附全部问题），供自愈循环直接交给 LLM 修复。"""
+    errors = validate_manim_code(code, manim_namespace())
+    if errors:
+        raise ManimCodeError("Manim 代码静态检查未通过:\n" + "\n".join(errors))
@@ -0,0 +1,288 @@
+"""
+常驻 Manim 渲染进程池：worker 进程启动时预先 import manim / numpy / cairo，之后通过管道接收场景文件路径并在进程内渲染，
+返回成片路径或完整 traceback，省去每次渲染尝试的解释器启动与导入开销。
+worker 取用前做健康检查，处理 N 个任务或常驻内存超限后回收重建；池不可用时由调用方回退到 subprocess 渲染。
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from pathlib import Path
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# worker 启动（导入 manim）与健康检查的超时秒数
+_READY_TIMEOUT = 120.0
+_PING_TIMEOUT = 5.0
+
+
+class WorkerUnavailable(RuntimeError):
+    """worker 无法启动、崩溃或超时；调用方应回退到 subprocess 渲染。"""
+
+
+def _current_rss_mb() -> float:
+    """当前进程常驻内存（MB）：Linux 读 /proc/self/statm，其他平台退回峰值 RSS。"""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _render_in_worker(job: dict, seq: int) -> str:
+    """在 worker 进程内渲染 job["scene_py"] 中的 SolutionScene，返回成片路径（dry_run 时为空串）。"""
+    import importlib.util
+    import sys
+
+    from manim import tempconfig
+
+    scene_py = Path(job["scene_py"])
+    work_dir = Path(job["work_dir"])
+    module_name = f"_manim_job_{seq}"
+    overrides = {
+        "quality": "low_quality",
+        "media_dir": str(work_dir / "media"),
+        "input_file": str(scene_py),
+        **job.get("config", {}),
+    }
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        with tempconfig(overrides):
+            spec = importlib.util.spec_from_file_location(module_name, scene_py)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            scene = module.SolutionScene()
+            scene.render()
+            # dry_run 时不写文件，没有 movie_file_path
+            movie = getattr(scene.renderer.file_writer, "movie_file_path", None)
+            return str(movie) if movie else ""
+    finally:
+        sys.modules.pop(module_name, None)
+        os.chdir(cwd)
+
+
+def _worker_main(conn: Connection) -> None:
+    """worker 进程入口：预导入 manim 后循环处理 ping / render / stop 消息。"""
+    import traceback
+    try:
+        import manim  # noqa: F401
+    except Exception:
+        conn.send({"ready": False, "error": traceback.format_exc()})
+        return
+    conn.send({"ready": True})
+    seq = 0
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        kind = job.get("type")
+        if kind == "stop":
+            return
+        if kind == "ping":
+            conn.send({"ok": True, "rss_mb": _current_rss_mb()})
+            continue
+        seq += 1
+        try:
+            path = _render_in_worker(job, seq)
+            conn.send({"ok": True, "path": path, "rss_mb": _current_rss_mb()})
+        except Exception:
+            conn.send({"ok": False, "error": traceback.format_exc(), "rss_mb": _current_rss_mb()})
+
+
+@dataclass
+class _Worker:
+    process: multiprocessing.process.BaseProcess
+    conn: Connection
+    jobs: int = 0
+    rss_mb: float = 0.0
+
+    def call(self, message: dict, timeout: float) -> dict:
+        try:
+            self.conn.send(message)
+            ready = self.conn.poll(timeout)
+            result = self.conn.recv() if ready else None
+        except (EOFError, OSError) as e:
+            raise WorkerUnavailable(f"worker 连接中断: {e}") from e
+        if not ready:
+            raise TimeoutError(f"worker 响应超时（{timeout}s）")
+        return result
+
+    def stop(self) -> None:
+        try:
+            self.conn.send({"type": "stop"})
+        except OSError:
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=2)
+        self.conn.close()
+
+
+class ManimWorkerPool:
+    """固定上限的 worker 池：按需启动，取用时健康检查，超过 max_jobs 或 max_rss_mb 的 worker 用完即回收。"""
+
+    def __init__(self, size: int, *, max_jobs: int, max_rss_mb: float):
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: list[_Worker] = []
+        self._total = 0
+        self._cond = threading.Condition()
+        self._broken: str | None = None
+        # 计数在多个渲染线程中更新，统一经 bump() 在 _cond 的锁内修改
+        self._stats = {"jobs": 0, "spawned": 0, "recycled": 0, "crashed": 0, "fallbacks": 0}
+
+    def bump(self, name: str, n: int = 1) -> None:
+        """计数加 n（线程安全）；调用方回退 subprocess 渲染时记 fallbacks。"""
+        with self._cond:
+            self._stats[name] += n
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn,), daemon=True, name="manim-worker")
+        process.start()
+        child_conn.close()
+        worker = _Worker(process=process, conn=parent_conn)
+        if not parent_conn.poll(_READY_TIMEOUT):
+            worker.stop()
+            raise WorkerUnavailable("worker 启动超时")
+        ready = parent_conn.recv()
+        if not ready.get("ready"):
+            worker.stop()
+            # 导入失败说明环境缺 manim，后续不再尝试启动
+            self._broken = ready.get("error") or "worker 启动失败"
+            raise WorkerUnavailable(self._broken)
+        self.bump("spawned")
+        logger.info("[manim_worker] 启动 worker pid=%s", process.pid)
+        return worker
+
+    def _acquire(self) -> _Worker:
+        with self._cond:
+            if self._broken:
+                raise WorkerUnavailable(self._broken)
+            while not self._idle and self._total >= self.size:
+                self._cond.wait()
+            if self._idle:
+                worker = self._idle.pop()
+            else:
+                self._total += 1
+                worker = None
+        if worker is None:
+            try:
+                return self._spawn()
+            except BaseException:
+                self._discard(None)
+                raise
+        # 健康检查：进程存活且能响应 ping，否则换一个新 worker
+        try:
+            if not worker.process.is_alive():
+                raise WorkerUnavailable("worker 已退出")
+            worker.call({"type": "ping"}, _PING_TIMEOUT)
+            return worker
+        except (WorkerUnavailable, TimeoutError):
+            self.bump("crashed")
+            worker.stop()
+            try:
+                return self._spawn()
+            except BaseException:
+                self._discard(None)
+                raise
+
+    def _discard(self, worker: _Worker | None) -> None:
+        if worker is not None:
+            worker.stop()
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def _release(self, worker: _Worker) -> None:
+        if worker.jobs >= self.max_jobs or worker.rss_mb > self.max_rss_mb:
+            logger.info(
+                "[manim_worker] 回收 worker pid=%s jobs=%d rss=%.0fMB",
+                worker.process.pid, worker.jobs, worker.rss_mb,
+            )
+            self.bump("recycled")
+            self._discard(worker)
+            return
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def render(self, scene_py: Path, work_dir: Path, *, timeout: float = 300, config: dict | None = None) -> Path | None:
+        """
+        在 worker 中渲染 scene_py，返回成片 mp4 路径（config 含 dry_run 时只执行 construct、不出片，返回 None）。
+        场景代码出错或渲染超时抛出 RuntimeError（附 traceback，供自愈）；worker 无法启动或崩溃抛出 WorkerUnavailable。
+        """
+        worker = self._acquire()
+        job = {"type": "render", "scene_py": str(scene_py), "work_dir": str(work_dir), "config": config or {}}
+        try:
+            result = worker.call(job, timeout)
+        except TimeoutError as e:
+            # 超时的 worker 状态未知，直接杀掉；渲染超时视为代码问题交给自愈
+            self.bump("crashed")
+            self._discard(worker)
+            raise RuntimeError(f"Manim 渲染超时（{timeout}s）") from e
+        except WorkerUnavailable:
+            self.bump("crashed")
+            self._discard(worker)
+            raise
+        worker.jobs += 1
+        worker.rss_mb = float(result.get("rss_mb") or 0.0)
+        self.bump("jobs")
+        self._release(worker)
+        if not result.get("ok"):
+            raise RuntimeError(f"Manim 渲染失败 (worker): {result.get('error')}")
+        return Path(result["path"]) if result.get("path") else None
+
+    def shutdown(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            return {**self._stats, "size": self.size, "alive": self._total, "idle": len(self._idle)}
+
+
+_pool: ManimWorkerPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> ManimWorkerPool | None:
+    """返回进程内共享的 worker 池；manim_worker_pool_size 为 0 时返回 None（不启用）。"""
+    global _pool
+    s = get_settings()
+    if s.manim_worker_pool_size <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ManimWorkerPool(
+                s.manim_worker_pool_size,
+                max_jobs=s.manim_worker_max_jobs,
+                max_rss_mb=s.manim_worker_max_rss_mb,
+            )
+        return _pool
+
+
+def shutdown_worker_pool() -> None:
+    """停止所有空闲 worker（应用退出时调用）。"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,172 @@
+"""
+Manim 渲染缓存（compose 对齐模式）：按 (场景代码, 追加片段, 渲染参数) 内容寻址，保存 manim.mp4、步骤标记与各分段文件。
+标记渲染与旁白时长无关，换音色、改语速时命中缓存即可跳过渲染，只重跑 TTS 与合成阶段的补帧。按总大小 LRU 淘汰。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "render_cache"
+
+# 渲染参数或缓存布局变化时递增，使旧条目不再命中
+_FORMAT_VERSION = "1"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+
+def _bump(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def is_enabled() -> bool:
+    return get_settings().render_cache_enabled
+
+
+def _cache_dir() -> Path:
+    configured = get_settings().render_cache_dir
+    return Path(configured) if configured else DEFAULT_CACHE_DIR
+
+
+def make_key(code: str, code_suffix: str = "") -> str:
+    """缓存键：去掉 markdown 包裹后的代码 + 追加片段（含标记 wait 时长）+ 渲染画质（固定 -ql）与布局版本。"""
+    from .manim_render import _strip_markdown_code_block
+    raw = f"{_FORMAT_VERSION}\0-ql\0{_strip_markdown_code_block(code)}\0{code_suffix}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_dir(key: str) -> Path:
+    return _cache_dir() / key[:2] / key
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """硬链接 src 到 dst（跨文件系统等失败时退回复制）。dst 已存在则先删除，避免写穿共享 inode。"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def fetch(key: str, video_path: str | Path, partials_dir: str | Path) -> bool:
+    """
+    命中时把缓存的成片硬链接到 video_path、分段文件硬链接到 partials_dir，并写出指向这些分段的 <video>.steps.json。
+    分段链接到任务目录后与缓存淘汰互不影响。未命中或缓存条目不完整时返回 False。
+    """
+    entry = _entry_dir(key)
+    video = Path(video_path)
+    try:
+        data = json.loads((entry / "steps.json").read_text(encoding="utf-8"))
+        partials_out = Path(partials_dir)
+        partials: list[str | None] = []
+        for name in data.get("partials") or []:
+            if not name:
+                partials.append(None)
+                continue
+            _link_or_copy(entry / name, partials_out / name)
+            partials.append(str((partials_out / name).resolve()))
+        _link_or_copy(entry / "video.mp4", video)
+        Path(f"{video}.steps.json").write_text(
+            json.dumps({**data, "partials": partials}, ensure_ascii=False), encoding="utf-8"
+        )
+        os.utime(entry)
+    except (FileNotFoundError, OSError, json.JSONDecodeError, TypeError):
+        _bump("misses")
+        return False
+    _bump("hits")
+    return True
+
+
+def store(key: str, video_path: str | Path) -> None:
+    """
+    把渲染产物（成片、步骤标记及其引用的分段文件）写入缓存：先在临时目录组装，再整体改名为条目目录，读者看不到半成品。
+    没有步骤标记或分段缺失时不缓存。写入后按总大小淘汰；渲染远比 TTS 稀疏，这里直接扫描条目目录。
+    """
+    video = Path(video_path)
+    entry = _entry_dir(key)
+    if entry.is_dir():
+        return
+    try:
+        data = json.loads(Path(f"{video}.steps.json").read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return
+    tmp = entry.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.mkdir(parents=True)
+        names: list[str | None] = []
+        for i, src in enumerate(data.get("partials") or []):
+            if not src:
+                names.append(None)
+                continue
+            name = f"partial_{i:05d}{Path(src).suffix or '.mp4'}"
+            _link_or_copy(Path(src), tmp / name)
+            names.append(name)
+        _link_or_copy(video, tmp / "video.mp4")
+        (tmp / "steps.json").write_text(json.dumps({**data, "partials": names}, ensure_ascii=False), encoding="utf-8")
+        os.rename(tmp, entry)
+    except OSError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not entry.is_dir():
+            logger.warning("[render_cache] 写入缓存失败: %s", e)
+        return
+    _bump("stores")
+    evict()
+
+
+def _dir_bytes(path: Path) -> int:
+    total = 0
+    for p in path.iterdir():
+        try:
+            total += p.stat().st_size
+        except OSError:
+            continue
+    return total
+
+
+def evict() -> int:
+    """按条目目录的 mtime（命中时刷新）做 LRU 淘汰，直到总大小不超过 render_cache_max_bytes。返回删除条目数。"""
+    max_bytes = get_settings().render_cache_max_bytes
+    root = _cache_dir()
+    if not root.is_dir():
+        return 0
+    entries: list[tuple[float, int, Path]] = []
+    for d in root.glob("*/*"):
+        if d.name.startswith(".") or not d.is_dir():
+            continue
+        try:
+            entries.append((d.stat().st_mtime, _dir_bytes(d), d))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_bytes:
+        entries.sort(key=lambda e: e[0])
+        for _, size, d in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+            removed += 1
+    if removed:
+        _bump("evicted", removed)
+        logger.info("[render_cache] 淘汰 %d 条缓存", removed)
+    return removed
+
+
+def get_stats() -> dict:
+    """返回缓存统计：hits / misses / stores / evicted / hit_rate。"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    return stats
@@ -0,0 +1,242 @@
+"""
+跨任务共享的 LaTeX 编译缓存：所有 Manim 渲染把 tex_dir 指向同一目录，MathTex/Tex 按 TeX 源码哈希命名 svg，
+相同公式只编译一次；按最近使用淘汰。题目分析完成后可用步骤中的 math_formula 预热，与脚本生成并行编译。
+渲染与预热都经 _TEX_HOOK 访问缓存：命中时刷新 svg 的 mtime，未命中时在私有目录编译后原子移入，
+多个进程同时使用共享目录也不会读到写了一半的 svg。
+"""
+import json
+import logging
+import re
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "tex_cache"
+
+# 编译中间文件（.aux/.log/.dvi 等）保留这么久后再清理，避免删掉其他进程正在编译的文件
+_INTERMEDIATE_GRACE_SECONDS = 600
+
+# 私有编译目录名前缀（位于共享目录下，保证 os.replace 在同一文件系统内原子完成）
+_PRIVATE_PREFIX = ".compile_"
+
+# 替换 MathTex/Tex 使用的 tex_to_svg_file：命中时刷新 mtime（淘汰按最近使用而非写入时间），
+# 未命中时在私有目录编译、完成后原子移入共享目录。追加到渲染的 scene.py 末尾，也在预热脚本中执行
+_TEX_HOOK = '''
+
+# ---- LaTeX 共享缓存访问（由 tex_cache 追加）----
+def _tex_cache_hook_install():
+    import os as _os
+    import shutil as _shutil
+    import tempfile as _tempfile
+    try:
+        from manim import tempconfig as _tempconfig
+        from manim.mobject.text import tex_mobject as _tm
+        from manim.utils import tex_file_writing as _tfw
+    except ImportError:
+        return
+    if getattr(_tm, "_tex_cache_hook_installed", False) or not hasattr(_tm, "tex_to_svg_file"):
+        return
+    orig = _tm.tex_to_svg_file
+
+    def tex_to_svg_file(expression, environment=None, tex_template=None):
+        svg = _tfw.generate_tex_file(expression, environment, tex_template).with_suffix(".svg")
+        if svg.exists():
+            try:
+                _os.utime(svg)
+            except OSError:
+                pass
+            return svg
+        private = _tempfile.mkdtemp(prefix="%s", dir=str(svg.parent))
+        try:
+            with _tempconfig({"tex_dir": private}):
+                compiled = orig(expression, environment, tex_template)
+            _os.replace(compiled, svg)
+        finally:
+            _shutil.rmtree(private, ignore_errors=True)
+        return svg
+
+    _tm.tex_to_svg_file = tex_to_svg_file
+    _tm._tex_cache_hook_installed = True
+
+
+_tex_cache_hook_install()
+''' % _PRIVATE_PREFIX
+
+# 预热脚本：在装有 manim 的解释器中逐个构造 MathTex，经 _TEX_HOOK 编译并写入共享 tex_dir
+_PREWARM_SCRIPT = """
+import json, sys
+from manim import MathTex, config
+config.verbosity = "ERROR"
+config.tex_dir = sys.argv[1]
+config.no_latex_cleanup = True
+""" + _TEX_HOOK + """
+for expr in json.load(sys.stdin):
+    try:
+        MathTex(expr)
+    except Exception as e:
+        print(f"prewarm failed: {expr!r}: {e}", file=sys.stderr)
+"""
+
+_FORMULA_RE = re.compile(r"\$\$(.+?)\$\$|\$(.+?)\$", re.S)
+
+
+def is_enabled() -> bool:
+    return get_settings().tex_cache_enabled
+
+
+def cache_dir() -> Path:
+    configured = get_settings().tex_cache_dir
+    path = Path(configured) if configured else DEFAULT_CACHE_DIR
+    return path.resolve()
+
+
+def manim_config() -> dict:
+    """供进程内渲染（tempconfig）使用的配置覆盖；未启用时返回空字典。"""
+    if not is_enabled():
+        return {}
+    d = cache_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    # 共享目录下不能让 manim 清理非 svg 文件（会删掉其他进程正在编译的中间文件），改由 evict 统一清理
+    return {"tex_dir": str(d), "no_latex_cleanup": True}
+
+
+def scene_suffix() -> str:
+    """追加到渲染场景代码末尾的缓存访问钩子（见 _TEX_HOOK）；未启用时返回空串。"""
+    return _TEX_HOOK if is_enabled() else ""
+
+
+def manim_cli_args() -> list[str]:
+    """供 manim CLI 使用的参数：--config_file 指向写有共享 tex_dir 的 manim.cfg；未启用时返回空列表。"""
+    overrides = manim_config()
+    if not overrides:
+        return []
+    cfg = cache_dir() / "manim.cfg"
+    content = "[CLI]\n" + "".join(f"{k} = {v}\n" for k, v in overrides.items())
+    try:
+        if not cfg.is_file() or cfg.read_text(encoding="utf-8") != content:
+            tmp = cfg.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_text(content, encoding="utf-8")
+            tmp.replace(cfg)
+    except OSError as e:
+        logger.warning("[tex_cache] 写入 manim.cfg 失败，本次不使用共享缓存: %s", e)
+        return []
+    return ["--config_file", str(cfg)]
+
+
+def extract_formulas(steps) -> list[str]:
+    """从步骤的 math_formula 中提取 $...$ / $$...$$ 内的公式（无定界符时取整串），去重并保持顺序。"""
+    seen: dict[str, None] = {}
+    for step in steps:
+        text = (getattr(step, "math_formula", "") or "").strip()
+        if not text:
+            continue
+        parts = [a or b for a, b in _FORMULA_RE.findall(text)] or [text]
+        for part in parts:
+            part = part.strip()
+            if part:
+                seen.setdefault(part, None)
+    return list(seen)
+
+
+def _manim_python() -> str | None:
+    """返回能 import manim 的解释器路径：manim 命令为 `python -m manim` 时取其解释器，为 venv 中的 manim 脚本时取同目录 python。"""
+    from .manim_render import _get_manim_args
+    args = _get_manim_args()
+    if len(args) >= 3 and args[1] == "-m":
+        return args[0]
+    if args:
+        sibling = Path(args[0]).parent / "python"
+        if sibling.exists():
+            return str(sibling)
+    return None
+
+
+def prewarm(formulas: list[str], *, timeout: float = 120) -> bool:
+    """在子进程中编译 formulas 写入共享缓存。未启用、无公式或找不到 manim 时返回 False。"""
+    if not formulas or not is_enabled():
+        return False
+    python = _manim_python()
+    if python is None:
+        logger.info("[tex_cache] 未找到 manim，跳过公式预热")
+        return False
+    start = time.monotonic()
+    try:
+        proc = subprocess.run(
+            [python, "-c", _PREWARM_SCRIPT, str(cache_dir())],
+            input=json.dumps(formulas, ensure_ascii=False),
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("[tex_cache] 公式预热失败: %s", e)
+        return False
+    if proc.returncode != 0:
+        logger.warning("[tex_cache] 公式预热失败 (exit %d): %s", proc.returncode, proc.stderr[-500:])
+        return False
+    logger.info("[tex_cache] 预热 %d 个公式，耗时 %.1fs", len(formulas), time.monotonic() - start)
+    evict()
+    return True
+
+
+def prewarm_in_background(steps) -> threading.Thread | None:
+    """后台线程预热步骤中的公式；未启用预热或无公式时返回 None。调用方可在渲染前 join 以免与渲染重复编译。"""
+    if not get_settings().tex_cache_prewarm or not is_enabled():
+        return None
+    formulas = extract_formulas(steps)
+    if not formulas:
+        return None
+    thread = threading.Thread(target=prewarm, args=(formulas,), name="tex-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def evict() -> int:
+    """
+    清理超过宽限期的编译中间文件与私有编译目录，再按 mtime（命中时刷新，即最近使用时间）从旧到新删除 svg/tex，
+    直到总大小不超过 tex_cache_max_bytes。返回删除的公式条目数。
+    """
+    root = cache_dir()
+    if not root.is_dir():
+        return 0
+    now = time.time()
+    groups: dict[str, list[tuple[float, int, Path]]] = {}
+    for p in root.iterdir():
+        if p.is_dir() and p.name.startswith(_PRIVATE_PREFIX):
+            try:
+                if now - p.stat().st_mtime > _INTERMEDIATE_GRACE_SECONDS:
+                    import shutil
+                    shutil.rmtree(p, ignore_errors=True)
+            except OSError:
+                pass
+            continue
+        if not p.is_file() or p.name == "manim.cfg":
+            continue
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        if p.suffix not in (".svg", ".tex"):
+            if now - st.st_mtime > _INTERMEDIATE_GRACE_SECONDS:
+                p.unlink(missing_ok=True)
+            continue
+        groups.setdefault(p.stem, []).append((st.st_mtime, st.st_size, p))
+    total = sum(size for files in groups.values() for _, size, _ in files)
+    max_bytes = get_settings().tex_cache_max_bytes
+    removed = 0
+    if total > max_bytes:
+        for stem in sorted(groups, key=lambda k: max(m for m, _, _ in groups[k])):
+            if total <= max_bytes:
+                break
+            for _, size, p in groups[stem]:
+                p.unlink(missing_ok=True)
+                total -= size
+            removed += 1
+    if removed:
+        logger.info("[tex_cache] 淘汰 %d 个公式缓存", removed)
+    return removed
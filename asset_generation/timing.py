@@ -30,3 +30,50 @@ def inject_timing_into_code(
         else:
             new_lines.append(line)
     return "\n".join(new_lines)
+
+
+# 渲染时追加到 scene.py 末尾：无参数的 self.wait() 只渲染标记时长，并记录其所在的分段文件；
+# 场景结束时把标记写到成片旁的 <movie>.steps.json，供合成阶段按音频时长定格补帧
+_STEP_MARKER_SUFFIX = '''
+
+
+# ---- 步骤标记（渲染时追加）----
+def _install_step_markers(scene_cls, marker):
+    import json
+    from pathlib import Path
+    base_wait = scene_cls.wait
+    base_tear_down = scene_cls.tear_down
+
+    def wait(self, *args, **kwargs):
+        if args or kwargs:
+            return base_wait(self, *args, **kwargs)
+        base_wait(self, marker)
+        partials = getattr(self.renderer.file_writer, "partial_movie_files", None) or []
+        self.__dict__.setdefault("_step_marks", []).append(
+            {{"time": float(self.renderer.time), "partial": len(partials) - 1, "wait": marker}}
+        )
+
+    def tear_down(self):
+        base_tear_down(self)
+        movie = getattr(self.renderer.file_writer, "movie_file_path", None)
+        if movie:
+            partials = getattr(self.renderer.file_writer, "partial_movie_files", None) or []
+            data = {{"marks": self.__dict__.get("_step_marks", []), "partials": [str(p) if p else None for p in partials]}}
+            Path(str(movie) + ".steps.json").write_text(json.dumps(data), encoding="utf-8")
+
+    scene_cls.wait = wait
+    scene_cls.tear_down = tear_down
+
+
+_install_step_markers(SolutionScene, {marker!r})
+'''
+
+
+def step_marker_suffix(marker_wait: float | None = None) -> str:
+    """
+    返回渲染时追加到代码末尾的步骤标记片段（compose 对齐模式）：self.wait() 占位只渲染 marker_wait 秒，
+    并在成片旁写出各占位结束时刻与所在分段文件，见 composition.retime。
+    """
+    if marker_wait is None:
+        marker_wait = get_settings().timing_marker_wait_seconds
+    return _STEP_MARKER_SUFFIX.format(marker=float(marker_wait))
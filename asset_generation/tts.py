@@ -1,54 +1,45 @@
-"""TTS 生成语音并返回时长（秒）。"""
+"""TTS 生成语音并返回时长（秒）。按步骤批量合成时并发执行，失败步骤单独重试。"""
 import asyncio
+import logging
 from pathlib import Path
 
 from config import get_settings
 
+from . import tts_cache
+from .audio_probe import probe_duration
+
+logger = logging.getLogger(__name__)
+
+# 单步重试前的等待基数（秒），按 2^n 退避
+_RETRY_BACKOFF_SECONDS = 0.5
+
 
 async def generate_audio_with_duration_async(text: str, output_path: str | Path) -> float:
-    """异步：生成语音文件并返回时长（秒）。"""
+    """异步：生成语音文件并返回时长（秒）。启用 TTS 缓存时，相同 (voice, 文本) 直接复用已合成的音频与时长。"""
     if not text or not text.strip():
         raise ValueError("语音文本不能为空")
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    voice = get_settings().tts_voice
+    use_cache = tts_cache.is_enabled()
+    if use_cache:
+        cached = await asyncio.to_thread(tts_cache.fetch, voice, text, out)
+        if cached is not None:
+            logger.info("[tts] 缓存命中 %s", out.name)
+            return cached
     try:
         import edge_tts
     except ImportError as e:
         raise ImportError("请安装 edge-tts: pip install edge-tts") from e
-    out = Path(output_path)
-    out.parent.mkdir(parents=True, exist_ok=True)
-    voice = get_settings().tts_voice
+    # 输出文件可能是缓存的硬链接，先删除再写，避免覆盖缓存内容
+    out.unlink(missing_ok=True)
     communicate = edge_tts.Communicate(text.strip(), voice)
     await communicate.save(str(out))
-    try:
-        from pydub import AudioSegment
-        seg = AudioSegment.from_file(str(out))
-        return len(seg) / 1000.0
-    except ImportError:
-        import subprocess
-        default_sec = get_settings().default_wait_seconds
-        try:
-            result = subprocess.run(
-                ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(out)],
-                capture_output=True,
-                text=True,
-                timeout=30,
-            )
-            if result.returncode == 0 and result.stdout.strip():
-                return float(result.stdout.strip())
-        except FileNotFoundError:
-            import warnings
-            warnings.warn(
-                "未找到 ffprobe（请安装 FFmpeg 以获得准确语音时长）。当前使用默认时长。",
-                UserWarning,
-                stacklevel=2,
-            )
-        except subprocess.TimeoutExpired:
-            import warnings
-            warnings.warn(
-                "ffprobe 获取时长超时，使用默认时长。建议安装 pydub: uv add pydub",
-                UserWarning,
-                stacklevel=2,
-            )
-        return default_sec
+    # 读文件解析帧头（失败时整段解码）为阻塞操作，放到线程中执行，避免阻塞事件循环上的其他合成任务
+    duration = await asyncio.to_thread(probe_duration, out)
+    if use_cache:
+        await asyncio.to_thread(tts_cache.store, voice, text, out, duration)
+    return duration
 
 
 def generate_audio_with_duration(text: str, output_path: str | Path) -> float:
@@ -56,24 +47,62 @@ def generate_audio_with_duration(text: str, output_path: str | Path) -> float:
     return asyncio.run(generate_audio_with_duration_async(text, output_path))
 
 
+async def _generate_step_audio(
+    index: int,
+    text: str,
+    path: Path,
+    semaphore: asyncio.Semaphore,
+    max_retries: int,
+) -> float:
+    """合成单个步骤的语音，失败时仅重试该步骤。"""
+    attempt = 0
+    while True:
+        try:
+            async with semaphore:
+                return await generate_audio_with_duration_async(text, path)
+        except (ValueError, ImportError):
+            raise
+        except Exception as e:
+            if attempt >= max_retries:
+                raise
+            attempt += 1
+            logger.warning("[tts] 步骤 %d 语音合成失败，第 %d 次重试: %s", index + 1, attempt, e)
+            await asyncio.sleep(_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+
+
 async def generate_audios_for_steps_async(
     steps: list,
     *,
     output_dir: str | Path = ".",
     prefix: str = "audio",
+    max_concurrency: int | None = None,
 ) -> list[float]:
-    """按步骤批量生成音频并返回各步时长列表。steps 每项需有 voiceover_text。"""
+    """
+    按步骤批量生成音频并返回各步时长列表。steps 每项需有 voiceover_text。
+    各步骤在信号量限制下并发合成（默认 tts_max_concurrency），文件名与返回时长顺序与 steps 一致。
+    """
+    settings = get_settings()
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
-    durations: list[float] = []
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or settings.tts_max_concurrency))
+    durations: list[float] = [settings.default_wait_seconds] * len(steps)
+    jobs: list[tuple[int, asyncio.Future]] = []
     for i, step in enumerate(steps):
         text = getattr(step, "voiceover_text", None) or (step.get("voiceover_text") if isinstance(step, dict) else "")
         if not text:
-            durations.append(get_settings().default_wait_seconds)
             continue
         path = output_dir / f"{prefix}_{i+1}.mp3"
-        dur = await generate_audio_with_duration_async(text, path)
-        durations.append(dur)
+        jobs.append((i, asyncio.ensure_future(
+            _generate_step_audio(i, text, path, semaphore, settings.tts_max_retries)
+        )))
+    try:
+        results = await asyncio.gather(*(job for _, job in jobs))
+    except BaseException:
+        for _, job in jobs:
+            job.cancel()
+        raise
+    for (i, _), dur in zip(jobs, results):
+        durations[i] = dur
     return durations
 
 
@@ -82,6 +111,9 @@ def generate_audios_for_steps(
     *,
     output_dir: str | Path = ".",
     prefix: str = "audio",
+    max_concurrency: int | None = None,
 ) -> list[float]:
     """同步：按步骤批量生成音频并返回各步时长列表。"""
-    return asyncio.run(generate_audios_for_steps_async(steps, output_dir=output_dir, prefix=prefix))
+    return asyncio.run(generate_audios_for_steps_async(
+        steps, output_dir=output_dir, prefix=prefix, max_concurrency=max_concurrency,
+    ))
@@ -0,0 +1,160 @@
+"""TTS 音频缓存：按 (voice, 归一化文本) 内容寻址，落盘保存 mp3 与实测时长，命中时硬链接到任务目录，按总大小 LRU 淘汰。"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "tts_cache"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+# 写入路径上不逐次扫描目录：按缓存目录维护总大小的估计值，超过上限或距上次全量扫描超过该间隔（秒）时才执行 evict()
+_EVICT_SCAN_INTERVAL = 600.0
+_size_lock = threading.Lock()
+_approx_bytes: dict[Path, int] = {}
+_last_scan: dict[Path, float] = {}
+
+
+def _bump(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def is_enabled() -> bool:
+    return get_settings().tts_cache_enabled
+
+
+def _cache_dir() -> Path:
+    configured = get_settings().tts_cache_dir
+    return Path(configured) if configured else DEFAULT_CACHE_DIR
+
+
+def normalize_text(text: str) -> str:
+    """归一化旁白文本：NFKC、去首尾空白、合并连续空白，使仅空白不同的文本共用缓存。"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def make_key(voice: str, text: str) -> str:
+    raw = f"{voice}\0{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_paths(key: str) -> tuple[Path, Path]:
+    d = _cache_dir() / key[:2]
+    return d / f"{key}.mp3", d / f"{key}.json"
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """硬链接 src 到 dst（跨文件系统等失败时退回复制）。dst 已存在则先删除，避免写穿共享 inode。"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def fetch(voice: str, text: str, output_path: str | Path) -> float | None:
+    """命中时将缓存音频硬链接到 output_path 并返回时长；未命中返回 None。"""
+    mp3, meta = _entry_paths(make_key(voice, text))
+    try:
+        duration = float(json.loads(meta.read_text(encoding="utf-8"))["duration"])
+        _link_or_copy(mp3, Path(output_path))
+        os.utime(mp3)
+    except (FileNotFoundError, OSError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+        _bump("misses")
+        return None
+    _bump("hits")
+    return duration
+
+
+def store(voice: str, text: str, audio_path: str | Path, duration: float) -> None:
+    """将已合成的音频与时长写入缓存。累计大小超过上限（或距上次扫描已久）时才扫描目录、按 LRU 淘汰。"""
+    key = make_key(voice, text)
+    mp3, meta = _entry_paths(key)
+    try:
+        try:
+            replaced = mp3.stat().st_size
+        except OSError:
+            replaced = 0
+        tmp = mp3.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        _link_or_copy(Path(audio_path), tmp)
+        added = tmp.stat().st_size
+        os.replace(tmp, mp3)
+        meta.write_text(
+            json.dumps({"voice": voice, "text": normalize_text(text), "duration": duration}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+    except OSError as e:
+        logger.warning("[tts_cache] 写入缓存失败: %s", e)
+        return
+    _bump("stores")
+    root = _cache_dir()
+    with _size_lock:
+        known = root in _approx_bytes
+        if known:
+            _approx_bytes[root] += added - replaced
+        due = (
+            not known
+            or _approx_bytes[root] > get_settings().tts_cache_max_bytes
+            or time.monotonic() - _last_scan.get(root, 0.0) > _EVICT_SCAN_INTERVAL
+        )
+    if due:
+        evict()
+
+
+def evict() -> int:
+    """
+    按 mp3 的 mtime 做 LRU 淘汰，直到总大小不超过 tts_cache_max_bytes。返回删除条目数。
+    同时以扫描结果校准 store() 维护的总大小估计值。
+    """
+    max_bytes = get_settings().tts_cache_max_bytes
+    root = _cache_dir()
+    if not root.is_dir():
+        return 0
+    scan_started = time.monotonic()
+    entries: list[tuple[float, int, Path]] = []
+    for p in root.glob("*/*.mp3"):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_bytes:
+        entries.sort(key=lambda e: e[0])
+        for _, size, p in entries:
+            if total <= max_bytes:
+                break
+            p.with_suffix(".json").unlink(missing_ok=True)
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+    with _size_lock:
+        _approx_bytes[root] = total
+        _last_scan[root] = scan_started
+    if removed:
+        _bump("evicted", removed)
+        logger.info("[tts_cache] 淘汰 %d 条缓存", removed)
+    return removed
+
+
+def get_stats() -> dict:
+    """返回缓存统计：hits / misses / stores / evicted / hit_rate。"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    return stats
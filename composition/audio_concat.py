@@ -1,12 +1,20 @@
 """将多段音频拼接为单文件（供合成阶段使用）。"""
 import subprocess
+import threading
 from pathlib import Path
 
 from config import get_settings
 
+from .ffmpeg_compose import run_command
 
-def concat_audio_files(input_paths: list[str | Path], output_path: str | Path) -> None:
-    """使用 FFmpeg 将多段音频按顺序拼接为单个文件。"""
+
+def concat_audio_files(
+    input_paths: list[str | Path],
+    output_path: str | Path,
+    *,
+    cancel_event: threading.Event | None = None,
+) -> None:
+    """使用 FFmpeg 将多段音频按顺序拼接为单个文件。cancel_event 置位时结束 FFmpeg 并抛出 CompositionError。"""
     if not input_paths:
         raise ValueError("至少需要一段音频")
     paths = [Path(p) for p in input_paths]
@@ -26,12 +34,9 @@ def concat_audio_files(input_paths: list[str | Path], output_path: str | Path) -
             f.write(f"file '{p.resolve()}'\n")
         list_path = f.name
     try:
-        cmd = get_settings().ffmpeg_command
-        subprocess.run(
-            [cmd, "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", str(out)],
-            check=True,
-            capture_output=True,
-            timeout=300,
-        )
+        args = [get_settings().ffmpeg_command, "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", str(out)]
+        proc = run_command(args, timeout=300, cancel_event=cancel_event)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, args, proc.stdout, proc.stderr)
     finally:
         Path(list_path).unlink(missing_ok=True)
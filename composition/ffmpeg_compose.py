@@ -1,23 +1,57 @@
 """使用 FFmpeg 将 Manim 视频与音频合成为最终 MP4。"""
+import logging
 import subprocess
+import threading
+import time
 from pathlib import Path
 
 from config import get_settings
 
+logger = logging.getLogger(__name__)
+
 
 class CompositionError(RuntimeError):
     """合成失败时抛出，携带可区分错误信息。"""
     pass
 
 
+def run_command(
+    args: list[str],
+    *,
+    timeout: float,
+    cancel_event: threading.Event | None = None,
+) -> subprocess.CompletedProcess[str]:
+    """
+    运行 FFmpeg 等外部命令并捕获输出（同 subprocess.run，超时抛出 TimeoutExpired）。
+    传入 cancel_event 时每 0.2 秒检查一次，置位即结束进程并抛出 CompositionError，不再继续写输出文件。
+    """
+    if cancel_event is None:
+        return subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            stdout, stderr = proc.communicate(timeout=0.2)
+            return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set() or time.monotonic() > deadline:
+                proc.kill()
+                proc.communicate()
+                if cancel_event.is_set():
+                    raise CompositionError(f"{Path(args[0]).name} 已取消") from None
+                raise subprocess.TimeoutExpired(args, timeout) from None
+
+
 def compose_video(
     manim_video_path: str | Path,
     audio_path: str | Path,
     output_path: str | Path,
+    *,
+    cancel_event: threading.Event | None = None,
 ) -> None:
     """
-    校验两个输入文件存在后，调用 FFmpeg 合成：-c:v copy、-c:a aac、-shortest。
-    若输入不存在或 FFmpeg 非零退出码，抛出 CompositionError。
+    校验两个输入文件存在后，调用 FFmpeg 合成：-c:v copy、-c:a aac、-shortest，moov 前置（faststart）。
+    若输入不存在或 FFmpeg 非零退出码，抛出 CompositionError。cancel_event 置位时结束 FFmpeg 并抛出 CompositionError。
     """
     video_path = Path(manim_video_path)
     audio_path_p = Path(audio_path)
@@ -36,8 +70,58 @@ def compose_video(
         "-c:v", "copy",
         "-c:a", "aac",
         "-shortest",
+        "-movflags", "+faststart",
+        str(out_path),
+    ]
+    proc = run_command(args, timeout=600, cancel_event=cancel_event)
+    if proc.returncode != 0:
+        raise CompositionError(f"FFmpeg 执行失败 (exit {proc.returncode}): {proc.stderr or proc.stdout}")
+
+
+def compose_video_with_audio_segments(
+    manim_video_path: str | Path,
+    audio_paths: list[str | Path],
+    output_path: str | Path,
+    *,
+    cancel_event: threading.Event | None = None,
+) -> None:
+    """
+    单次 FFmpeg 合成：各步音频作为独立输入经 concat 滤镜按顺序拼接后直接编码为 AAC，与视频流复制封装，
+    不落地中间 full_audio 文件；moov 前置（faststart），边下边播。
+    输入缺失或 FFmpeg 非零退出码时抛出 CompositionError（调用方可回退为先拼接音频再 compose_video）。
+    cancel_event 置位时结束 FFmpeg 并抛出 CompositionError。
+    """
+    video_path = Path(manim_video_path)
+    out_path = Path(output_path)
+    if not video_path.is_file():
+        raise CompositionError(f"视频文件不存在: {video_path}")
+    if not audio_paths:
+        raise CompositionError("至少需要一段音频")
+    audios = [Path(p) for p in audio_paths]
+    for p in audios:
+        if not p.is_file():
+            raise CompositionError(f"音频文件不存在: {p}")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    inputs: list[str] = []
+    for p in audios:
+        inputs += ["-i", str(p)]
+    labels = "".join(f"[{i + 1}:a]" for i in range(len(audios)))
+    args = [
+        get_settings().ffmpeg_command,
+        "-y",
+        "-i", str(video_path),
+        *inputs,
+        "-filter_complex", f"{labels}concat=n={len(audios)}:v=0:a=1[a]",
+        "-map", "0:v",
+        "-map", "[a]",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        "-shortest",
+        "-movflags", "+faststart",
         str(out_path),
     ]
-    proc = subprocess.run(args, capture_output=True, text=True, timeout=600)
+    start = time.monotonic()
+    proc = run_command(args, timeout=600, cancel_event=cancel_event)
     if proc.returncode != 0:
         raise CompositionError(f"FFmpeg 执行失败 (exit {proc.returncode}): {proc.stderr or proc.stdout}")
+    logger.info("[compose] 单次合成 %d 段音频，耗时 %.1fs", len(audios), time.monotonic() - start)
@@ -0,0 +1,179 @@
+"""
+成片的 HLS 多码率输出：按码率阶梯把 final.mp4 切成 fMP4 分片 + 播放列表，供移动端边下边播、按带宽切换。
+各档位并行编码，播放列表为 event 类型、随分片写出逐步追加；各档第一个分片写完（index.m3u8 出现）后才写出主播放列表，
+此时即可开始播放；打包失败时删除输出目录，不留下指向不存在档位的主播放列表。
+"""
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from config import get_settings
+
+from .ffmpeg_compose import CompositionError
+
+logger = logging.getLogger(__name__)
+
+MASTER_PLAYLIST = "master.m3u8"
+# 分片时长（秒）与音频码率
+_SEGMENT_SECONDS = 4
+_AUDIO_BITRATE = 96_000
+# 等待各档首个分片时检查 index.m3u8 的间隔（秒）
+_READY_POLL_SECONDS = 0.5
+
+_stats_lock = threading.Lock()
+_stats: dict = {"packaged": 0, "failures": 0, "renditions": {}}
+
+
+def parse_ladder(spec: str) -> list[tuple[int, int]]:
+    """解析码率阶梯 "480:1000k,360:500k" → [(高度, 视频码率 bps)]，按高度从高到低排列；格式错误抛出 ValueError。"""
+    ladder: list[tuple[int, int]] = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        height, _, rate = item.partition(":")
+        rate = rate.strip().lower()
+        scale = 1000 if rate.endswith("k") else 1_000_000 if rate.endswith("m") else 1
+        bps = int(float(rate.rstrip("km")) * scale)
+        if int(height) <= 0 or bps <= 0:
+            raise ValueError(f"无效的码率档位: {item}")
+        ladder.append((int(height), bps))
+    if not ladder:
+        raise ValueError("码率阶梯为空")
+    return sorted(set(ladder), reverse=True)
+
+
+def master_playlist(ladder: list[tuple[int, int]]) -> str:
+    """生成主播放列表，各档位指向 <高度>p/index.m3u8。"""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for height, bps in ladder:
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bps + _AUDIO_BITRATE}")
+        lines.append(f"{height}p/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def _write_master(out: Path, ladder: list[tuple[int, int]]) -> None:
+    """原子写出主播放列表（先写临时文件再替换），读取方不会看到半个文件。"""
+    tmp = out / f".{MASTER_PLAYLIST}.tmp"
+    tmp.write_text(master_playlist(ladder), encoding="utf-8")
+    os.replace(tmp, out / MASTER_PLAYLIST)
+
+
+def _encode_rendition(video: Path, out_dir: Path, height: int, bps: int) -> float:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    args = [
+        get_settings().ffmpeg_command,
+        "-y",
+        "-i", str(video),
+        "-map", "0:v:0",
+        "-map", "0:a:0?",
+        "-vf", f"scale=-2:{height}",
+        "-c:v", "libx264",
+        "-b:v", str(bps),
+        "-maxrate", str(int(bps * 1.07)),
+        "-bufsize", str(bps * 2),
+        # 关键帧与分片边界对齐，各档位可无缝切换
+        "-force_key_frames", f"expr:gte(t,n_forced*{_SEGMENT_SECONDS})",
+        "-sc_threshold", "0",
+        "-c:a", "aac",
+        "-b:a", str(_AUDIO_BITRATE),
+        "-f", "hls",
+        "-hls_time", str(_SEGMENT_SECONDS),
+        "-hls_playlist_type", "event",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", "init.mp4",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", str(out_dir / "seg_%03d.m4s"),
+        str(out_dir / "index.m3u8"),
+    ]
+    start = time.monotonic()
+    proc = subprocess.run(args, capture_output=True, text=True, timeout=900)
+    elapsed = time.monotonic() - start
+    if proc.returncode != 0:
+        raise CompositionError(f"HLS {height}p 编码失败 (exit {proc.returncode}): {(proc.stderr or proc.stdout)[-2000:]}")
+    with _stats_lock:
+        entry = _stats["renditions"].setdefault(f"{height}p", {"count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += elapsed
+    logger.info("[hls] %dp 编码完成，耗时 %.1fs", height, elapsed)
+    return elapsed
+
+
+def package_hls(video_path: str | Path, output_dir: str | Path, ladder: list[tuple[int, int]] | None = None) -> dict[str, float]:
+    """
+    把成片按码率阶梯（默认取配置 hls_ladder）打包为 HLS，写入 output_dir/master.m3u8 与 <高度>p/ 子目录。
+    各档位并行编码，全部档位的 index.m3u8 出现后才写出主播放列表。返回 {档位: 编码耗时秒}；
+    任一档位失败时删除主播放列表并抛出 CompositionError。
+    """
+    video = Path(video_path)
+    if not video.is_file():
+        raise CompositionError(f"视频文件不存在: {video}")
+    if ladder is None:
+        ladder = parse_ladder(get_settings().hls_ladder)
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    indexes = [out / f"{h}p" / "index.m3u8" for h, _ in ladder]
+    # 清掉上次打包残留的播放列表，避免在新分片就绪前误判为可播放
+    for p in [out / MASTER_PLAYLIST, *indexes]:
+        p.unlink(missing_ok=True)
+    timings: dict[str, float] = {}
+    try:
+        with ThreadPoolExecutor(max_workers=len(ladder)) as pool:
+            futures = {
+                f"{h}p": pool.submit(_encode_rendition, video, out / f"{h}p", h, bps) for h, bps in ladder
+            }
+            # 等各档首个分片写出后再写主播放列表；有档位失败或全部结束时不再等待
+            while not all(p.is_file() for p in indexes):
+                done = [f for f in futures.values() if f.done()]
+                if len(done) == len(futures) or any(f.exception() for f in done):
+                    break
+                time.sleep(_READY_POLL_SECONDS)
+            else:
+                _write_master(out, ladder)
+            for name, fut in futures.items():
+                timings[name] = fut.result()
+        if not (out / MASTER_PLAYLIST).is_file():
+            _write_master(out, ladder)
+    except Exception:
+        (out / MASTER_PLAYLIST).unlink(missing_ok=True)
+        with _stats_lock:
+            _stats["failures"] += 1
+        raise
+    with _stats_lock:
+        _stats["packaged"] += 1
+    return timings
+
+
+def package_hls_in_background(video_path: str | Path, output_dir: str | Path) -> threading.Thread:
+    """
+    后台线程打包 HLS（失败只记日志，不影响 MP4 成品）。主播放列表在各档首个分片就绪后写出，
+    在此之前 hls_url 为空、前端播放 MP4；失败时删除整个输出目录。码率阶梯无效时立即抛出 ValueError。
+    """
+    ladder = parse_ladder(get_settings().hls_ladder)
+    out = Path(output_dir)
+
+    def run() -> None:
+        try:
+            package_hls(video_path, out, ladder)
+        except Exception as e:
+            logger.warning("[hls] 打包失败 %s: %s", out, e)
+            shutil.rmtree(out, ignore_errors=True)
+
+    thread = threading.Thread(target=run, name="hls-package", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_stats() -> dict:
+    """打包次数、失败次数与各档位累计编码次数/耗时。"""
+    with _stats_lock:
+        return {
+            "packaged": _stats["packaged"],
+            "failures": _stats["failures"],
+            "renditions": {k: dict(v) for k, v in _stats["renditions"].items()},
+        }
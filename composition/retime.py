@@ -0,0 +1,222 @@
+"""
+合成阶段按旁白时长重定时：Manim 以标记 wait 渲染一次（见 asset_generation.timing.step_marker_suffix），
+这里把每个 self.wait() 占位所在的分段用 tpad 定格补帧到该步音频时长，其余分段流复制拼接，换音色/改旁白无需重渲。
+concat 流复制只保留第一个文件的 extradata（SPS/PPS），因此补帧分段按 ffprobe 探测到的 Manim 分段参数编码，
+并在每个关键帧前重复写出自己的 SPS/PPS（x264 repeat-headers），解码以码流内的参数集为准；
+x264 的 extradata 含编码器版本与参数串，与 Manim 分段逐字节相同几乎不可能，因此不比较 extradata，
+只在分辨率、档次、像素格式、帧率、时间基等决定能否拼接的参数不一致时改为整段滤镜重编码。
+"""
+import json
+import logging
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from config import get_settings
+
+from .ffmpeg_compose import CompositionError, run_command
+
+logger = logging.getLogger(__name__)
+
+# 流复制拼接要求这些字段在所有分段间一致
+_COPY_COMPAT_FIELDS = (
+    "codec_name", "profile", "level", "pix_fmt", "width", "height", "r_frame_rate", "time_base",
+)
+
+
+def steps_path(video_path: str | Path) -> Path:
+    """渲染产物旁的步骤标记文件：<video>.steps.json。"""
+    return Path(f"{video_path}.steps.json")
+
+
+def load_step_marks(video_path: str | Path) -> dict:
+    """读取步骤标记 {"marks": [{"time", "partial", "wait"}, ...], "partials": [...]}；不存在时抛出 CompositionError。"""
+    path = steps_path(video_path)
+    if not path.is_file():
+        raise CompositionError(f"缺少步骤标记文件，无法按音频时长重定时: {path}")
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def plan_holds(marks: list[dict], durations: list[float], default_wait: float | None = None) -> list[float]:
+    """
+    每个标记需要补的定格时长：该步音频时长减去已渲染的标记 wait（不足时为 0）。
+    与 inject_timing_into_code 一致，时长不足的占位按 default_wait 计。
+    """
+    if default_wait is None:
+        default_wait = get_settings().default_wait_seconds
+    holds: list[float] = []
+    for i, mark in enumerate(marks):
+        target = durations[i] if i < len(durations) else default_wait
+        holds.append(max(0.0, float(target) - float(mark.get("wait", 0.0))))
+    if len(durations) > len(marks):
+        logger.warning("[retime] 音频有 %d 段，但代码中只有 %d 个 self.wait() 占位", len(durations), len(marks))
+    return holds
+
+
+def _run_ffmpeg(args: list[str], timeout: int = 600, cancel_event: threading.Event | None = None) -> None:
+    proc = run_command([get_settings().ffmpeg_command, "-y", *args], timeout=timeout, cancel_event=cancel_event)
+    if proc.returncode != 0:
+        raise CompositionError(f"FFmpeg 执行失败 (exit {proc.returncode}): {proc.stderr or proc.stdout}")
+
+
+def _ffprobe_command() -> str:
+    """与 ffmpeg_command 同目录的 ffprobe。"""
+    ffmpeg = Path(get_settings().ffmpeg_command)
+    return str(ffmpeg.with_name(ffmpeg.name.replace("ffmpeg", "ffprobe"))) if "ffmpeg" in ffmpeg.name else "ffprobe"
+
+
+def _probe_stream(path: str | Path) -> dict | None:
+    """探测首个视频流的编码参数（_COPY_COMPAT_FIELDS）；ffprobe 不可用或失败时返回 None。"""
+    try:
+        proc = subprocess.run(
+            [_ffprobe_command(), "-v", "error", "-select_streams", "v:0", "-show_streams", "-of", "json", str(path)],
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if proc.returncode != 0:
+        return None
+    try:
+        streams = json.loads(proc.stdout).get("streams") or []
+    except json.JSONDecodeError:
+        return None
+    return {k: streams[0].get(k) for k in _COPY_COMPAT_FIELDS} if streams else None
+
+
+def _encode_args(ref: dict) -> list[str]:
+    """按参考分段的参数生成 libx264 编码参数，使补帧分段可与其流复制拼接；参数集随码流重复写出，不依赖 extradata。"""
+    args = ["-c:v", "libx264", "-pix_fmt", ref.get("pix_fmt") or "yuv420p", "-x264-params", "repeat-headers=1"]
+    profile = (ref.get("profile") or "").lower()
+    if profile:
+        args += ["-profile:v", "baseline" if "baseline" in profile else profile]
+    level = ref.get("level")
+    if isinstance(level, int) and level > 0:
+        args += ["-level", f"{level / 10:.1f}"]
+    if ref.get("r_frame_rate") and ref["r_frame_rate"] != "0/0":
+        args += ["-r", ref["r_frame_rate"]]
+    time_base = ref.get("time_base") or ""
+    if "/" in time_base:
+        args += ["-video_track_timescale", time_base.split("/", 1)[1]]
+    return args
+
+
+def _pad_clip(
+    src: str, dst: Path, hold: float, encode_args: list[str], cancel_event: threading.Event | None = None
+) -> None:
+    """对单个分段末帧定格 hold 秒（只重编码这一小段，编码参数与原分段一致）。"""
+    _run_ffmpeg([
+        "-i", src,
+        "-vf", f"tpad=stop_mode=clone:stop_duration={hold:.3f}",
+        *encode_args, "-an",
+        str(dst),
+    ], cancel_event=cancel_event)
+
+
+def _retime_by_partials(
+    partials: list[str | None],
+    marks: list[dict],
+    holds: list[float],
+    output: Path,
+    cancel_event: threading.Event | None = None,
+) -> bool:
+    """
+    只重编码标记所在的分段，其余分段与补帧后的分段按顺序流复制拼接。
+    分段之间或补帧分段与原分段的编码参数不一致（或无法探测）时不拼接，返回 False 由调用方整段重编码。
+    """
+    pads = {
+        mark["partial"]: hold
+        for mark, hold in zip(marks, holds)
+        if hold > 0 and 0 <= mark.get("partial", -1) < len(partials) and partials[mark["partial"]]
+    }
+    sources = [p for p in partials if p]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        probes = list(pool.map(_probe_stream, sources))
+    ref = probes[0] if probes else None
+    if ref is None or any(p != ref for p in probes):
+        logger.warning("[retime] Manim 分段编码参数无法探测或不一致，改为整段重编码")
+        return False
+    encode_args = _encode_args(ref)
+    with tempfile.TemporaryDirectory(prefix="retime_") as tmp:
+        tmp = Path(tmp)
+        padded = {idx: tmp / f"hold_{idx:05d}.mp4" for idx in pads}
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(_pad_clip, partials[idx], padded[idx], hold, encode_args, cancel_event) for idx, hold in pads.items()]
+            for fut in futures:
+                fut.result()
+            padded_probes = list(pool.map(_probe_stream, padded.values()))
+        if any(p != ref for p in padded_probes):
+            logger.warning("[retime] 补帧分段的编码参数与 Manim 分段不一致，改为整段重编码")
+            return False
+        entries = [str(padded.get(i, p)) for i, p in enumerate(partials) if p]
+        list_file = tmp / "list.txt"
+        list_file.write_text("".join(f"file '{Path(p).as_posix()}'\n" for p in entries), encoding="utf-8")
+        _run_ffmpeg(
+            ["-f", "concat", "-safe", "0", "-i", str(list_file), "-c", "copy", str(output)], cancel_event=cancel_event
+        )
+    return True
+
+
+def _retime_by_filter(
+    video: Path,
+    marks: list[dict],
+    holds: list[float],
+    output: Path,
+    cancel_event: threading.Event | None = None,
+) -> None:
+    """分段文件已不在（渲染目录被清理）或编码参数不一致时的回退：按标记时刻切开整段视频、逐段 tpad 后重编码拼接。"""
+    chains: list[str] = []
+    start = 0.0
+    for i, (mark, hold) in enumerate(zip(marks, holds)):
+        end = float(mark["time"])
+        chains.append(
+            f"[0:v]trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS,"
+            f"tpad=stop_mode=clone:stop_duration={hold:.3f}[v{i}]"
+        )
+        start = end
+    n = len(chains)
+    chains.append(f"[0:v]trim=start={start:.3f},setpts=PTS-STARTPTS[v{n}]")
+    labels = "".join(f"[v{i}]" for i in range(n + 1))
+    graph = ";".join(chains) + f";{labels}concat=n={n + 1}:v=1:a=0[out]"
+    _run_ffmpeg([
+        "-i", str(video),
+        "-filter_complex", graph,
+        "-map", "[out]",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p",
+        str(output),
+    ], cancel_event=cancel_event)
+
+
+def retime_video(
+    video_path: str | Path,
+    durations: list[float],
+    output_path: str | Path,
+    default_wait: float | None = None,
+    *,
+    cancel_event: threading.Event | None = None,
+) -> None:
+    """
+    按各步音频时长把标记渲染的视频补帧为最终时长，写入 output_path。
+    优先使用渲染目录中的分段文件（仅重编码占位分段、其余流复制）；分段缺失或编码参数不一致时回退为整段滤镜重编码。
+    缺少步骤标记或 FFmpeg 失败时抛出 CompositionError；cancel_event 置位时结束 FFmpeg 并抛出 CompositionError。
+    """
+    video = Path(video_path)
+    output = Path(output_path)
+    if not video.is_file():
+        raise CompositionError(f"视频文件不存在: {video}")
+    data = load_step_marks(video)
+    marks = data.get("marks") or []
+    partials = data.get("partials") or []
+    holds = plan_holds(marks, durations, default_wait)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if partials and all(Path(p).is_file() for p in partials if p) and _retime_by_partials(
+        partials, marks, holds, output, cancel_event
+    ):
+        mode = "分段流复制"
+    else:
+        _retime_by_filter(video, marks, holds, output, cancel_event)
+        mode = "整段重编码"
+    logger.info("[retime] 按音频时长补帧 %d 处，共 %.1fs（%s）", sum(h > 0 for h in holds), sum(holds), mode)
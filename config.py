@@ -40,13 +40,147 @@ class Settings(BaseSettings):
     vision_request_timeout: float | None = None
     """视觉模型单次请求超时秒数，不设则使用 llm_request_timeout。"""
 
+    # ---------- LLM 客户端连接池 ----------
+    # 相同 (model, base_url, timeout, temperature, max_tokens) 的调用复用同一个 ChatOpenAI 及其 HTTP 连接池
+    llm_pool_max_connections: int = 20
+    """每个 LLM 客户端 HTTP 连接池的最大连接数。"""
+    llm_pool_max_keepalive: int = 10
+    """每个 LLM 客户端保持 keep-alive 的最大空闲连接数。"""
+    llm_pool_keepalive_expiry: float = 60.0
+    """单条 keep-alive 连接空闲多久后关闭（秒）。"""
+    llm_pool_idle_timeout: float = 600.0
+    """LLM 客户端整体空闲多久后从池中移除并关闭（秒），实际阈值不小于该客户端的请求超时。"""
+
+    # ---------- LLM 响应缓存 ----------
+    # 相同模型、温度、prompt、图片与目标 schema 的请求直接返回已校验的结果，默认关闭
+    llm_cache_enabled: bool = False
+    """是否启用 LLM 响应磁盘缓存。"""
+    llm_cache_dir: str | None = None
+    """缓存目录，不设则使用项目 data/llm_cache。"""
+    llm_cache_max_bytes: int = 256 * 1024 * 1024
+    """缓存总大小上限（字节），超出后按最近最少使用淘汰。"""
+    llm_cache_max_age_seconds: float = 7 * 24 * 3600
+    """缓存条目最长保留秒数，0 表示不按时间淘汰。"""
+
     # TTS（edge-tts 用 voice 名）
     tts_voice: str = "zh-CN-XiaoxiaoNeural"
+    tts_max_concurrency: int = 4
+    """按步骤批量合成语音时的最大并发数。"""
+    tts_max_retries: int = 2
+    """单个步骤语音合成失败后的重试次数（只重试失败的步骤）。"""
+    tts_cache_enabled: bool = True
+    """是否启用 TTS 音频缓存：相同音色与旁白文本复用已合成的 mp3 与时长。"""
+    tts_cache_dir: str | None = None
+    """TTS 缓存目录，不设则使用项目 data/tts_cache。"""
+    tts_cache_max_bytes: int = 1024 * 1024 * 1024
+    """TTS 缓存总大小上限（字节），超出后按最近最少使用淘汰。"""
+
+    # LaTeX 编译缓存：所有 Manim 渲染共用 tex_dir，相同公式跨任务只编译一次
+    tex_cache_enabled: bool = True
+    tex_cache_dir: str | None = None
+    """缓存目录，默认项目下 data/tex_cache。"""
+    tex_cache_max_bytes: int = 256 * 1024 * 1024
+    """LaTeX 缓存总大小上限（字节），超出后按最早写入淘汰。"""
+    tex_cache_prewarm: bool = True
+    """题目分析完成后是否在后台预编译步骤中的 math_formula（与脚本生成并行）。"""
 
     # Manim / FFmpeg 路径（空则用系统 PATH）
     manim_command: str = "manim"
     ffmpeg_command: str = "ffmpeg"
 
+    # 流水线：互不依赖的阶段（脚本生成 ∥ TTS、渲染 ∥ 音频拼接）是否并发执行
+    pipeline_concurrent_stages: bool = True
+
+    # 任务调度：有界队列 + 任务线程；阶段按类型占用全局池槽位（io：LLM/TTS，cpu：Manim/FFmpeg）
+    scheduler_max_jobs: int = 8
+    """同时推进的任务数（各阶段仍受阶段池限制）。"""
+    scheduler_queue_size: int = 32
+    """等待中的任务上限，超出时提交接口返回 429。"""
+    stage_pool_io: int = 8
+    """IO 型阶段（题目识别、LLM 分析与脚本生成、TTS）的全局并发数。"""
+    stage_pool_cpu: int = 0
+    """CPU 型阶段（Manim 渲染、音频拼接、视频合成）的全局并发数，0 表示 CPU 核数的一半（至少 1）。"""
+
+    coalesce_enabled: bool = True
+    """相同题目（归一化文本 + 图片摘要）的并发请求合并为一次流水线执行，各自拿到 task_id 并共享进度与成品（仅 local 模式）。"""
+    task_events_poll_seconds: float = 1.0
+    """queue 模式下状态推送（SSE）轮询有订阅者任务的间隔（秒）；local 模式直接由状态回调推送，不轮询。"""
+    result_cache_enabled: bool = True
+    """成品结果缓存：已成功生成过的题目（同一流水线版本、模型与音色）再次提交时直接复用成品，提交时 force=true 可跳过。"""
+
+    # 执行方式：local 在 API 进程内调度执行；queue 时 API 只写入持久化队列，由 worker.py 进程租约领取执行
+    execution_mode: str = "local"
+    job_queue_db: str | None = None
+    """任务队列 SQLite 文件，默认 data/job_queue.db；多机部署时与 data/history.db、output 一起放在共享卷上。"""
+    job_lease_seconds: float = 60.0
+    """worker 租约时长（秒），超过未续约视为 worker 失联，任务重新入队。"""
+    job_heartbeat_seconds: float = 10.0
+    """worker 续约间隔（秒），应明显小于租约时长。"""
+    job_max_attempts: int = 3
+    """同一任务最多被领取的次数，租约多次过期后标记失败。"""
+
+    # Manim 渲染模式：single 单进程整段渲染；sharded 按步骤切段、多进程并行渲染后无损拼接
+    manim_render_mode: str = "single"
+    manim_shard_workers: int = 0
+    """分段渲染的并行进程数，0 表示使用 CPU 核数。"""
+    manim_worker_pool_size: int = 0
+    """常驻 Manim 渲染进程数（预导入 manim，免去每次启动解释器），0 表示不启用、每次 subprocess 调用 manim。"""
+    manim_worker_max_jobs: int = 20
+    """单个常驻进程处理多少次渲染后回收重建。"""
+    manim_worker_max_rss_mb: float = 1500.0
+    """常驻进程内存超过该值（MB）后回收重建。"""
+
+    # Manim 渲染目录保留策略：任务工作目录下的 manim_media 保存分段缓存，供自愈与断点重试复用
+    manim_media_retention: str = "on_success"
+    """on_success：流水线成功后删除渲染目录；keep：始终保留。"""
+    manim_media_max_age_hours: float = 24.0
+    """失败任务的渲染目录超过该时长（小时）未更新则在启动时清理，0 表示不清理。"""
+
+    manim_dry_run_first: bool = True
+    """正式编码前先以 --dry_run 预演 construct()（不写帧），运行时错误几秒内即交给自愈；分段模式本身已有预演。"""
+    manim_static_check: bool = True
+    """渲染前对 Manim 代码做静态检查（语法、SolutionScene、self.wait()、未定义名字），不通过直接交给 LLM 修复、不启动 manim。"""
+
+    manim_fix_kb_enabled: bool = True
+    """自愈时先按报错签名套用修复知识库（data/fix_kb.db）中的已知修复，命中则不调用 LLM；LLM 修复成功后自动学习。"""
+
+    manim_fix_mode: str = "patch"
+    """LLM 自愈方式：patch 只发送截取的 traceback 与出错行附近代码，让模型返回 unified diff 本地应用（失败回退 full）；full 发送整份代码并取回完整文件。"""
+
+    manim_speculative_fixes: int = 0
+    """推测式自愈：每轮并发请求的候选修复数（提示与温度各不相同），并行渲染后取第一个成功的；0 或 1 表示逐个修复。"""
+    manim_speculative_max_renders: int = 0
+    """推测式自愈同时渲染的候选数上限（CPU 预算），0 表示 CPU 核数。"""
+
+    timing_mode: str = "render"
+    """旁白时长对齐方式：render 渲染前把时长写进 self.wait(duration)；compose 以标记 wait 渲染一次并记录步骤边界，合成时按音频时长定格补帧（换音色/改旁白无需重渲）。"""
+    timing_marker_wait_seconds: float = 0.1
+    """compose 模式下每个 self.wait() 占位实际渲染的标记时长（秒），合成时补足到该步音频时长。"""
+    render_cache_enabled: bool = True
+    """compose 模式下是否按场景代码缓存标记渲染的产物（成片、步骤标记与分段），换音色/改语速时跳过渲染。"""
+    render_cache_dir: str | None = None
+    """渲染缓存目录，不设则使用项目 data/render_cache。"""
+    render_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+    """渲染缓存总大小上限（字节），超出后按最近最少使用淘汰。"""
+
+    compose_fused: bool = True
+    """合成时用一次 FFmpeg 调用完成音频拼接与封装（不落地 full_audio.mp3），失败时回退为先拼接音频再合成。"""
+
+    hls_enabled: bool = False
+    """成片完成后是否额外打包 HLS（fMP4 分片 + 播放列表），通过 /hls/{task_id}/master.m3u8 访问。"""
+    hls_ladder: str = "480:1000k,360:500k"
+    """HLS 码率阶梯：逗号分隔的 高度:视频码率，每档单独编码。"""
+
+    # 输出目录回收：成品按内容哈希存入 output/artifacts 并以硬链接发布，后台按时长与配额清理任务目录
+    artifact_sweep_interval_minutes: float = 30.0
+    """后台回收间隔（分钟），0 表示不启动回收线程。"""
+    work_retention_success_hours: float = 24.0
+    """成功（或记录已删除）任务的 output/<task_id> 目录保留时长（小时），0 表示不按时长清理。"""
+    work_retention_failed_hours: float = 168.0
+    """失败（仍可断点重试）或进行中任务的目录保留时长（小时），0 表示不清理；这类目录不受配额影响。"""
+    output_quota_bytes: int = 0
+    """任务目录总大小上限（字节），超出时从最旧的已成功任务开始清理；0 表示不限制。"""
+
     # 自愈：Manim 代码失败时 LLM 修复的最大重试次数
     manim_self_heal_max_attempts: int = 5
 
@@ -0,0 +1,193 @@
+"""LLM 响应缓存：按 (模型, 接口地址, 温度, max_tokens, prompt, 图片摘要, 目标 schema) 内容寻址，落盘存储，按大小/时长 LRU 淘汰。默认关闭，由配置开启。"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / "data" / "llm_cache"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+# 写入路径上不逐次扫描目录：按缓存目录维护总大小的估计值，超过上限或距上次全量扫描超过该间隔（秒）时才执行 evict()
+_EVICT_SCAN_INTERVAL = 600.0
+_size_lock = threading.Lock()
+_approx_bytes: dict[Path, int] = {}
+_last_scan: dict[Path, float] = {}
+
+
+def _bump(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def is_enabled() -> bool:
+    return get_settings().llm_cache_enabled
+
+
+def _cache_dir() -> Path:
+    configured = get_settings().llm_cache_dir
+    return Path(configured) if configured else DEFAULT_CACHE_DIR
+
+
+def image_digest(image_base64: str | None, mime_type: str = "image/jpeg") -> str | None:
+    """图片内容摘要，作为缓存键的一部分；无图片时返回 None。"""
+    if not image_base64:
+        return None
+    return mime_type + ":" + hashlib.sha256(image_base64.encode("ascii")).hexdigest()
+
+
+def make_key(
+    *,
+    kind: str,
+    model: str,
+    temperature: float | None,
+    prompt: str,
+    image: str | None = None,
+    schema: type[BaseModel] | None = None,
+    base_url: str | None = None,
+    max_tokens: int | None = None,
+) -> str:
+    """
+    计算缓存键：各字段的 JSON 规范化后取 sha256。schema 以名称与 JSON Schema 参与哈希，schema 变更自动失效。
+    base_url 与 max_tokens 参与哈希：不同网关的同名模型、较小 max_tokens 下被截断的回复不会互相命中。
+    """
+    material = {
+        "kind": kind,
+        "model": model,
+        "base_url": base_url,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "prompt": prompt,
+        "image": image,
+        "schema": None if schema is None else {
+            "name": schema.__name__,
+            "json_schema": schema.model_json_schema(),
+        },
+    }
+    raw = json.dumps(material, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return _cache_dir() / key[:2] / f"{key}.json"
+
+
+def get(key: str) -> Any | None:
+    """读取缓存：命中返回存储的 payload（并刷新 LRU 访问时间），过期或未命中返回 None。"""
+    path = _entry_path(key)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError, OSError):
+        _bump("misses")
+        return None
+    max_age = get_settings().llm_cache_max_age_seconds
+    if max_age > 0 and time.time() - float(data.get("created_at", 0)) > max_age:
+        path.unlink(missing_ok=True)
+        _bump("misses")
+        _bump("evicted")
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    _bump("hits")
+    return data.get("payload")
+
+
+def put(key: str, payload: Any) -> None:
+    """写入缓存（原子替换）。累计大小超过上限（或距上次扫描已久）时才扫描目录、淘汰最久未访问的条目。"""
+    path = _entry_path(key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            replaced = path.stat().st_size
+        except OSError:
+            replaced = 0
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        data = json.dumps({"created_at": time.time(), "payload": payload}, ensure_ascii=False).encode("utf-8")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("[llm_cache] 写入缓存失败: %s", e)
+        return
+    _bump("stores")
+    root = _cache_dir()
+    with _size_lock:
+        known = root in _approx_bytes
+        if known:
+            _approx_bytes[root] += len(data) - replaced
+        due = (
+            not known
+            or _approx_bytes[root] > get_settings().llm_cache_max_bytes
+            or time.monotonic() - _last_scan.get(root, 0.0) > _EVICT_SCAN_INTERVAL
+        )
+    if due:
+        evict()
+
+
+def evict() -> int:
+    """
+    按 LRU（文件 mtime）淘汰：先删除超龄条目，再删到总大小不超过 llm_cache_max_bytes。返回删除条目数。
+    同时以扫描结果校准 put() 维护的总大小估计值。
+    """
+    s = get_settings()
+    root = _cache_dir()
+    if not root.is_dir():
+        return 0
+    scan_started = time.monotonic()
+    now = time.time()
+    entries: list[tuple[float, int, Path]] = []
+    removed = 0
+    for p in root.glob("*/*.json"):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        # mtime 在命中时刷新，超过 max_age 未访问的条目必然也已超龄
+        if s.llm_cache_max_age_seconds > 0 and now - st.st_mtime > s.llm_cache_max_age_seconds:
+            p.unlink(missing_ok=True)
+            removed += 1
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    if total > s.llm_cache_max_bytes:
+        entries.sort(key=lambda e: e[0])
+        for _, size, p in entries:
+            if total <= s.llm_cache_max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+    with _size_lock:
+        _approx_bytes[root] = total
+        _last_scan[root] = scan_started
+    if removed:
+        _bump("evicted", removed)
+        logger.info("[llm_cache] 淘汰 %d 条缓存", removed)
+    return removed
+
+
+def get_stats() -> dict:
+    """返回缓存统计：hits / misses / stores / evicted。"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def clear() -> None:
+    """清空磁盘缓存（不重置统计）。"""
+    import shutil
+    root = _cache_dir()
+    shutil.rmtree(root, ignore_errors=True)
+    with _size_lock:
+        _approx_bytes.pop(root, None)
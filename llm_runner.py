@@ -1,14 +1,20 @@
-"""基于 LangChain 的可复用 LLM 调用，供题目分析、脚本生成、代码自愈共用。文字与图片题目统一走多模态大模型，仅请求时区分 content 类型。"""
+"""基于 LangChain 的可复用 LLM 调用，供题目分析、脚本生成、代码自愈共用。文字与图片题目统一走多模态大模型，仅请求时区分 content 类型。同步 invoke_* 与异步 ainvoke_* 共用提示拼接、解析与缓存逻辑。"""
+import asyncio
 import json
 import logging
 import re
-from typing import Literal, TypeVar
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Literal, TypeVar
 
+import httpx
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 
+import llm_cache
 from config import get_settings
 
 logger = logging.getLogger(__name__)
@@ -19,6 +25,26 @@ _LOG_CONTENT_MAX = 2000
 T = TypeVar("T", bound=BaseModel)
 
 
+@dataclass
+class _PooledClient:
+    """池中的一个 LLM 客户端：ChatOpenAI 实例与其底层 HTTP 连接池。异步客户端绑定创建时的事件循环。"""
+
+    llm: ChatOpenAI
+    http_client: httpx.Client | httpx.AsyncClient
+    timeout: float
+    last_used: float
+    loop: asyncio.AbstractEventLoop | None = None
+
+
+# 客户端池：(model, base_url, api_key, timeout, temperature, max_tokens, loop) -> _PooledClient
+_client_pool: dict[tuple, _PooledClient] = {}
+_client_pool_lock = threading.Lock()
+_pool_stats = {"hits": 0, "misses": 0, "evicted": 0}
+# 每个使用了异步客户端的事件循环一个守护异步生成器：asyncio.run 等在关闭循环前调用 loop.shutdown_asyncgens()，
+# 守护生成器借此在循环仍可用时 await 关闭该循环的全部异步客户端，连接不留给 GC 回收
+_loop_guards: dict[asyncio.AbstractEventLoop, AsyncIterator[None]] = {}
+
+
 def _truncate_for_log(s: str, max_len: int = _LOG_CONTENT_MAX) -> str:
     if len(s) <= max_len:
         return s
@@ -56,23 +82,16 @@ def _extract_json_from_text(text: str) -> str:
     return text
 
 
-def _invoke_and_parse(
-    llm: BaseChatModel,
-    content: str | list,
-    schema: type[T],
-) -> T:
-    """
-    普通调用 LLM 并手动提取 JSON 解析为 Pydantic 模型。
-
-    在 prompt 末尾追加 JSON 格式约束，引导模型直接返回 JSON；
-    即便模型返回 Markdown 代码块包裹的 JSON，也能通过 _extract_json_from_text 提取。
-
-    不使用 with_structured_output，因为当前网关不支持 OpenAI 原生 response_format。
-    """
-    json_hint = (
+def _json_hint(schema: type[BaseModel]) -> str:
+    return (
         "\n\n**重要：请只输出纯 JSON，不要包含 Markdown 代码块（```）、注释或任何其他文字。**"
         f"\nJSON Schema: {json.dumps(schema.model_json_schema(), ensure_ascii=False)}"
     )
+
+
+def _with_json_hint(content: str | list, schema: type[BaseModel]) -> str | list:
+    """在 prompt（多模态时为 text 部分）末尾追加 JSON 格式约束。"""
+    json_hint = _json_hint(schema)
     if isinstance(content, list):
         # 多模态：在 text 部分追加提示
         patched_content = []
@@ -81,10 +100,12 @@ def _invoke_and_parse(
                 patched_content.append({**item, "text": item["text"] + json_hint})
             else:
                 patched_content.append(item)
-        msg = llm.invoke([HumanMessage(content=patched_content)])
-    else:
-        msg = llm.invoke([HumanMessage(content=content + json_hint)])
+        return patched_content
+    return content + json_hint
+
 
+def _parse_structured(msg, schema: type[T]) -> T:
+    """从模型返回消息中提取 JSON 并校验为 Pydantic 模型。"""
     raw_content = msg.content if hasattr(msg, "content") else str(msg)
     logger.info("[LLM] 调用完成, raw_len=%d", len(raw_content))
     logger.debug("[LLM] raw response: %s", _truncate_for_log(raw_content))
@@ -95,14 +116,327 @@ def _invoke_and_parse(
     return schema.model_validate_json(extracted)
 
 
-def get_chat_model(
+def _invoke_and_parse(
+    llm: BaseChatModel,
+    content: str | list,
+    schema: type[T],
+) -> T:
+    """
+    普通调用 LLM 并手动提取 JSON 解析为 Pydantic 模型。
+
+    在 prompt 末尾追加 JSON 格式约束，引导模型直接返回 JSON；
+    即便模型返回 Markdown 代码块包裹的 JSON，也能通过 _extract_json_from_text 提取。
+
+    不使用 with_structured_output，因为当前网关不支持 OpenAI 原生 response_format。
+    """
+    msg = llm.invoke([HumanMessage(content=_with_json_hint(content, schema))])
+    return _parse_structured(msg, schema)
+
+
+async def _ainvoke(
+    llm: BaseChatModel,
+    content: str | list,
+    cancel_event: asyncio.Event | None = None,
+):
+    """
+    异步调用 LLM。任务被取消时底层 HTTP 请求随之中止；
+    传入 cancel_event 时，事件被置位即取消进行中的请求并抛出 asyncio.CancelledError。
+    """
+    await _ensure_loop_guard()
+    call = llm.ainvoke([HumanMessage(content=content)])
+    if cancel_event is None:
+        return await call
+    if cancel_event.is_set():
+        call.close()
+        raise asyncio.CancelledError("LLM 调用已取消")
+    call_task = asyncio.ensure_future(call)
+    cancel_task = asyncio.ensure_future(cancel_event.wait())
+    try:
+        await asyncio.wait({call_task, cancel_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # 外层被取消时两个子任务都需要清理
+        cancel_task.cancel()
+        if not call_task.done():
+            call_task.cancel()
+    if call_task.cancelled() or not call_task.done():
+        logger.info("[LLM] 调用已取消")
+        raise asyncio.CancelledError("LLM 调用已取消")
+    return call_task.result()
+
+
+async def _ainvoke_and_parse(
+    llm: BaseChatModel,
+    content: str | list,
+    schema: type[T],
+    cancel_event: asyncio.Event | None = None,
+) -> T:
+    """_invoke_and_parse 的异步版本，JSON 提示与解析逻辑一致。"""
+    msg = await _ainvoke(llm, _with_json_hint(content, schema), cancel_event)
+    return _parse_structured(msg, schema)
+
+
+def _cache_key(
+    llm: BaseChatModel,
+    kind: str,
+    prompt: str,
+    *,
+    image: str | None = None,
+    schema: type[BaseModel] | None = None,
+) -> str | None:
+    """缓存开启时返回缓存键，否则返回 None。模型、接口地址、温度与 max_tokens 取自实际使用的客户端。"""
+    if not llm_cache.is_enabled():
+        return None
+    return llm_cache.make_key(
+        kind=kind,
+        model=getattr(llm, "model_name", ""),
+        base_url=getattr(llm, "openai_api_base", None),
+        max_tokens=getattr(llm, "max_tokens", None),
+        temperature=getattr(llm, "temperature", None),
+        prompt=prompt,
+        image=image,
+        schema=schema,
+    )
+
+
+def _cache_lookup(key: str | None, use_cache: bool, schema: type[T] | None = None) -> T | str | None:
+    """查缓存：structured 命中时直接由已校验的 JSON 还原模型，不再提取 JSON。"""
+    if not key or not use_cache:
+        return None
+    cached = llm_cache.get(key)
+    if cached is None:
+        return None
+    logger.info("[LLM] 缓存命中 %s key=%s", schema.__name__ if schema else "plain", key[:12])
+    # 每次还原新实例，调用方可安全修改返回值
+    return schema.model_validate(cached) if schema else cached
+
+
+def _cached_invoke_and_parse(
+    llm: BaseChatModel,
+    content: str | list,
+    schema: type[T],
+    *,
+    prompt: str,
+    image: str | None = None,
+    use_cache: bool = True,
+) -> T:
+    """带缓存的 _invoke_and_parse。"""
+    key = _cache_key(llm, "structured", prompt, image=image, schema=schema)
+    cached = _cache_lookup(key, use_cache, schema)
+    if cached is not None:
+        return cached
+    result = _invoke_and_parse(llm, content, schema)
+    if key:
+        llm_cache.put(key, result.model_dump(mode="json"))
+    return result
+
+
+async def _acached_invoke_and_parse(
+    llm: BaseChatModel,
+    content: str | list,
+    schema: type[T],
+    *,
+    prompt: str,
+    image: str | None = None,
+    use_cache: bool = True,
+    cancel_event: asyncio.Event | None = None,
+) -> T:
+    """带缓存的 _ainvoke_and_parse。"""
+    key = _cache_key(llm, "structured", prompt, image=image, schema=schema)
+    cached = _cache_lookup(key, use_cache, schema)
+    if cached is not None:
+        return cached
+    result = await _ainvoke_and_parse(llm, content, schema, cancel_event)
+    if key:
+        llm_cache.put(key, result.model_dump(mode="json"))
+    return result
+
+
+def _usage_of(msg) -> dict:
+    """从响应中取 token 用量（usage_metadata），模型未返回时为 None。"""
+    meta = getattr(msg, "usage_metadata", None) or {}
+    return {"input_tokens": meta.get("input_tokens"), "output_tokens": meta.get("output_tokens")}
+
+
+def _cached_invoke_text(
+    llm: BaseChatModel,
+    content: str | list,
+    *,
+    prompt: str,
+    image: str | None = None,
+    use_cache: bool = True,
+    usage: dict | None = None,
+) -> str:
+    """带缓存的纯文本调用。usage 不为 None 时写入本次调用的 token 用量（命中缓存时为 0）。"""
+    key = _cache_key(llm, "plain", prompt, image=image)
+    cached = _cache_lookup(key, use_cache)
+    if cached is not None:
+        if usage is not None:
+            usage.update(input_tokens=0, output_tokens=0)
+        return cached
+    msg = llm.invoke([HumanMessage(content=content)])
+    out = msg.content if hasattr(msg, "content") else str(msg)
+    if usage is not None:
+        usage.update(_usage_of(msg))
+    if key:
+        llm_cache.put(key, out)
+    return out
+
+
+async def _acached_invoke_text(
+    llm: BaseChatModel,
+    content: str | list,
+    *,
+    prompt: str,
+    image: str | None = None,
+    use_cache: bool = True,
+    cancel_event: asyncio.Event | None = None,
+) -> str:
+    """带缓存的异步纯文本调用。"""
+    key = _cache_key(llm, "plain", prompt, image=image)
+    cached = _cache_lookup(key, use_cache)
+    if cached is not None:
+        return cached
+    msg = await _ainvoke(llm, content, cancel_event)
+    out = msg.content if hasattr(msg, "content") else str(msg)
+    if key:
+        llm_cache.put(key, out)
+    return out
+
+
+def _pool_key(kwargs: dict, loop: asyncio.AbstractEventLoop | None = None) -> tuple:
+    return (
+        kwargs["model"],
+        kwargs.get("base_url"),
+        kwargs.get("api_key"),
+        kwargs["request_timeout"],
+        kwargs["temperature"],
+        kwargs.get("max_tokens"),
+        loop,
+    )
+
+
+def _evict_idle_clients(now: float, idle_timeout: float) -> list[_PooledClient]:
+    """移除空闲超时或所属事件循环已关闭的客户端（需持有 _client_pool_lock），返回待关闭的客户端。"""
+    expired: list[_PooledClient] = []
+    for key, entry in list(_client_pool.items()):
+        loop_closed = entry.loop is not None and entry.loop.is_closed()
+        # 阈值不小于请求超时，避免关闭仍在等待响应的长请求
+        if loop_closed or now - entry.last_used > max(idle_timeout, entry.timeout):
+            expired.append(_client_pool.pop(key))
+    for loop in [lp for lp in _loop_guards if lp.is_closed()]:
+        del _loop_guards[loop]
+    _pool_stats["evicted"] += len(expired)
+    return expired
+
+
+def _close_client(entry: _PooledClient) -> None:
+    if isinstance(entry.http_client, httpx.Client):
+        entry.http_client.close()
+        return
+    # 异步客户端须在其所属事件循环中关闭；正常情况下已由守护生成器在循环关闭前关闭，
+    # 仅未调用 shutdown_asyncgens 就关闭的循环会走到这里，连接随对象回收
+    loop = entry.loop
+    if loop is not None and not loop.is_closed() and loop.is_running():
+        loop.call_soon_threadsafe(lambda: loop.create_task(entry.http_client.aclose()))
+
+
+async def _loop_guard(loop: asyncio.AbstractEventLoop) -> AsyncIterator[None]:
+    try:
+        yield
+    finally:
+        await _aclose_loop_clients(loop)
+
+
+async def _ensure_loop_guard() -> None:
+    """当前循环有池化的异步客户端且尚未注册守护生成器时注册（首次迭代即被循环登记，循环关闭前由其 aclose）。"""
+    loop = asyncio.get_running_loop()
+    with _client_pool_lock:
+        if loop in _loop_guards or not any(e.loop is loop for e in _client_pool.values()):
+            return
+        guard = _loop_guards[loop] = _loop_guard(loop)
+    await guard.__anext__()
+
+
+async def _aclose_loop_clients(loop: asyncio.AbstractEventLoop) -> None:
+    """在 loop 内关闭并移出绑定该循环的异步客户端。"""
+    with _client_pool_lock:
+        _loop_guards.pop(loop, None)
+        keys = [k for k, e in _client_pool.items() if e.loop is loop]
+        entries = [_client_pool.pop(k) for k in keys]
+        _pool_stats["evicted"] += len(entries)
+    for entry in entries:
+        try:
+            await entry.http_client.aclose()
+        except Exception as e:
+            logger.warning("[LLM] 关闭异步客户端失败: %s", e)
+
+
+def _get_pooled_model(kwargs: dict, loop: asyncio.AbstractEventLoop | None = None) -> BaseChatModel:
+    """
+    按配置键从客户端池取 ChatOpenAI，未命中时创建带 keep-alive 连接池的新客户端。
+    传入 loop 时返回绑定该事件循环的异步客户端（httpx.AsyncClient 不能跨循环复用），在循环关闭前由守护生成器关闭。
+    """
+    s = get_settings()
+    key = _pool_key(kwargs, loop)
+    now = time.monotonic()
+    with _client_pool_lock:
+        expired = _evict_idle_clients(now, s.llm_pool_idle_timeout)
+        entry = _client_pool.get(key)
+        if entry is not None:
+            _pool_stats["hits"] += 1
+            entry.last_used = now
+        else:
+            _pool_stats["misses"] += 1
+            limits = httpx.Limits(
+                max_connections=s.llm_pool_max_connections,
+                max_keepalive_connections=s.llm_pool_max_keepalive,
+                keepalive_expiry=s.llm_pool_keepalive_expiry,
+            )
+            if loop is None:
+                http_client: httpx.Client | httpx.AsyncClient = httpx.Client(limits=limits)
+                llm = ChatOpenAI(**kwargs, http_client=http_client)
+            else:
+                http_client = httpx.AsyncClient(limits=limits)
+                llm = ChatOpenAI(**kwargs, http_async_client=http_client)
+            entry = _PooledClient(
+                llm=llm,
+                http_client=http_client,
+                timeout=float(kwargs["request_timeout"]),
+                last_used=now,
+                loop=loop,
+            )
+            _client_pool[key] = entry
+            logger.info(
+                "[LLM] 新建%s客户端 model=%s pool_size=%d",
+                "异步" if loop else "", kwargs["model"], len(_client_pool),
+            )
+    for old in expired:
+        _close_client(old)
+    return entry.llm
+
+
+def get_llm_pool_stats() -> dict:
+    """返回客户端池统计：hits / misses / evicted / size。"""
+    with _client_pool_lock:
+        return {**_pool_stats, "size": len(_client_pool)}
+
+
+def close_llm_clients() -> None:
+    """关闭并清空池中所有客户端（应用退出时调用）。"""
+    with _client_pool_lock:
+        entries = list(_client_pool.values())
+        _client_pool.clear()
+    for entry in entries:
+        _close_client(entry)
+
+
+def _chat_model_kwargs(
     *,
     model: str | None = None,
     temperature: float | None = None,
     max_tokens: int | None = None,
     timeout: float | None = None,
-) -> BaseChatModel:
-    """返回配置好的文本 ChatModel（OpenAI），参数未传时使用配置文件中的文本模型配置。"""
+) -> dict:
     s = get_settings()
     kwargs = {
         "model": model or s.llm_model,
@@ -114,22 +448,16 @@ def get_chat_model(
         kwargs["base_url"] = s.openai_base_url
     if max_tokens is not None or s.llm_max_tokens is not None:
         kwargs["max_tokens"] = max_tokens if max_tokens is not None else s.llm_max_tokens
-    return ChatOpenAI(**kwargs)
+    return kwargs
 
 
-def get_vision_model(
+def _vision_model_kwargs(
     *,
     model: str | None = None,
     temperature: float | None = None,
     max_tokens: int | None = None,
     timeout: float | None = None,
-) -> BaseChatModel:
-    """
-    返回配置好的视觉 ChatModel（OpenAI），用于图片识别、带图分析等多模态任务。
-
-    优先使用 vision_* 配置，未设置时自动回退到文本模型的对应配置。
-    调用方传入的参数优先级最高。
-    """
+) -> dict:
     s = get_settings()
     kwargs = {
         "model": model or s.vision_model or s.llm_model,
@@ -151,7 +479,83 @@ def get_vision_model(
     )
     if effective_max_tokens is not None:
         kwargs["max_tokens"] = effective_max_tokens
-    return ChatOpenAI(**kwargs)
+    return kwargs
+
+
+def get_chat_model(
+    *,
+    model: str | None = None,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    timeout: float | None = None,
+) -> BaseChatModel:
+    """返回配置好的文本 ChatModel（OpenAI），参数未传时使用配置文件中的文本模型配置。相同配置复用池中客户端。"""
+    kwargs = _chat_model_kwargs(model=model, temperature=temperature, max_tokens=max_tokens, timeout=timeout)
+    return _get_pooled_model(kwargs)
+
+
+def get_vision_model(
+    *,
+    model: str | None = None,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    timeout: float | None = None,
+) -> BaseChatModel:
+    """
+    返回配置好的视觉 ChatModel（OpenAI），用于图片识别、带图分析等多模态任务。
+
+    优先使用 vision_* 配置，未设置时自动回退到文本模型的对应配置。
+    调用方传入的参数优先级最高。
+    """
+    kwargs = _vision_model_kwargs(model=model, temperature=temperature, max_tokens=max_tokens, timeout=timeout)
+    return _get_pooled_model(kwargs)
+
+
+def _aget_chat_model(*, model: str | None = None, timeout: float | None = None) -> BaseChatModel:
+    """当前事件循环内复用的异步文本 ChatModel。"""
+    return _get_pooled_model(_chat_model_kwargs(model=model, timeout=timeout), asyncio.get_running_loop())
+
+
+def _aget_vision_model(*, model: str | None = None, timeout: float | None = None) -> BaseChatModel:
+    """当前事件循环内复用的异步视觉 ChatModel。"""
+    return _get_pooled_model(_vision_model_kwargs(model=model, timeout=timeout), asyncio.get_running_loop())
+
+
+def _image_content(prompt: str, image_base64: str, image_mime_type: str) -> list:
+    url = f"data:{image_mime_type};base64,{image_base64}"
+    return [
+        {"type": "text", "text": prompt},
+        {"type": "image_url", "image_url": {"url": url}},
+    ]
+
+
+def _multimodal_plain_content(
+    prompt: str,
+    content_type: Literal["text", "image"],
+    text: str | None,
+    image_base64: str | None,
+    image_mime_type: str,
+) -> tuple[str | list, str]:
+    """按 content_type 组装请求 content，返回 (content, 用于缓存键的文本)。"""
+    if content_type == "text":
+        if text is None or text == "":
+            raise ValueError("content_type 为 text 时需提供 text")
+        content = f"{prompt}\n\n{text}" if (prompt and prompt.strip()) else text
+        logger.info("[LLM] invoke_multimodal_plain 请求 content_type=text prompt_len=%d text_len=%d", len(prompt), len(text or ""))
+        logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
+        logger.info("[LLM] text: %s", _truncate_for_log(text or ""))
+        return content, content
+    if not image_base64:
+        raise ValueError("content_type 为 image 时需提供 image_base64")
+    logger.info("[LLM] invoke_multimodal_plain 请求 content_type=image prompt_len=%d image_base64_len=%d", len(prompt), len(image_base64))
+    logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
+    return _image_content(prompt, image_base64, image_mime_type), prompt
+
+
+def _log_structured_response(name: str, schema: type[BaseModel], result: BaseModel) -> None:
+    out_str = result.model_dump_json() if hasattr(result, "model_dump_json") else str(result)
+    logger.info("[LLM] %s 响应 schema=%s response_len=%d", name, schema.__name__, len(out_str))
+    logger.info("[LLM] response: %s", _truncate_for_log(out_str))
 
 
 def invoke_structured(
@@ -160,28 +564,44 @@ def invoke_structured(
     *,
     model: str | None = None,
     timeout: float | None = None,
+    use_cache: bool = True,
 ) -> T:
-    """调用 LLM 并解析为 Pydantic 模型。供题目分析、脚本生成等复用。"""
+    """
+    调用 LLM 并解析为 Pydantic 模型。供题目分析、脚本生成等复用。
+    use_cache=False 时跳过缓存读取（仍写入新结果），用于强制重新生成。
+    """
     logger.info("[LLM] invoke_structured 请求 schema=%s prompt_len=%d", schema.__name__, len(prompt))
     logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
     llm = get_chat_model(model=model, timeout=timeout)
-    result = _invoke_and_parse(llm, prompt, schema)
-    out_str = result.model_dump_json() if hasattr(result, "model_dump_json") else str(result)
-    logger.info("[LLM] invoke_structured 响应 schema=%s response_len=%d", schema.__name__, len(out_str))
-    logger.info("[LLM] response: %s", _truncate_for_log(out_str))
+    result = _cached_invoke_and_parse(llm, prompt, schema, prompt=prompt, use_cache=use_cache)
+    _log_structured_response("invoke_structured", schema, result)
     return result
 
 
-def invoke_plain(prompt: str, *, model: str | None = None) -> str:
+def invoke_plain(prompt: str, *, model: str | None = None, use_cache: bool = True) -> str:
     """调用 LLM 返回纯文本（用于代码自愈等）。"""
+    return invoke_plain_with_usage(prompt, model=model, use_cache=use_cache)[0]
+
+
+def invoke_plain_with_usage(
+    prompt: str,
+    *,
+    model: str | None = None,
+    temperature: float | None = None,
+    use_cache: bool = True,
+) -> tuple[str, dict]:
+    """同 invoke_plain，额外返回 token 用量 {"input_tokens", "output_tokens"}（模型未返回用量时为 None）。temperature 未传时用配置值。"""
     logger.info("[LLM] invoke_plain 请求 prompt_len=%d", len(prompt))
     logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
-    llm = get_chat_model(model=model)
-    msg = llm.invoke([HumanMessage(content=prompt)])
-    content = msg.content if hasattr(msg, "content") else str(msg)
-    logger.info("[LLM] invoke_plain 响应 response_len=%d", len(content))
+    llm = get_chat_model(model=model, temperature=temperature)
+    usage: dict = {}
+    content = _cached_invoke_text(llm, prompt, prompt=prompt, use_cache=use_cache, usage=usage)
+    logger.info(
+        "[LLM] invoke_plain 响应 response_len=%d tokens_in=%s tokens_out=%s",
+        len(content), usage.get("input_tokens"), usage.get("output_tokens"),
+    )
     logger.info("[LLM] response: %s", _truncate_for_log(content))
-    return content
+    return content, usage
 
 
 def invoke_multimodal_plain(
@@ -192,6 +612,7 @@ def invoke_multimodal_plain(
     image_base64: str | None = None,
     image_mime_type: str = "image/jpeg",
     model: str | None = None,
+    use_cache: bool = True,
 ) -> str:
     """
     多模态大模型调用，返回纯文本。请求时区分是文字还是图片：
@@ -200,25 +621,14 @@ def invoke_multimodal_plain(
     """
     # 图片走视觉模型，纯文本走文本模型
     llm = get_vision_model(model=model) if content_type == "image" else get_chat_model(model=model)
-    if content_type == "text":
-        if text is None or text == "":
-            raise ValueError("content_type 为 text 时需提供 text")
-        content: str | list = f"{prompt}\n\n{text}" if (prompt and prompt.strip()) else text
-        logger.info("[LLM] invoke_multimodal_plain 请求 content_type=text prompt_len=%d text_len=%d", len(prompt), len(text or ""))
-        logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
-        logger.info("[LLM] text: %s", _truncate_for_log(text or ""))
-    else:
-        if not image_base64:
-            raise ValueError("content_type 为 image 时需提供 image_base64")
-        url = f"data:{image_mime_type};base64,{image_base64}"
-        content = [
-            {"type": "text", "text": prompt},
-            {"type": "image_url", "image_url": {"url": url}},
-        ]
-        logger.info("[LLM] invoke_multimodal_plain 请求 content_type=image prompt_len=%d image_base64_len=%d", len(prompt), len(image_base64))
-        logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
-    msg = llm.invoke([HumanMessage(content=content)])
-    out = msg.content if hasattr(msg, "content") else str(msg)
+    content, cache_prompt = _multimodal_plain_content(prompt, content_type, text, image_base64, image_mime_type)
+    out = _cached_invoke_text(
+        llm,
+        content,
+        prompt=cache_prompt,
+        image=llm_cache.image_digest(image_base64, image_mime_type) if content_type == "image" else None,
+        use_cache=use_cache,
+    )
     logger.info("[LLM] invoke_multimodal_plain 响应 response_len=%d", len(out))
     logger.info("[LLM] response: %s", _truncate_for_log(out))
     return out
@@ -230,6 +640,7 @@ def invoke_vision_plain(
     mime_type: str = "image/jpeg",
     *,
     model: str | None = None,
+    use_cache: bool = True,
 ) -> str:
     """调用视觉模型识别图片内容，返回纯文本。内部使用 invoke_multimodal_plain(content_type="image")。"""
     return invoke_multimodal_plain(
@@ -238,6 +649,7 @@ def invoke_vision_plain(
         image_base64=image_base64,
         image_mime_type=mime_type,
         model=model,
+        use_cache=use_cache,
     )
 
 
@@ -249,6 +661,7 @@ def invoke_multimodal_structured(
     image_mime_type: str = "image/jpeg",
     model: str | None = None,
     timeout: float | None = None,
+    use_cache: bool = True,
 ) -> T:
     """
     多模态结构化输出：同时传入文本提示与可选图片，返回 Pydantic 模型。
@@ -263,18 +676,123 @@ def invoke_multimodal_structured(
     # 有图片走视觉模型，纯文本走文本模型
     if image_base64:
         llm = get_vision_model(model=model, timeout=timeout)
+        content: str | list = _image_content(prompt, image_base64, image_mime_type)
     else:
         llm = get_chat_model(model=model, timeout=timeout)
+        content = prompt
+    result = _cached_invoke_and_parse(
+        llm,
+        content,
+        schema,
+        prompt=prompt,
+        image=llm_cache.image_digest(image_base64, image_mime_type),
+        use_cache=use_cache,
+    )
+    _log_structured_response("invoke_multimodal_structured", schema, result)
+    return result
+
+
+# ---------- 异步 API：基于 ainvoke，可在单个事件循环中并发多个 LLM 请求 ----------
+# 取消方式：取消所在的 asyncio 任务，或传入 cancel_event 并在任意协程中 set()。
+
+
+async def ainvoke_structured(
+    prompt: str,
+    schema: type[T],
+    *,
+    model: str | None = None,
+    timeout: float | None = None,
+    use_cache: bool = True,
+    cancel_event: asyncio.Event | None = None,
+) -> T:
+    """invoke_structured 的异步版本。"""
+    logger.info("[LLM] ainvoke_structured 请求 schema=%s prompt_len=%d", schema.__name__, len(prompt))
+    logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
+    llm = _aget_chat_model(model=model, timeout=timeout)
+    result = await _acached_invoke_and_parse(
+        llm, prompt, schema, prompt=prompt, use_cache=use_cache, cancel_event=cancel_event,
+    )
+    _log_structured_response("ainvoke_structured", schema, result)
+    return result
+
+
+async def ainvoke_plain(
+    prompt: str,
+    *,
+    model: str | None = None,
+    use_cache: bool = True,
+    cancel_event: asyncio.Event | None = None,
+) -> str:
+    """invoke_plain 的异步版本。"""
+    logger.info("[LLM] ainvoke_plain 请求 prompt_len=%d", len(prompt))
+    logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
+    llm = _aget_chat_model(model=model)
+    content = await _acached_invoke_text(
+        llm, prompt, prompt=prompt, use_cache=use_cache, cancel_event=cancel_event,
+    )
+    logger.info("[LLM] ainvoke_plain 响应 response_len=%d", len(content))
+    logger.info("[LLM] response: %s", _truncate_for_log(content))
+    return content
+
+
+async def ainvoke_multimodal_plain(
+    prompt: str,
+    *,
+    content_type: Literal["text", "image"],
+    text: str | None = None,
+    image_base64: str | None = None,
+    image_mime_type: str = "image/jpeg",
+    model: str | None = None,
+    use_cache: bool = True,
+    cancel_event: asyncio.Event | None = None,
+) -> str:
+    """invoke_multimodal_plain 的异步版本。"""
+    llm = _aget_vision_model(model=model) if content_type == "image" else _aget_chat_model(model=model)
+    content, cache_prompt = _multimodal_plain_content(prompt, content_type, text, image_base64, image_mime_type)
+    out = await _acached_invoke_text(
+        llm,
+        content,
+        prompt=cache_prompt,
+        image=llm_cache.image_digest(image_base64, image_mime_type) if content_type == "image" else None,
+        use_cache=use_cache,
+        cancel_event=cancel_event,
+    )
+    logger.info("[LLM] ainvoke_multimodal_plain 响应 response_len=%d", len(out))
+    logger.info("[LLM] response: %s", _truncate_for_log(out))
+    return out
+
+
+async def ainvoke_multimodal_structured(
+    prompt: str,
+    schema: type[T],
+    *,
+    image_base64: str | None = None,
+    image_mime_type: str = "image/jpeg",
+    model: str | None = None,
+    timeout: float | None = None,
+    use_cache: bool = True,
+    cancel_event: asyncio.Event | None = None,
+) -> T:
+    """invoke_multimodal_structured 的异步版本。"""
+    logger.info(
+        "[LLM] ainvoke_multimodal_structured 请求 schema=%s prompt_len=%d has_image=%s",
+        schema.__name__, len(prompt), bool(image_base64),
+    )
+    logger.info("[LLM] prompt: %s", _truncate_for_log(prompt))
     if image_base64:
-        url = f"data:{image_mime_type};base64,{image_base64}"
-        content: str | list = [
-            {"type": "text", "text": prompt},
-            {"type": "image_url", "image_url": {"url": url}},
-        ]
+        llm = _aget_vision_model(model=model, timeout=timeout)
+        content: str | list = _image_content(prompt, image_base64, image_mime_type)
     else:
+        llm = _aget_chat_model(model=model, timeout=timeout)
         content = prompt
-    result = _invoke_and_parse(llm, content, schema)
-    out_str = result.model_dump_json() if hasattr(result, "model_dump_json") else str(result)
-    logger.info("[LLM] invoke_multimodal_structured 响应 schema=%s response_len=%d", schema.__name__, len(out_str))
-    logger.info("[LLM] response: %s", _truncate_for_log(out_str))
+    result = await _acached_invoke_and_parse(
+        llm,
+        content,
+        schema,
+        prompt=prompt,
+        image=llm_cache.image_digest(image_base64, image_mime_type),
+        use_cache=use_cache,
+        cancel_event=cancel_event,
+    )
+    _log_structured_response("ainvoke_multimodal_structured", schema, result)
     return result
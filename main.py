@@ -1,12 +1,18 @@
-"""FastAPI 应用入口：挂载 API、结果视频静态目录、Web 前端静态目录。"""
+"""FastAPI 应用入口：挂载 API、结果视频与 HLS 静态目录、Web 前端静态目录。"""
 import logging
+import mimetypes
 from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
+from api import artifact_store, result_cache, scheduler
 from api.history_store import init_db as init_history_db
-from api.routes import router, RESULTS_DIR
+from api.routes import router, HLS_DIR, RESULTS_DIR
+from asset_generation.manim_render import prune_media_dirs
+from asset_generation.manim_worker import shutdown_worker_pool
+from config import get_settings
+from llm_runner import close_llm_clients
 
 # 配置日志：便于查看 /api/generate_video 及流水线执行进度
 logging.basicConfig(
@@ -23,6 +29,21 @@ app = FastAPI(title="数学讲解视频流水线", version="0.1.0")
 @app.on_event("startup")
 def startup():
     init_history_db()
+    # 清理失败后长期未重试任务的 Manim 渲染目录
+    prune_media_dirs(RESULTS_DIR.parent, get_settings().manim_media_max_age_hours)
+    # 后台按时长与配额回收任务目录、无人引用的成品
+    artifact_store.start_sweeper()
+    # 流水线版本、模型或音色变化后，旧的成品缓存条目不再可能命中
+    if result_cache.is_enabled():
+        result_cache.purge_stale()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    close_llm_clients()
+    artifact_store.stop_sweeper()
+    scheduler.shutdown_scheduler()
+    shutdown_worker_pool()
 
 
 app.include_router(router, prefix="/api", tags=["explainer"])
@@ -30,6 +51,11 @@ app.include_router(router, prefix="/api", tags=["explainer"])
 # 结果视频通过 /results/{task_id}.mp4 访问
 app.mount("/results", StaticFiles(directory=str(RESULTS_DIR)), name="results")
 
+# HLS 播放列表与分片通过 /hls/{task_id}/master.m3u8 访问
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
+app.mount("/hls", StaticFiles(directory=str(HLS_DIR)), name="hls")
+
 # Web 界面：静态页面目录
 STATIC_DIR = Path(__file__).resolve().parent / "static"
 if STATIC_DIR.exists():
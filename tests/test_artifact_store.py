@@ -0,0 +1,65 @@
+"""成品存储单测：内容寻址硬链接发布与去重，任务目录按状态/时长/配额回收。"""
+import os
+import time
+
+from api import artifact_store
+
+
+def test_publish_hardlinks_and_dedups(tmp_path):
+    store = tmp_path / "artifacts"
+    a = tmp_path / "t1" / "final.mp4"
+    b = tmp_path / "t2" / "final.mp4"
+    for p in (a, b):
+        p.parent.mkdir()
+        p.write_bytes(b"same video")
+    d1 = artifact_store.publish(a, tmp_path / "results" / "t1.mp4", artifacts_dir=store)
+    d2 = artifact_store.publish(b, tmp_path / "results" / "t2.mp4", artifacts_dir=store)
+    assert d1 == d2
+    blobs = list(store.glob("*/*"))
+    assert len(blobs) == 1
+    # 第二个任务的结果复用第一份内容
+    assert os.path.samefile(tmp_path / "results" / "t2.mp4", blobs[0])
+    assert os.path.samefile(a, blobs[0])
+
+
+def test_sweep_respects_retryable_tasks_and_quota(tmp_path, monkeypatch):
+    monkeypatch.setenv("WORK_RETENTION_SUCCESS_HOURS", "24")
+    monkeypatch.setenv("WORK_RETENTION_FAILED_HOURS", "168")
+    monkeypatch.setenv("OUTPUT_QUOTA_BYTES", "250")
+    statuses = {"old_ok": "success", "new_ok": "success", "newer_ok": "success", "failed": "failed"}
+    monkeypatch.setattr(artifact_store, "_task_status", lambda task_id: statuses.get(task_id, ""))
+    now = time.time()
+    ages = {"old_ok": 48, "new_ok": 2, "newer_ok": 1, "failed": 100}
+    for name, hours in ages.items():
+        f = tmp_path / name / "work" / "manim.mp4"
+        f.parent.mkdir(parents=True)
+        f.write_bytes(b"x" * 100)
+        for p in (f, f.parent, f.parent.parent):
+            os.utime(p, (now - hours * 3600, now - hours * 3600))
+    (tmp_path / "results").mkdir()
+    orphan = tmp_path / "artifacts" / "ab" / "abc.mp4"
+    orphan.parent.mkdir(parents=True)
+    orphan.write_bytes(b"y" * 10)
+
+    result = artifact_store.sweep(tmp_path, now=now)
+    left = sorted(p.name for p in tmp_path.iterdir())
+    # 超时的成功任务删除；超出配额时先删较旧的成功任务；失败任务未超时保留
+    assert left == ["artifacts", "failed", "newer_ok", "results"]
+    assert result == {"removed_dirs": 2, "removed_artifacts": 1, "reclaimed_bytes": 210}
+
+
+def test_sweep_removes_hls_of_reclaimed_artifacts(tmp_path):
+    src = tmp_path / "final.mp4"
+    src.write_bytes(b"video")
+    kept = artifact_store.publish(src, tmp_path / "results" / "t1.mp4", artifacts_dir=tmp_path / "artifacts")
+    gone = "f" * 64
+    hls = tmp_path / "hls"
+    for digest in (kept, gone):
+        (hls / digest).mkdir(parents=True)
+        (hls / digest / "master.m3u8").write_text("#EXTM3U\n")
+    os.symlink(kept, hls / "t1")
+    os.symlink(gone, hls / "t2")
+    artifact_store.sweep(tmp_path)
+    # t2 的成品已不在库中：共享目录与其链接一并删除
+    assert (hls / "t1" / "master.m3u8").is_file()
+    assert not (hls / gone).exists() and not (hls / "t2").is_symlink()
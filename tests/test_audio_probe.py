@@ -0,0 +1,38 @@
+"""音频时长探测单测：用合成的 MP3 帧验证帧头解析与 Xing/LAME 标签处理。"""
+from asset_generation.audio_probe import probe_durations, probe_mp3_duration
+
+
+def _edge_tts_like_frames(n: int) -> bytes:
+    # MPEG2 Layer III, 48kbps, 24kHz, 单声道：每帧 144 字节、576 采样（edge-tts 默认输出格式）
+    frame = bytes([0xFF, 0xF3, 0x64, 0xC4]) + bytes(140)
+    return frame * n
+
+
+def test_probe_counts_frames_and_skips_id3(tmp_path):
+    id3 = b"ID3\x04\x00\x00\x00\x00\x00\x0a" + bytes(10)
+    p = tmp_path / "a.mp3"
+    p.write_bytes(id3 + _edge_tts_like_frames(100) + b"TAG" + bytes(125))
+    assert probe_mp3_duration(p) == 2.4
+
+
+def test_probe_uses_xing_frame_count_and_lame_gapless_info(tmp_path):
+    # MPEG1 Layer III, 128kbps, 44.1kHz, 立体声：每帧 417 字节、1152 采样；首帧为 Info 标签
+    header = bytes([0xFF, 0xFB, 0x90, 0x00])
+    tag = b"Info" + (1).to_bytes(4, "big") + (10).to_bytes(4, "big")
+    lame = b"LAME3.100" + bytes(12) + ((576 << 12) | 1000).to_bytes(3, "big")
+    info_frame = (header + bytes(32) + tag + lame).ljust(417, b"\x00")
+    audio_frame = header + bytes(413)
+    p = tmp_path / "b.mp3"
+    p.write_bytes(info_frame + audio_frame * 10)
+    # 10 * 1152 - 576 - 1000 = 9944 采样
+    assert probe_mp3_duration(p) == round(1000 * 9944 / 44100) / 1000.0
+
+
+def test_probe_non_mp3_returns_none_and_batch_keeps_order(tmp_path):
+    bad = tmp_path / "bad.mp3"
+    bad.write_bytes(b"not an mp3")
+    assert probe_mp3_duration(bad) is None
+    a, b = tmp_path / "1.mp3", tmp_path / "2.mp3"
+    a.write_bytes(_edge_tts_like_frames(50))
+    b.write_bytes(_edge_tts_like_frames(25))
+    assert probe_durations([a, b]) == [1.2, 0.6]
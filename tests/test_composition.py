@@ -3,7 +3,7 @@ from pathlib import Path
 
 import pytest
 
-from composition.ffmpeg_compose import CompositionError, compose_video
+from composition.ffmpeg_compose import CompositionError, compose_video, compose_video_with_audio_segments
 
 
 def test_compose_video_missing_video_raises():
@@ -14,3 +14,170 @@ def test_compose_video_missing_video_raises():
 def test_compose_video_missing_audio_raises():
     with pytest.raises(CompositionError, match="音频文件不存在"):
         compose_video(__file__, "/nonexistent/audio.mp3", "/tmp/out.mp4")
+
+
+def test_fused_compose_missing_audio_segment_raises():
+    with pytest.raises(CompositionError, match="音频文件不存在"):
+        compose_video_with_audio_segments(__file__, [__file__, "/nonexistent/step_2.mp3"], "/tmp/out.mp4")
+
+
+def test_run_command_kills_process_on_cancel():
+    import sys
+    import threading
+    import time
+
+    from composition.ffmpeg_compose import run_command
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    start = time.monotonic()
+    with pytest.raises(CompositionError, match="已取消"):
+        run_command([sys.executable, "-c", "import time; time.sleep(30)"], timeout=60, cancel_event=cancel)
+    assert time.monotonic() - start < 5
+
+
+def test_plan_holds_pads_each_marker_to_audio_duration():
+    from composition.retime import plan_holds
+    marks = [{"time": 1.1, "partial": 1, "wait": 0.1}, {"time": 3.0, "partial": 3, "wait": 0.1}, {"time": 4.0, "partial": 5, "wait": 0.1}]
+    holds = plan_holds(marks, [2.1, 0.05], default_wait=1.0)
+    assert holds == pytest.approx([2.0, 0.0, 0.9])
+
+
+def test_retime_video_requires_step_marks(tmp_path):
+    from composition.retime import retime_video
+    video = tmp_path / "manim.mp4"
+    video.write_bytes(b"v")
+    with pytest.raises(CompositionError, match="缺少步骤标记"):
+        retime_video(video, [1.0], tmp_path / "out.mp4")
+
+
+def _retime_fixture(tmp_path, monkeypatch, padded_stream):
+    import json
+    import subprocess
+
+    from composition import retime
+
+    partials = []
+    for i in range(3):
+        p = tmp_path / f"partial_{i}.mp4"
+        p.write_bytes(b"v")
+        partials.append(str(p))
+    video = tmp_path / "manim.mp4"
+    video.write_bytes(b"v")
+    retime.steps_path(video).write_text(
+        json.dumps({"marks": [{"time": 1.0, "partial": 1, "wait": 0.1}], "partials": partials}), encoding="utf-8"
+    )
+    ref = {"codec_name": "h264", "profile": "High", "level": 30, "pix_fmt": "yuv420p", "width": 854,
+           "height": 480, "r_frame_rate": "15/1", "time_base": "1/15360", "extradata_hash": "SHA256:aa"}
+
+    def fake_ffprobe(args, **kw):
+        # 经真实的 _probe_stream 解析 ffprobe 输出
+        stream = {**ref, **padded_stream} if "hold_" in args[-1] else ref
+        return subprocess.CompletedProcess(args, 0, json.dumps({"streams": [stream]}), "")
+
+    monkeypatch.setattr(retime.subprocess, "run", fake_ffprobe)
+    calls = []
+
+    def fake_ffmpeg(args, timeout=600, cancel_event=None):
+        calls.append(args)
+        Path(args[-1]).write_bytes(b"out")
+
+    monkeypatch.setattr(retime, "_run_ffmpeg", fake_ffmpeg)
+    return retime, video, calls
+
+
+def test_retime_stream_copies_when_padded_clip_matches(tmp_path, monkeypatch):
+    # x264 的 extradata 含编码器参数串，补帧分段与 Manim 分段总会不同，不应因此放弃流复制
+    retime, video, calls = _retime_fixture(tmp_path, monkeypatch, {"extradata_hash": "SHA256:bb"})
+    retime.retime_video(video, [2.0], tmp_path / "out.mp4")
+    pad, concat = calls
+    assert pad[pad.index("-profile:v") + 1] == "high" and pad[pad.index("-r") + 1] == "15/1"
+    assert pad[pad.index("-x264-params") + 1] == "repeat-headers=1"
+    assert "-video_track_timescale" in pad and "concat" in concat and "copy" in concat
+
+
+def test_retime_reencodes_when_padded_clip_differs(tmp_path, monkeypatch):
+    retime, video, calls = _retime_fixture(tmp_path, monkeypatch, {"profile": "Main"})
+    retime.retime_video(video, [2.0], tmp_path / "out.mp4")
+    assert "-filter_complex" in calls[-1]
+    assert not any("concat" in c and "copy" in c for c in calls)
+
+
+def test_step_marker_suffix_records_placeholder_waits(tmp_path):
+    import json
+    from types import SimpleNamespace
+
+    from asset_generation.timing import step_marker_suffix
+
+    class FakeScene:
+        def __init__(self):
+            writer = SimpleNamespace(partial_movie_files=[], movie_file_path=str(tmp_path / "m.mp4"))
+            self.renderer = SimpleNamespace(file_writer=writer, time=0.0)
+            self.waited: list[float] = []
+
+        def wait(self, duration=1.0):
+            self.waited.append(duration)
+            self.renderer.time += duration
+            self.renderer.file_writer.partial_movie_files.append(f"p{len(self.waited)}.mp4")
+
+        def tear_down(self):
+            pass
+
+    ns = {"SolutionScene": type("SolutionScene", (FakeScene,), {})}
+    exec(step_marker_suffix(0.1), ns)
+    scene = ns["SolutionScene"]()
+    scene.wait()
+    scene.wait(2)
+    scene.wait()
+    scene.tear_down()
+    assert scene.waited == [0.1, 2, 0.1]
+    data = json.loads((tmp_path / "m.mp4.steps.json").read_text())
+    assert [m["partial"] for m in data["marks"]] == [0, 2]
+    assert data["marks"][1]["time"] == pytest.approx(2.2)
+    assert data["partials"] == ["p1.mp4", "p2.mp4", "p3.mp4"]
+
+
+def test_hls_ladder_and_master_playlist():
+    from composition.hls import master_playlist, parse_ladder
+    ladder = parse_ladder("360:500k, 480:1.2m")
+    assert ladder == [(480, 1_200_000), (360, 500_000)]
+    playlist = master_playlist(ladder)
+    assert playlist.startswith("#EXTM3U")
+    assert "BANDWIDTH=1296000\n480p/index.m3u8" in playlist
+    with pytest.raises(ValueError):
+        parse_ladder("")
+
+
+def test_hls_master_written_after_renditions_and_removed_on_failure(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    from composition import hls
+
+    video = tmp_path / "final.mp4"
+    video.write_bytes(b"v")
+    out = tmp_path / "hls"
+    release = threading.Event()
+    seen_before_index = []
+
+    def fake_encode(video, out_dir, height, bps):
+        out_dir.mkdir(parents=True, exist_ok=True)
+        seen_before_index.append((out / hls.MASTER_PLAYLIST).exists())
+        (out_dir / "index.m3u8").write_text("#EXTM3U\n")
+        release.wait(2)
+        if height == 360:
+            raise CompositionError("HLS 360p 编码失败")
+        return 0.0
+
+    monkeypatch.setattr(hls, "_encode_rendition", fake_encode)
+    monkeypatch.setattr(hls, "_READY_POLL_SECONDS", 0.01)
+    monkeypatch.setenv("HLS_LADDER", "480:1000k,360:500k")
+    thread = hls.package_hls_in_background(video, out)
+    deadline = time.monotonic() + 2
+    while not (out / hls.MASTER_PLAYLIST).exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # 两档 index.m3u8 都出现后才写出主播放列表
+    assert seen_before_index == [False, False]
+    assert (out / hls.MASTER_PLAYLIST).exists()
+    release.set()
+    thread.join(2)
+    assert not out.exists()
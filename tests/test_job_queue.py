@@ -0,0 +1,67 @@
+"""持久化任务队列单测：入队位置、租约领取与续约、过期重新入队与多次过期后失败。"""
+import pytest
+
+from api import job_queue
+
+
+@pytest.fixture
+def queue_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("JOB_QUEUE_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setenv("JOB_LEASE_SECONDS", "60")
+    monkeypatch.setenv("JOB_MAX_ATTEMPTS", "2")
+
+
+def test_lease_heartbeat_and_complete(queue_db):
+    assert job_queue.enqueue("t1", "generate", {"problem_text": "1+1"}, b"img") == 0
+    assert job_queue.enqueue("t2", "retry") == 1
+    job, expired = job_queue.lease("w1")
+    assert expired == []
+    assert (job.task_id, job.payload["problem_text"], job.image, job.attempts) == ("t1", "1+1", b"img", 1)
+    assert job_queue.heartbeat(job.job_id, "w1", "题目分析")
+    assert job_queue.current_step("t1") == "题目分析"
+    # 其他 worker 不能替别人续约或结束任务
+    assert not job_queue.heartbeat(job.job_id, "w2")
+    assert not job_queue.complete(job.job_id, "w2")
+    assert job_queue.complete(job.job_id, "w1")
+    assert job_queue.get_stats()["jobs"] == {"done": 1, "queued": 1}
+
+
+def test_expired_lease_is_requeued_then_failed(queue_db, monkeypatch):
+    job_queue.enqueue("t1", "generate")
+    monkeypatch.setenv("JOB_LEASE_SECONDS", "-1")
+    first, _ = job_queue.lease("w1")
+    # 租约已过期：重新入队，由另一个 worker 领取（从检查点续跑）
+    second, expired = job_queue.lease("w2")
+    assert expired == [] and second.job_id == first.job_id and second.attempts == 2
+    assert not job_queue.heartbeat(first.job_id, "w1")
+    third, expired = job_queue.lease("w3")
+    assert third is None and expired == ["t1"]
+
+
+def test_worker_records_runner_failure(queue_db, monkeypatch):
+    import worker
+
+    job_queue.enqueue("t1", "generate", {"problem_text": "1+1"})
+    job, _ = job_queue.lease("w1")
+    # 执行函数内部已标记任务失败，只返回原因
+    monkeypatch.setattr(worker, "run_generate_task", lambda *a, **kw: "题目为空")
+    worker.run_job(job, "w1")
+    assert job_queue.get_stats()["jobs"] == {"failed": 1}
+
+
+def test_worker_cancels_pipeline_when_lease_lost(queue_db, monkeypatch):
+    import worker
+
+    monkeypatch.setenv("JOB_HEARTBEAT_SECONDS", "0.01")
+    job_queue.enqueue("t1", "retry")
+    job, _ = job_queue.lease("w1")
+    monkeypatch.setattr(job_queue, "heartbeat", lambda *a, **kw: False)
+    seen = []
+
+    def fake_retry(task_id, cancel_event=None):
+        seen.append(cancel_event.wait(2))
+        return "流水线已取消"
+
+    monkeypatch.setattr(worker, "run_retry_task", fake_retry)
+    worker.run_job(job, "w1")
+    assert seen == [True]
@@ -0,0 +1,171 @@
+"""llm_runner 单测：客户端池复用与统计（不发起真实请求）。"""
+import pytest
+
+import llm_runner
+
+
+@pytest.fixture(autouse=True)
+def _fresh_pool(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    llm_runner.close_llm_clients()
+    yield
+    llm_runner.close_llm_clients()
+
+
+def test_get_chat_model_reuses_pooled_client():
+    before = llm_runner.get_llm_pool_stats()
+    a = llm_runner.get_chat_model(model="m1", timeout=10)
+    b = llm_runner.get_chat_model(model="m1", timeout=10)
+    c = llm_runner.get_chat_model(model="m1", timeout=20)
+    after = llm_runner.get_llm_pool_stats()
+    assert a is b
+    assert a is not c
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 2
+    assert after["size"] == 2
+
+
+def test_idle_clients_are_evicted(monkeypatch):
+    monkeypatch.setenv("LLM_POOL_IDLE_TIMEOUT", "0")
+    a = llm_runner.get_chat_model(model="m1", timeout=0)
+    monkeypatch.setattr(llm_runner.time, "monotonic", lambda: 1e12)
+    b = llm_runner.get_chat_model(model="m1", timeout=0)
+    assert a is not b
+    assert llm_runner.get_llm_pool_stats()["evicted"] >= 1
+
+
+def test_invoke_structured_uses_cache(monkeypatch, tmp_path):
+    from problem_analysis.schemas import ProblemAnalysisOutput, StepItem
+
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "true")
+    monkeypatch.setenv("LLM_CACHE_DIR", str(tmp_path))
+    calls = []
+    step = StepItem(step_id=1, description="d", math_formula="$x$", visual_focus="v", voiceover_text="t")
+
+    def fake_parse(llm, content, schema):
+        calls.append(content)
+        return schema(steps=[step])
+
+    monkeypatch.setattr(llm_runner, "_invoke_and_parse", fake_parse)
+    first = llm_runner.invoke_structured("题目", ProblemAnalysisOutput)
+    second = llm_runner.invoke_structured("题目", ProblemAnalysisOutput)
+    assert len(calls) == 1
+    assert second == first and second is not first
+    assert isinstance(second.steps[0], StepItem)
+    llm_runner.invoke_structured("题目", ProblemAnalysisOutput, use_cache=False)
+    assert len(calls) == 2
+
+
+def test_llm_cache_evicts_least_recently_used(monkeypatch, tmp_path):
+    import os
+
+    import llm_cache
+
+    monkeypatch.setenv("LLM_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("LLM_CACHE_MAX_BYTES", "300")
+    llm_cache.put("aa01", "x" * 100)
+    llm_cache.put("bb02", "y" * 100)
+    old = llm_cache._entry_path("aa01")
+    os.utime(old, (1, 1))
+    llm_cache.put("cc03", "z" * 100)
+    assert llm_cache.get("aa01") is None
+    assert llm_cache.get("cc03") == "z" * 100
+
+
+def test_llm_cache_put_scans_only_over_limit(monkeypatch, tmp_path):
+    import llm_cache
+
+    monkeypatch.setenv("LLM_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("LLM_CACHE_MAX_BYTES", "1000000")
+    scans = []
+    real_evict = llm_cache.evict
+    monkeypatch.setattr(llm_cache, "evict", lambda: scans.append(1) or real_evict())
+    for i in range(5):
+        llm_cache.put(f"k{i:03d}", "x" * 100)
+    # 仅首次写入时扫描一次以建立大小估计
+    assert len(scans) == 1
+    monkeypatch.setenv("LLM_CACHE_MAX_BYTES", "300")
+    llm_cache.put("k999", "y" * 100)
+    assert len(scans) == 2
+
+
+def test_llm_cache_key_includes_base_url_and_max_tokens():
+    import llm_cache
+
+    base = dict(kind="plain", model="m", temperature=0.0, prompt="p")
+    keys = {
+        llm_cache.make_key(**base),
+        llm_cache.make_key(**base, base_url="https://a.example/v1"),
+        llm_cache.make_key(**base, max_tokens=256),
+    }
+    assert len(keys) == 3
+
+
+class _FakeAsyncLLM:
+    """仅实现 ainvoke 的假模型：按给定延迟返回固定内容。"""
+
+    model_name = "fake"
+    temperature = 0.0
+
+    def __init__(self, content: str, delay: float = 0.0):
+        self.content = content
+        self.delay = delay
+        self.messages = []
+
+    async def ainvoke(self, messages):
+        import asyncio
+
+        from langchain_core.messages import AIMessage
+
+        self.messages.append(messages)
+        await asyncio.sleep(self.delay)
+        return AIMessage(content=self.content)
+
+
+def test_ainvoke_structured_parses_markdown_json(monkeypatch):
+    import asyncio
+
+    from script_generation.schemas import ScriptGenerationOutput
+
+    fake = _FakeAsyncLLM('```json\n{"manim_code": "SolutionScene self.wait()", "image_prompts": ["a"]}\n```')
+    monkeypatch.setattr(llm_runner, "_aget_chat_model", lambda **kw: fake)
+    out = asyncio.run(llm_runner.ainvoke_structured("生成脚本", ScriptGenerationOutput))
+    assert out.image_prompts == ["a"]
+    sent = fake.messages[0][0].content
+    assert sent.startswith("生成脚本") and "JSON Schema" in sent
+
+
+def test_ainvoke_plain_cancel_event_aborts_call(monkeypatch):
+    import asyncio
+
+    fake = _FakeAsyncLLM("never", delay=30)
+    monkeypatch.setattr(llm_runner, "_aget_chat_model", lambda **kw: fake)
+
+    async def scenario():
+        cancel = asyncio.Event()
+        task = asyncio.create_task(llm_runner.ainvoke_plain("hi", cancel_event=cancel))
+        await asyncio.sleep(0.01)
+        cancel.set()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, timeout=2)
+
+    asyncio.run(scenario())
+
+
+def test_async_clients_closed_before_loop_ends(monkeypatch):
+    import asyncio
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    clients = []
+
+    async def scenario():
+        llm = llm_runner._aget_chat_model()
+        await llm_runner._ensure_loop_guard()
+        clients.append(llm.http_async_client)
+
+    for _ in range(2):
+        asyncio.run(scenario())
+    # 每次 asyncio.run 结束前其异步客户端已被关闭并移出池
+    assert len(clients) == 2 and all(c.is_closed for c in clients)
+    assert not any(e.loop is not None for e in llm_runner._client_pool.values())
+    assert not llm_runner._loop_guards
@@ -26,3 +26,462 @@ def test_render_manim_video_with_self_heal_raises_on_invalid_code():
     invalid_code = "print(1/0)"  # 无 SolutionScene，manim 会报错
     with pytest.raises((RuntimeError, Exception)):
         render_manim_video_with_self_heal(invalid_code, "/tmp/test_manim_out.mp4")
+
+
+def test_plan_segments_cuts_at_step_boundaries():
+    from asset_generation.manim_shard import Segment, plan_segments
+
+    # 每步 3 个动画（2 个 play + 1 个 wait），共 4 步
+    segments = plan_segments([3, 6, 9, 12], 12, workers=2)
+    assert segments == [Segment(0, 0, 5), Segment(1, 6, 11)]
+    # 分段数不超过步骤数，首段至少两个动画
+    assert plan_segments([1, 2], 2, workers=8) == [Segment(0, 0, 1)]
+    assert len(plan_segments([3, 6, 9, 12], 12, workers=16)) == 4
+
+
+def test_sharded_self_heal_rerenders_all_segments_after_code_change(tmp_path, monkeypatch):
+    """修复改动代码后，之前成功的分段也要用新代码重渲，不能与新代码的分段混拼。"""
+    from asset_generation import manim_shard
+
+    monkeypatch.setenv("MANIM_SHARD_WORKERS", "2")
+    monkeypatch.setenv("MANIM_SELF_HEAL_MAX_ATTEMPTS", "2")
+    monkeypatch.setattr(manim_shard, "precheck_manim_code", lambda code: None)
+    monkeypatch.setattr(manim_shard, "probe_step_boundaries", lambda code, d, cancel_event=None: (d.mkdir(parents=True), ([2, 4], 4))[1])
+    monkeypatch.setattr(manim_shard.CodeFixer, "fix", lambda self, code, err: "v2")
+    monkeypatch.setattr(manim_shard.CodeFixer, "report", lambda self, err: None)
+    rendered = []
+
+    def fake_render(scene_py, seg, work_dir, cancel_event=None):
+        code = scene_py.read_text(encoding="utf-8").split("\n", 1)[0]
+        rendered.append((code, seg.start))
+        if code == "v1" and seg.start == 2:
+            raise RuntimeError("boom")
+        out = work_dir / f"{code}_{seg.start}.mp4"
+        out.write_text(code, encoding="utf-8")
+        return out
+
+    joined = []
+    monkeypatch.setattr(manim_shard, "_render_segment", fake_render)
+    monkeypatch.setattr(manim_shard, "concat_segments", lambda paths, out, cancel_event=None: joined.extend(p.read_text() for p in paths))
+    manim_shard.render_manim_video_sharded_with_self_heal("v1", tmp_path / "out.mp4", tmp_path / "work")
+    assert sorted(rendered) == [("v1", 0), ("v1", 2), ("v2", 0), ("v2", 2)]
+    assert joined == ["v2", "v2"]
+
+
+def test_worker_pool_reports_unavailable_without_manim(tmp_path):
+    """未安装 manim 时 worker 启动失败，调用方据此回退 subprocess 渲染。"""
+    import importlib.util
+
+    if importlib.util.find_spec("manim") is not None:
+        pytest.skip("manim 已安装")
+    from asset_generation.manim_worker import ManimWorkerPool, WorkerUnavailable
+
+    pool = ManimWorkerPool(1, max_jobs=1, max_rss_mb=1000)
+    for _ in range(2):
+        with pytest.raises(WorkerUnavailable):
+            pool.render(tmp_path / "scene.py", tmp_path)
+    assert pool.get_stats()["alive"] == 0
+    pool.shutdown()
+
+
+def test_worker_pool_stats_are_thread_safe():
+    import threading
+
+    from asset_generation.manim_worker import ManimWorkerPool
+
+    pool = ManimWorkerPool(1, max_jobs=1, max_rss_mb=1000)
+    threads = [threading.Thread(target=lambda: [pool.bump("fallbacks") for _ in range(2000)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = pool.get_stats()
+    assert stats["fallbacks"] == 16000
+    stats["fallbacks"] = 0
+    assert pool.get_stats()["fallbacks"] == 16000
+
+
+def test_render_reuses_stable_work_dir_across_attempts(tmp_path, monkeypatch):
+    """指定 work_dir 时各次尝试在同一目录渲染（保留 partial_movie_files），不传则每次用新临时目录。"""
+    from asset_generation import manim_render
+
+    cwds = []
+
+    def fake_run(scene_py, cwd, extra_args=None, **kwargs):
+        import subprocess
+        cwds.append(cwd)
+        out = cwd / "media" / "videos" / "scene" / "480p15"
+        (out / "partial_movie_files").mkdir(parents=True, exist_ok=True)
+        (out / "SolutionScene.mp4").write_bytes(b"mp4")
+        return subprocess.CompletedProcess([], 0, "", "")
+
+    monkeypatch.setattr(manim_render, "_run_manim", fake_run)
+    monkeypatch.setattr(manim_render, "_worker_pool", lambda: None)
+    monkeypatch.setenv("MANIM_DRY_RUN_FIRST", "false")
+    work = tmp_path / "manim_media"
+    for _ in range(2):
+        manim_render.render_manim_video("x = 1", tmp_path / "out.mp4", work)
+    assert cwds[0] == cwds[1] == work.resolve()
+    assert (work / "media" / "videos" / "scene" / "480p15" / "partial_movie_files").is_dir()
+    manim_render.render_manim_video("x = 1", tmp_path / "out.mp4")
+    assert cwds[2] != work.resolve() and not cwds[2].exists()
+
+
+def test_dry_run_failure_skips_encode(tmp_path, monkeypatch):
+    """预演失败时不进入编码阶段，错误直接抛给自愈；预演通过才正式编码。"""
+    import subprocess
+
+    from asset_generation import manim_render
+
+    calls = []
+
+    def fake_run(scene_py, cwd, extra_args=None, **kwargs):
+        calls.append(extra_args)
+        if extra_args == ["--dry_run"]:
+            ok = "boom" not in scene_py.read_text(encoding="utf-8")
+            return subprocess.CompletedProcess([], 0 if ok else 1, "", "" if ok else "ZeroDivisionError")
+        out = cwd / "media" / "videos" / "scene" / "480p15"
+        out.mkdir(parents=True, exist_ok=True)
+        (out / "SolutionScene.mp4").write_bytes(b"mp4")
+        return subprocess.CompletedProcess([], 0, "", "")
+
+    monkeypatch.setattr(manim_render, "_run_manim", fake_run)
+    monkeypatch.setattr(manim_render, "_worker_pool", lambda: None)
+    before = manim_render.get_render_stats()
+    with pytest.raises(RuntimeError, match="预演失败.*ZeroDivisionError"):
+        manim_render.render_manim_video("boom", tmp_path / "out.mp4")
+    assert calls == [["--dry_run"]]
+    manim_render.render_manim_video("ok", tmp_path / "out.mp4")
+    assert calls[1:] == [["--dry_run"], None]
+    after = manim_render.get_render_stats()
+    assert after["dry_runs"] - before["dry_runs"] == 2
+    assert after["dry_run_failures"] - before["dry_run_failures"] == 1
+    assert after["encodes"] - before["encodes"] == 1
+
+
+def test_prune_media_dirs_removes_stale_only(tmp_path):
+    import os
+    import time
+
+    from asset_generation.manim_render import MEDIA_DIR_NAME, prune_media_dirs
+
+    stale = tmp_path / "old_task" / "work" / MEDIA_DIR_NAME
+    fresh = tmp_path / "new_task" / "work" / MEDIA_DIR_NAME
+    stale.mkdir(parents=True)
+    fresh.mkdir(parents=True)
+    old = time.time() - 48 * 3600
+    os.utime(stale, (old, old))
+    assert prune_media_dirs(tmp_path, 24) == 1
+    assert not stale.exists() and fresh.exists()
+    assert prune_media_dirs(tmp_path, 0) == 0
+
+
+def test_tex_cache_extracts_formulas_and_points_manim_at_shared_dir(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+
+    from asset_generation import tex_cache
+
+    steps = [
+        SimpleNamespace(math_formula="由 $a^2+b^2=c^2$ 得 $c=5$"),
+        SimpleNamespace(math_formula=r"$$\frac{a}{b}$$"),
+        SimpleNamespace(math_formula="c=5"),
+        SimpleNamespace(math_formula=""),
+    ]
+    assert tex_cache.extract_formulas(steps) == ["a^2+b^2=c^2", "c=5", r"\frac{a}{b}"]
+
+    monkeypatch.setenv("TEX_CACHE_DIR", str(tmp_path))
+    args = tex_cache.manim_cli_args()
+    assert args[0] == "--config_file"
+    cfg = (tmp_path / "manim.cfg").read_text(encoding="utf-8")
+    assert f"tex_dir = {tmp_path.resolve()}" in cfg and "no_latex_cleanup = True" in cfg
+    monkeypatch.setenv("TEX_CACHE_ENABLED", "false")
+    assert tex_cache.manim_cli_args() == [] and tex_cache.manim_config() == {}
+
+
+def test_tex_cache_hook_touches_hits_and_publishes_misses_atomically(tmp_path, monkeypatch):
+    """用假的 manim 模块执行缓存钩子：命中刷新 mtime，未命中在私有目录编译后移入共享目录。"""
+    import contextlib
+    import os
+    import sys
+    import types
+    from pathlib import Path
+
+    from asset_generation import tex_cache
+
+    conf = {"tex_dir": str(tmp_path)}
+    compiled_in = []
+
+    @contextlib.contextmanager
+    def tempconfig(overrides):
+        saved = dict(conf)
+        conf.update(overrides)
+        try:
+            yield
+        finally:
+            conf.clear()
+            conf.update(saved)
+
+    def generate_tex_file(expression, environment=None, tex_template=None):
+        tex = Path(conf["tex_dir"]) / f"{abs(hash(expression))}.tex"
+        tex.write_text(expression)
+        return tex
+
+    def tex_to_svg_file(expression, environment=None, tex_template=None):
+        svg = generate_tex_file(expression).with_suffix(".svg")
+        compiled_in.append(svg.parent)
+        svg.write_text("<svg/>")
+        return svg
+
+    tm = types.ModuleType("manim.mobject.text.tex_mobject")
+    tm.tex_to_svg_file = tex_to_svg_file
+    tfw = types.ModuleType("manim.utils.tex_file_writing")
+    tfw.generate_tex_file = generate_tex_file
+    fake = {
+        "manim": types.ModuleType("manim"),
+        "manim.mobject": types.ModuleType("manim.mobject"),
+        "manim.mobject.text": types.ModuleType("manim.mobject.text"),
+        "manim.mobject.text.tex_mobject": tm,
+        "manim.utils": types.ModuleType("manim.utils"),
+        "manim.utils.tex_file_writing": tfw,
+    }
+    fake["manim"].tempconfig = tempconfig
+    fake["manim.mobject.text"].tex_mobject = tm
+    fake["manim.utils"].tex_file_writing = tfw
+    for name, mod in fake.items():
+        monkeypatch.setitem(sys.modules, name, mod)
+    exec(tex_cache._TEX_HOOK, {})
+
+    svg = tm.tex_to_svg_file("x^2")
+    assert svg.parent == tmp_path and svg.read_text() == "<svg/>"
+    assert compiled_in[0] != tmp_path and not compiled_in[0].exists()
+    os.utime(svg, (1, 1))
+    assert tm.tex_to_svg_file("x^2") == svg
+    assert len(compiled_in) == 1 and svg.stat().st_mtime > 1
+
+
+def test_tex_cache_evicts_oldest_formulas(tmp_path, monkeypatch):
+    import os
+    import time
+
+    from asset_generation import tex_cache
+
+    monkeypatch.setenv("TEX_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("TEX_CACHE_MAX_BYTES", "150")
+    now = time.time()
+    for i, stem in enumerate(["old", "mid", "new"]):
+        for suffix in (".tex", ".svg"):
+            p = tmp_path / f"{stem}{suffix}"
+            p.write_bytes(b"x" * 50)
+            os.utime(p, (now - 100 + i, now - 100 + i))
+    stale_aux = tmp_path / "new.aux"
+    stale_aux.write_bytes(b"x")
+    os.utime(stale_aux, (now - 3600, now - 3600))
+    assert tex_cache.evict() == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new.svg", "new.tex"]
+
+
+def test_validate_manim_code_flags_errors_without_rendering():
+    from asset_generation.manim_validate import validate_manim_code
+
+    namespace = (
+        frozenset({"Scene", "MathTex", "Write", "Circle", "Create", "np"}),
+        {"Scene": frozenset({"play", "wait", "add", "construct"})},
+    )
+    good = (
+        "from manim import *\n\n"
+        "class SolutionScene(Scene):\n"
+        "    def construct(self):\n"
+        "        eq = MathTex('a^2')\n"
+        "        self.play(Write(eq), *[Create(Circle()) for _ in range(2)])\n"
+        "        self.wait(1.5)\n"
+    )
+    assert validate_manim_code(good, namespace) == []
+
+    assert "SyntaxError" in validate_manim_code("class SolutionScene(Scene:\n    pass", namespace)[0]
+    errors = validate_manim_code(good.replace("SolutionScene", "Other"), namespace)
+    assert any("SolutionScene" in e for e in errors)
+    errors = validate_manim_code(good.replace("self.wait(1.5)", "self.add(eq)"), namespace)
+    assert any("self.wait()" in e for e in errors)
+    errors = validate_manim_code(good.replace("Circle()", "Cirle()"), namespace)
+    assert errors == ["NameError: name 'Cirle' is not defined (line 6)"]
+    errors = validate_manim_code(good.replace("self.wait(1.5)", "self.wait(1.5)\n        self.play_all(eq)"), namespace)
+    assert errors == ["AttributeError: 'SolutionScene' object has no attribute 'play_all' (line 8)"]
+    # 未知命名空间时只做结构检查
+    assert validate_manim_code(good.replace("Circle()", "Cirle()"), None) == []
+
+
+def test_fix_kb_learns_from_llm_fix_and_skips_llm_next_time(tmp_path, monkeypatch):
+    from asset_generation import fix_kb, manim_render
+
+    monkeypatch.setattr(fix_kb, "DB_PATH", tmp_path / "fix_kb.db")
+    llm_calls = []
+
+    def fake_llm(code, error):
+        llm_calls.append(error)
+        return code.replace("stroke_widht=", "stroke_width=")
+
+    monkeypatch.setattr(manim_render, "fix_code_with_llm", fake_llm)
+    error = (
+        'File "/tmp/tmpab12/scene.py", line 1\n'
+        "│ TypeError: Mobject.__init__() got an unexpected keyword argument 'stroke_widht' │"
+    )
+
+    # 前两次由 LLM 修复：一次成功可能只是碰巧，规则验证两次后才直接套用
+    for bad in ("c = Circle(stroke_widht=4)\nself.wait()", "d = Dot(stroke_widht=1)\nself.wait()"):
+        fixer = manim_render.CodeFixer()
+        assert fixer.fix(bad, error) == bad.replace("stroke_widht=", "stroke_width=")
+        fixer.report(None)
+    assert len(llm_calls) == 2
+
+    # 另一个任务遇到同一签名（行号、路径不同）：直接套用学到的替换，不再调用 LLM
+    fixer = manim_render.CodeFixer()
+    other = "self.wait()\nsq = Square(stroke_widht=2)"
+    assert fixer.fix(other, error.replace("line 1", "line 2")) == "self.wait()\nsq = Square(stroke_width=2)"
+    fixer.report(None)
+    assert len(llm_calls) == 2
+    stats = {s["signature"]: s for s in fix_kb.get_stats()}
+    sig = "TypeError: Mobject.__init__() got an unexpected keyword argument 'stroke_widht'"
+    assert stats[sig]["kb_hits"] == 1 and stats[sig]["llm_fixes"] == 2 and stats[sig]["seen"] == 3
+
+
+def test_fix_kb_keys_learned_rule_to_the_touched_error_line(tmp_path, monkeypatch):
+    from asset_generation import fix_kb
+
+    monkeypatch.setattr(fix_kb, "DB_PATH", tmp_path / "fix_kb.db")
+    error = (
+        "NameError: name 'Cirle' is not defined (line 1)\n"
+        "AttributeError: 'SolutionScene' object has no attribute 'play_all' (line 2)"
+    )
+    sig_name, sig_attr = fix_kb.signatures(error)
+    assert fix_kb.signature_lines(error) == {sig_name: {1}, sig_attr: {2}}
+    bad, fixed = "c = Cirle()\nself.play_all(c)", "c = Circle()\nself.play_all(c)"
+    for _ in range(2):
+        fix_kb.record_outcome(
+            [sig_name, sig_attr], [], bad_code=bad, fixed_code=fixed, rule_ids=[], source="llm",
+            error_lines=fix_kb.signature_lines(error),
+        )
+    stats = {s["signature"]: s for s in fix_kb.get_stats()}
+    # 只有出错行被改动的签名学到规则；另一个签名在同一次尝试中消失也不关联
+    assert stats[sig_name]["rules"] == 1 and stats[sig_attr]["rules"] == 0
+    assert fix_kb.apply_known_fixes("x = Cirle()", "AttributeError: 'SolutionScene' object has no attribute 'play_all'") is None
+
+
+def test_fix_kb_builtin_rule_and_signature_normalization(tmp_path, monkeypatch):
+    from asset_generation import fix_kb
+
+    monkeypatch.setattr(fix_kb, "DB_PATH", tmp_path / "fix_kb.db")
+    error = "Manim 代码静态检查未通过:\nNameError: name 'ShowCreation' is not defined (line 9)"
+    assert fix_kb.signatures(error) == ["NameError: name 'ShowCreation' is not defined"]
+    fixed, rule_ids = fix_kb.apply_known_fixes("self.play(ShowCreation(c))", error)
+    assert fixed == "self.play(Create(c))" and len(rule_ids) == 1
+    # 大面积重写不学习
+    assert fix_kb.learn_rules("a = 1\nb = 2\nc = 3\nd = 4", "a = 5\nb = 6\nc = 7\nd = 8") == []
+    assert fix_kb.learn_rules("x = Tex(r'a^2')", "x = MathTex(r'a^2')") == [("Tex", "MathTex")]
+    assert fix_kb._replace_fragment("Tex(a); MathTex(b)", "Tex", "MathTex") == ("MathTex(a); MathTex(b)", 1)
+
+
+SCENE = "\n".join([
+    "from manim import *",
+    "",
+    "class SolutionScene(Scene):",
+    "    def construct(self):",
+    "        c = Circle(stroke_widht=4)",
+    "        self.play(Create(c))",
+    "        self.wait(1.5)",
+])
+
+
+def test_trim_traceback_keeps_scene_frames_only():
+    from asset_generation.code_patch import code_window, trim_traceback
+
+    error = "\n".join([
+        "Manim 渲染失败 (exit 1): Traceback (most recent call last):",
+        '  File "/usr/lib/python3/site-packages/manim/cli/render/commands.py", line 120, in render',
+        "    scene.render()",
+        '  File "/tmp/tmpx/scene.py", line 5, in construct',
+        "    c = Circle(stroke_widht=4)",
+        '  File "/usr/lib/python3/site-packages/manim/mobject/geometry/arc.py", line 300, in __init__',
+        "    super().__init__(**kwargs)",
+        "TypeError: Mobject.__init__() got an unexpected keyword argument 'stroke_widht'",
+    ])
+    trimmed, line_nos = trim_traceback(error)
+    assert line_nos == [5]
+    assert "site-packages" not in trimmed
+    assert "c = Circle(stroke_widht=4)" in trimmed and trimmed.endswith("'stroke_widht'")
+    window = code_window(SCENE, line_nos, radius=1)
+    assert window.splitlines() == ["4|     def construct(self):", "5|         c = Circle(stroke_widht=4)", "6|         self.play(Create(c))"]
+
+
+def test_fix_code_with_llm_applies_diff_and_falls_back_to_full(monkeypatch):
+    from asset_generation import manim_render
+
+    replies = []
+
+    def fake_invoke(prompt, **kwargs):
+        # 修复请求不能重放缓存中已失败的修复
+        assert kwargs.get("use_cache") is False
+        return replies.pop(0), {"input_tokens": len(prompt) // 4, "output_tokens": 10}
+
+    monkeypatch.setattr(manim_render, "invoke_plain_with_usage", fake_invoke)
+    error = "File \"/tmp/a/scene.py\", line 5, in construct\nTypeError: unexpected keyword argument 'stroke_widht'"
+    diff = "\n".join([
+        "```diff",
+        "@@ -5,2 +5,2 @@",
+        "-        c = Circle(stroke_widht=4)",
+        "+        c = Circle(stroke_width=4)",
+        "         self.play(Create(c))",
+        "```",
+    ])
+    replies.append(diff)
+    before = manim_render.get_render_stats()["fix"]
+    assert manim_render.fix_code_with_llm(SCENE, error) == SCENE.replace("stroke_widht", "stroke_width")
+
+    # diff 上下文对不上：回退整文件修复
+    replies.extend(["@@ -5,1 +5,1 @@\n-nonexistent line\n+x", "FULL FILE"])
+    assert manim_render.fix_code_with_llm(SCENE, error) == "FULL FILE"
+    after = manim_render.get_render_stats()["fix"]
+    assert after["patch_calls"] - before["patch_calls"] == 2
+    assert after["full_calls"] - before["full_calls"] == 1
+    assert after["patch_fallbacks"] - before["patch_fallbacks"] == 1
+    assert after["output_tokens"] - before["output_tokens"] == 30
+
+
+def test_speculative_self_heal_takes_first_successful_candidate(tmp_path, monkeypatch):
+    """推测式自愈：并发生成多份候选修复，并行渲染，取第一个成功的并取消其余渲染。"""
+    import time
+
+    from asset_generation import manim_render
+
+    monkeypatch.setenv("MANIM_SPECULATIVE_FIXES", "3")
+    monkeypatch.setenv("MANIM_SPECULATIVE_MAX_RENDERS", "3")
+    monkeypatch.setenv("MANIM_STATIC_CHECK", "false")
+    monkeypatch.setenv("MANIM_FIX_KB_ENABLED", "false")
+    variants = []
+
+    def fake_fix(code, error, *, variant=0):
+        variants.append(variant)
+        return ["slow_ok", "broken", "fast_ok"][variant]
+
+    cancelled = []
+
+    def fake_render(code, out, work_dir=None, *, cancel_event=None, code_suffix=""):
+        if code == "bad":
+            raise RuntimeError("NameError: name 'x' is not defined")
+        if code == "broken":
+            raise RuntimeError("still broken")
+        if code == "slow_ok":
+            assert cancel_event is not None
+            if cancel_event.wait(5):
+                cancelled.append(code)
+                raise RuntimeError("已取消")
+        else:
+            time.sleep(0.05)
+        out.write_bytes(code.encode())
+
+    monkeypatch.setattr(manim_render, "fix_code_with_llm", fake_fix)
+    monkeypatch.setattr(manim_render, "render_manim_video", fake_render)
+    out = tmp_path / "out.mp4"
+    manim_render.render_manim_video_with_self_heal("bad", out)
+    assert sorted(variants) == [0, 1, 2]
+    assert out.read_bytes() == b"fast_ok"
+    assert cancelled == ["slow_ok"]
@@ -0,0 +1,218 @@
+"""流水线编排单测：依赖图并发调度与逐阶段检查点恢复（各阶段以假实现替换）。"""
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from api import pipeline
+from api.pipeline_checkpoint import get_completed_steps, save_step_checkpoint
+from api.pipeline_graph import GraphNode, run_graph
+from problem_analysis.schemas import StepItem
+from script_generation.schemas import ScriptGenerationOutput
+
+
+def test_run_graph_runs_independent_nodes_concurrently():
+    barrier = threading.Barrier(2, timeout=2)
+    order: list[str] = []
+    nodes = [
+        GraphNode(0, "a", lambda: order.append("a")),
+        GraphNode(1, "b", lambda: (barrier.wait(), order.append("b")), deps=(0,)),
+        GraphNode(2, "c", lambda: (barrier.wait(), order.append("c")), deps=(0,)),
+        GraphNode(3, "d", lambda: order.append("d"), deps=(1, 2)),
+    ]
+    assert run_graph(nodes, max_workers=2) == {0, 1, 2, 3}
+    assert order[0] == "a" and order[-1] == "d"
+
+
+def test_run_graph_skips_completed_and_raises_first_error():
+    ran: list[int] = []
+
+    def boom():
+        raise RuntimeError("boom")
+
+    nodes = [
+        GraphNode(0, "a", lambda: ran.append(0)),
+        GraphNode(1, "b", boom, deps=(0,)),
+        GraphNode(2, "c", lambda: ran.append(2), deps=(1,)),
+    ]
+    with pytest.raises(RuntimeError, match="boom"):
+        run_graph(nodes, completed={0})
+    assert ran == []
+
+
+def _fake_steps():
+    return [StepItem(step_id=1, description="d", math_formula="$x$", visual_focus="v", voiceover_text="t")]
+
+
+@pytest.fixture
+def fake_stages(monkeypatch):
+    monkeypatch.setenv("COMPOSE_FUSED", "false")
+    calls: dict[str, list[float]] = {}
+
+    def record(name, delay=0.0):
+        calls.setdefault(name, []).append(time.monotonic())
+        time.sleep(delay)
+
+    def fake_analyze(text, **kw):
+        record("analyze")
+        return _fake_steps()
+
+    def fake_script(steps, **kw):
+        record("script", 0.2)
+        return ScriptGenerationOutput(manim_code="class SolutionScene: self.wait()", image_prompts=[""])
+
+    def fake_tts(steps, *, output_dir, prefix):
+        record("tts", 0.2)
+        (output_dir / f"{prefix}_1.mp3").write_bytes(b"a")
+        return [1.5]
+
+    def fake_render(code, out, work_dir=None, *, cancel_event=None):
+        record("render")
+        assert "self.wait(1.5)" in code
+        out.write_bytes(b"v")
+
+    def fake_concat(paths, out, *, cancel_event=None):
+        record("concat")
+        out.write_bytes(b"a")
+
+    def fake_compose(video, audio, out, *, cancel_event=None):
+        record("compose")
+        out.write_bytes(b"f")
+
+    monkeypatch.setattr(pipeline, "analyze_problem", fake_analyze)
+    monkeypatch.setattr(pipeline, "generate_manim_code_and_prompts", fake_script)
+    monkeypatch.setattr(pipeline, "generate_audios_for_steps", fake_tts)
+    monkeypatch.setattr(pipeline, "render_manim_video_with_self_heal", fake_render)
+    monkeypatch.setattr(pipeline, "concat_audio_files", fake_concat)
+    monkeypatch.setattr(pipeline, "compose_video", fake_compose)
+    return calls
+
+
+def test_run_pipeline_overlaps_script_and_tts(fake_stages, tmp_path):
+    started: list[int] = []
+    out = pipeline.run_pipeline("题目", tmp_path, on_step_start=lambda i, name: started.append(i))
+    assert out.read_bytes() == b"f"
+    assert sorted(started) == [0, 1, 2, 3, 4, 5]
+    # 脚本生成与 TTS 并发：二者开始时间相差远小于单个阶段耗时
+    assert abs(fake_stages["script"][0] - fake_stages["tts"][0]) < 0.15
+
+
+def test_run_pipeline_resumes_from_per_node_checkpoint(fake_stages, tmp_path):
+    work = tmp_path / "work"
+    save_step_checkpoint(work, 0, _fake_steps())
+    save_step_checkpoint(work, 2, [1.5])
+    (work / "audio").mkdir(parents=True)
+    (work / "audio" / "step_1.mp3").write_bytes(b"a")
+    assert get_completed_steps(work) == {0, 2}
+    pipeline.run_pipeline("题目", tmp_path)
+    assert "analyze" not in fake_stages and "tts" not in fake_stages
+    assert set(fake_stages) == {"script", "render", "concat", "compose"}
+
+
+def test_run_pipeline_cancel_stops_before_next_stage(fake_stages, tmp_path):
+    cancel = threading.Event()
+
+    def on_step_start(i, name):
+        # 题目分析开始后取消：已运行阶段跑完，不再开始新阶段
+        cancel.set()
+
+    with pytest.raises(pipeline.PipelineCancelled):
+        pipeline.run_pipeline("题目", tmp_path, on_step_start=on_step_start, cancel_event=cancel)
+    assert set(fake_stages) == {"analyze"}
+    assert not (tmp_path / "final.mp4").exists()
+
+
+def test_run_pipeline_cancel_aborts_running_stage(fake_stages, monkeypatch, tmp_path):
+    cancel = threading.Event()
+
+    def fake_render(code, out, work_dir=None, *, cancel_event=None):
+        # 模拟长时间渲染：租约失效时 manim 进程被结束、渲染以错误返回
+        assert cancel_event is cancel
+        if cancel_event.wait(5):
+            raise RuntimeError("Manim 渲染已取消")
+        out.write_bytes(b"v")
+
+    def on_step_start(i, name):
+        if i == 3:
+            threading.Timer(0.1, cancel.set).start()
+
+    monkeypatch.setattr(pipeline, "render_manim_video_with_self_heal", fake_render)
+    start = time.monotonic()
+    with pytest.raises(pipeline.PipelineCancelled, match="Manim"):
+        pipeline.run_pipeline("题目", tmp_path, on_step_start=on_step_start, cancel_event=cancel)
+    assert time.monotonic() - start < 3
+    assert "compose" not in fake_stages
+    assert not (tmp_path / "work" / "manim.mp4").exists() and not (tmp_path / "final.mp4").exists()
+
+
+def test_run_pipeline_compose_timing_renders_without_durations(fake_stages, monkeypatch, tmp_path):
+    monkeypatch.setenv("TIMING_MODE", "compose")
+    rendered: list[tuple[str, str]] = []
+    retimed: list[list[float]] = []
+
+    def fake_render(code, out, work_dir=None, *, code_suffix="", cancel_event=None):
+        rendered.append((code, code_suffix))
+        out.write_bytes(b"v")
+
+    def fake_retime(video, durations, out, *, cancel_event=None):
+        retimed.append(durations)
+        out.write_bytes(b"t")
+
+    monkeypatch.setattr(pipeline, "render_manim_video_with_self_heal", fake_render)
+    monkeypatch.setattr(pipeline, "retime_video", fake_retime)
+    pipeline.run_pipeline("题目", tmp_path)
+    code, suffix = rendered[0]
+    assert "self.wait()" in code and "_install_step_markers" in suffix
+    assert retimed == [[1.5]]
+    assert pipeline.PIPELINE_DEPS[3] == (1, 2)
+
+
+def test_run_pipeline_compose_timing_reuses_cached_render(fake_stages, monkeypatch, tmp_path):
+    import json
+
+    monkeypatch.setenv("TIMING_MODE", "compose")
+    monkeypatch.setenv("RENDER_CACHE_DIR", str(tmp_path / "render_cache"))
+    rendered: list[Path] = []
+    retimed: list[list[bytes]] = []
+
+    def fake_render(code, out, work_dir=None, *, code_suffix="", cancel_event=None):
+        rendered.append(out)
+        partial = Path(work_dir) / "partial_0.mp4"
+        partial.parent.mkdir(parents=True, exist_ok=True)
+        partial.write_bytes(b"p0")
+        out.write_bytes(b"v")
+        Path(f"{out}.steps.json").write_text(
+            json.dumps({"marks": [{"time": 1.0, "partial": 0, "wait": 0.1}], "partials": [str(partial)]}),
+            encoding="utf-8",
+        )
+
+    def fake_retime(video, durations, out, *, cancel_event=None):
+        data = json.loads(Path(f"{video}.steps.json").read_text(encoding="utf-8"))
+        retimed.append([Path(p).read_bytes() for p in data["partials"]])
+        out.write_bytes(b"t")
+
+    monkeypatch.setattr(pipeline, "render_manim_video_with_self_heal", fake_render)
+    monkeypatch.setattr(pipeline, "retime_video", fake_retime)
+    pipeline.run_pipeline("题目", tmp_path / "task_a")
+    # 换音色重新生成：新任务目录、同一份场景代码，只重跑 TTS 与合成
+    pipeline.run_pipeline("题目", tmp_path / "task_b")
+    assert len(rendered) == 1
+    assert (tmp_path / "task_b" / "final.mp4").exists()
+    assert retimed == [[b"p0"], [b"p0"]]
+
+
+def test_run_pipeline_fused_compose_falls_back_to_two_step(fake_stages, monkeypatch, tmp_path):
+    monkeypatch.setenv("COMPOSE_FUSED", "true")
+    fused_inputs: list[list[str]] = []
+
+    def fake_fused(video, audio_paths, out, *, cancel_event=None):
+        fused_inputs.append([p.name for p in audio_paths])
+        raise pipeline.CompositionError("filter failed")
+
+    monkeypatch.setattr(pipeline, "compose_video_with_audio_segments", fake_fused)
+    out = pipeline.run_pipeline("题目", tmp_path)
+    assert out.read_bytes() == b"f"
+    assert fused_inputs == [["step_1.mp3"]]
+    # 阶段 4 不再单独拼接，回退时才在合成阶段拼接一次
+    assert len(fake_stages["concat"]) == 1 and fake_stages["concat"][0] > fake_stages["render"][0]
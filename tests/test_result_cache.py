@@ -0,0 +1,72 @@
+"""成品结果缓存单测：归一化题目命中、版本标签失效、成品被回收后条目自动删除。"""
+from api import result_cache
+
+
+def _use_tmp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "DB_PATH", tmp_path / "result_cache.db")
+
+
+def test_hit_on_normalized_text_and_image(tmp_path, monkeypatch):
+    _use_tmp_db(tmp_path, monkeypatch)
+    blob = tmp_path / "ab" / "abc.mp4"
+    blob.parent.mkdir()
+    blob.write_bytes(b"video")
+    result_cache.store(result_cache.make_key("求 x+1=2 的解", b"img"), "t1", blob)
+
+    assert result_cache.lookup(result_cache.make_key("  求 x+1=2   的解 ", b"img")) == blob
+    assert result_cache.lookup(result_cache.make_key("求 x+1=2 的解", b"other")) is None
+    assert result_cache.lookup(result_cache.make_key("求 x+1=2 的解")) is None
+
+
+def test_version_change_invalidates(tmp_path, monkeypatch):
+    _use_tmp_db(tmp_path, monkeypatch)
+    blob = tmp_path / "abc.mp4"
+    blob.write_bytes(b"video")
+    result_cache.store(result_cache.make_key("题目"), "t1", blob)
+
+    monkeypatch.setenv("TTS_VOICE", "zh-CN-YunxiNeural-other")
+    assert result_cache.lookup(result_cache.make_key("题目")) is None
+    assert result_cache.purge_stale() == 1
+    assert result_cache.get_stats()["entries"] == 0
+
+
+def test_missing_artifact_drops_entry(tmp_path, monkeypatch):
+    _use_tmp_db(tmp_path, monkeypatch)
+    blob = tmp_path / "abc.mp4"
+    blob.write_bytes(b"video")
+    key = result_cache.make_key("题目")
+    result_cache.store(key, "t1", blob)
+    blob.unlink()
+
+    assert result_cache.lookup(key) is None
+    assert result_cache.get_stats()["entries"] == 0
+
+
+def _png(rows: list[list[int]]) -> bytes:
+    """生成灰度 PNG（不依赖 Pillow）。"""
+    import struct
+    import zlib
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    raw = b"".join(b"\x00" + bytes(r) for r in rows)
+    header = struct.pack(">IIBBBBB", len(rows[0]), len(rows), 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def test_similar_layout_images_do_not_collide(tmp_path, monkeypatch):
+    _use_tmp_db(tmp_path, monkeypatch)
+    blob = tmp_path / "abc.mp4"
+    blob.write_bytes(b"video")
+    # 两张版式相同的题图：只有一处笔画不同，均值哈希下会得到同一指纹
+    base = [[255] * 64 for _ in range(64)]
+    for y in range(20, 24):
+        base[y][8:56] = [0] * 48
+    other = [row[:] for row in base]
+    other[40][30:34] = [0] * 4
+    first, second = _png(base), _png(other)
+    result_cache.store(result_cache.make_key("", first), "t1", blob)
+
+    assert result_cache.lookup(result_cache.make_key("", first)) == blob
+    assert result_cache.lookup(result_cache.make_key("", second)) is None
@@ -0,0 +1,55 @@
+"""任务调度单测：有界队列拒绝与排队位置、阶段池限流与利用率统计。"""
+import threading
+import time
+
+import pytest
+
+from api.scheduler import JobScheduler, QueueFullError, StagePool
+
+
+def test_scheduler_rejects_when_queue_full():
+    release = threading.Event()
+    started = threading.Event()
+
+    def job():
+        started.set()
+        release.wait(2)
+
+    sched = JobScheduler(max_jobs=1, queue_size=2)
+    assert sched.submit(job) == 0
+    assert started.wait(1)
+    assert sched.submit(job) == 1
+    assert sched.submit(job) == 2
+    with pytest.raises(QueueFullError) as exc:
+        sched.submit(job)
+    assert exc.value.queue_position == 2
+    release.set()
+    sched.shutdown()
+    assert sched.get_stats()["rejected"] == 1
+
+
+def test_stage_pool_bounds_concurrency():
+    pool = StagePool("cpu", 2)
+    peak = 0
+    current = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal peak, current
+        with pool.slot():
+            with lock:
+                current += 1
+                peak = max(peak, current)
+            time.sleep(0.05)
+            with lock:
+                current -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = pool.get_stats()
+    assert peak == 2
+    assert stats["acquired"] == 5 and stats["busy"] == 0
+    assert stats["busy_seconds"] >= 0.25 and stats["wait_seconds"] > 0
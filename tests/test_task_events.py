@@ -0,0 +1,52 @@
+"""状态推送单测：同一任务的多个订阅者共享一份快照，状态不变时不重复推送。"""
+import asyncio
+import threading
+
+import pytest
+
+from api import history_store, task_events, task_store
+
+
+@pytest.fixture(autouse=True)
+def history_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_store, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(history_store, "DB_PATH", tmp_path / "history.db")
+    history_store.init_db()
+
+
+def test_fanout_to_all_subscribers():
+    task_id = task_store.create_task("题目", "题目")
+    hub = task_events.TaskEventHub()
+
+    async def run():
+        a, b = hub.subscribe(task_id), hub.subscribe(task_id)
+
+        def work():
+            task_store.set_running(task_id)
+            task_store.set_progress(task_id, "题目分析")
+            task_store.set_progress(task_id, "题目分析")
+            task_store.set_success(task_id, "/results/x.mp4")
+
+        # 状态回调来自任务线程
+        t = threading.Thread(target=work)
+        t.start()
+        await asyncio.to_thread(t.join)
+        received = []
+        for q in (a, b):
+            events = []
+            while True:
+                events.append(await asyncio.wait_for(q.get(), 1))
+                if events[-1]["status"] in task_events.TERMINAL_STATUSES:
+                    break
+            received.append(events)
+        hub.unsubscribe(task_id, a)
+        hub.unsubscribe(task_id, b)
+        task_store.remove_listener(hub._on_task_event)
+        return received
+
+    a_events, b_events = asyncio.run(run())
+    assert a_events == b_events
+    assert [e["current_step"] for e in a_events] == [None, "题目分析", None]
+    assert a_events[-1]["video_url"] == "/results/x.mp4"
+    stats = hub.get_stats()
+    assert stats["published"] == 3 and stats["delivered"] == 6 and stats["subscribers"] == 0
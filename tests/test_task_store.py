@@ -0,0 +1,109 @@
+"""任务状态单测：同题请求合并（跟随者共享进度，领头失败时一并失败）。"""
+import pytest
+
+from api import history_store, task_store
+
+
+@pytest.fixture(autouse=True)
+def history_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_store, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(history_store, "DB_PATH", tmp_path / "history.db")
+    history_store.init_db()
+
+
+def test_coalesce_key_normalizes_text_and_image():
+    assert task_store.coalesce_key("求  x+1=2 的解 ") == task_store.coalesce_key("求 x+1=2 的解")
+    assert task_store.coalesce_key("题", b"a") != task_store.coalesce_key("题", b"b")
+
+
+def test_followers_share_progress_and_failure():
+    key = task_store.coalesce_key("同一道题")
+    leader = task_store.create_task("同一道题", "同一道题")
+    follower = task_store.create_task("同一道题", "同一道题")
+    assert task_store.join_inflight(key, leader) is None
+    assert task_store.join_inflight(key, follower) == leader
+    task_store.set_running(leader)
+    task_store.set_progress(leader, "题目分析")
+    assert task_store.get_task(follower).current_step == "题目分析"
+    assert history_store.get_record(follower).status == "running"
+    task_store.set_failed(leader, "boom")
+    assert task_store.get_task(follower).status == "failed"
+    # 领头结束后同题请求重新成为领头
+    other = task_store.create_task("同一道题", "同一道题")
+    assert task_store.join_inflight(key, other) is None
+    stats = task_store.get_coalesce_stats()
+    assert stats["followers"] >= 1 and 0 < stats["ratio"] < 1
+
+
+def test_followers_and_cache_hits_share_one_hls_package(tmp_path, monkeypatch):
+    from api import artifact_store, task_runner
+
+    monkeypatch.setattr(task_runner, "RESULTS_DIR", tmp_path / "results")
+    monkeypatch.setattr(task_runner, "HLS_DIR", tmp_path / "hls")
+    monkeypatch.setattr(artifact_store, "ARTIFACTS_DIR", tmp_path / "artifacts")
+    (tmp_path / "results").mkdir()
+    (tmp_path / "hls").mkdir()
+    monkeypatch.setenv("HLS_ENABLED", "true")
+    packaged = []
+
+    def fake_package(video, out):
+        packaged.append(out)
+        (out / "master.m3u8").write_text("#EXTM3U\n")
+
+    monkeypatch.setattr(task_runner.hls, "package_hls_in_background", fake_package)
+    video = tmp_path / "final.mp4"
+    video.write_bytes(b"video")
+
+    key = task_store.coalesce_key("共享 HLS 的题")
+    leader = task_store.create_task("共享 HLS 的题", "共享 HLS 的题")
+    follower = task_store.create_task("共享 HLS 的题", "共享 HLS 的题")
+    task_store.join_inflight(key, leader)
+    task_store.join_inflight(key, follower)
+    task_runner.publish_result(leader, video)
+    # 缓存命中：以成品库中的同一文件再次发布
+    hit = task_store.create_task("共享 HLS 的题", "共享 HLS 的题")
+    task_runner.publish_result(hit, tmp_path / "results" / f"{leader}.mp4")
+
+    assert len(packaged) == 1
+    for tid in (leader, follower, hit):
+        assert (tmp_path / "hls" / tid / "master.m3u8").is_file()
+        assert task_store.get_task(tid).status == "success"
+
+
+def test_failed_follower_retries_through_leader_and_force_skips_coalescing(monkeypatch):
+    from api import routes
+
+    monkeypatch.setenv("EXECUTION_MODE", "local")
+    monkeypatch.setenv("COALESCE_ENABLED", "true")
+    submitted = []
+
+    class FakeScheduler:
+        def submit(self, fn, *args):
+            submitted.append(fn.__name__)
+            return 0
+
+    monkeypatch.setattr(routes.scheduler, "get_scheduler", lambda: FakeScheduler())
+    # 仅图片提交：跟随者自己没有题目文本
+    leader = task_store.create_task("图片上传")
+    follower = task_store.create_task("图片上传")
+    routes._submit("generate", leader, None, b"img")
+    routes._submit("generate", follower, None, b"img")
+    task_store.update_task_problem(leader, "识别出的题目")
+    task_store.set_failed(leader, "boom")
+    assert history_store.get_record(follower).problem_text == "识别出的题目"
+    assert task_store.work_task_id(follower) == leader
+
+    # 领头与跟随者同时断点重试：共用领头的检查点目录，合并为一次执行
+    routes._submit("retry", leader, new_task=False)
+    routes._submit("retry", follower, new_task=False)
+    assert submitted == ["run_generate_task", "run_retry_task"]
+    assert task_store.get_task(follower).status == "pending"
+
+    # force 提交不挂靠进行中的同题任务
+    a = task_store.create_task("强制重做", "强制重做")
+    b = task_store.create_task("强制重做", "强制重做")
+    routes._submit("generate", a, "强制重做")
+    routes._submit("generate", b, "强制重做", coalesce=False)
+    assert submitted[-2:] == ["run_generate_task", "run_generate_task"]
+    task_store.finish_inflight(a)
+    task_store.finish_inflight(leader)
@@ -0,0 +1,75 @@
+"""TTS 单测：批量合成的并发、顺序与单步重试（以假合成函数替换 edge-tts）。"""
+import asyncio
+
+from asset_generation import tts
+
+
+def test_generate_audios_for_steps_concurrent_ordered_and_retries(monkeypatch, tmp_path):
+    monkeypatch.setattr(tts, "_RETRY_BACKOFF_SECONDS", 0)
+    active = {"now": 0, "peak": 0}
+    attempts: dict[str, int] = {}
+
+    async def fake_generate(text, path):
+        attempts[text] = attempts.get(text, 0) + 1
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01 * (5 - len(text)))
+        active["now"] -= 1
+        if text == "bb" and attempts[text] == 1:
+            raise ConnectionError("flaky")
+        path.write_bytes(b"x")
+        return float(len(text))
+
+    monkeypatch.setattr(tts, "generate_audio_with_duration_async", fake_generate)
+    steps = [{"voiceover_text": "a"}, {"voiceover_text": "bb"}, {"voiceover_text": ""}, {"voiceover_text": "cccc"}]
+    durations = tts.generate_audios_for_steps(steps, output_dir=tmp_path, prefix="step", max_concurrency=2)
+    assert durations == [1.0, 2.0, tts.get_settings().default_wait_seconds, 4.0]
+    assert attempts == {"a": 1, "bb": 2, "cccc": 1}
+    assert active["peak"] == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["step_1.mp3", "step_2.mp3", "step_4.mp3"]
+
+
+def test_tts_cache_hit_hardlinks_and_skips_synthesis(monkeypatch, tmp_path):
+    from asset_generation import tts_cache
+
+    monkeypatch.setenv("TTS_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("TTS_VOICE", "v1")
+    src = tmp_path / "src.mp3"
+    src.write_bytes(b"mp3-bytes")
+    tts_cache.store("v1", "  你好，\n世界 ", src, 1.25)
+
+    out = tmp_path / "work" / "step_1.mp3"
+    duration = asyncio.run(tts.generate_audio_with_duration_async("你好， 世界", out))
+    assert duration == 1.25
+    assert out.read_bytes() == b"mp3-bytes"
+    cached_mp3, _ = tts_cache._entry_paths(tts_cache.make_key("v1", "你好， 世界"))
+    assert out.stat().st_ino == cached_mp3.stat().st_ino
+    assert tts_cache.fetch("v2", "你好， 世界", out) is None
+
+
+def test_tts_cache_store_scans_only_over_limit(monkeypatch, tmp_path):
+    import os
+
+    from asset_generation import tts_cache
+
+    monkeypatch.setenv("TTS_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("TTS_CACHE_MAX_BYTES", "1000000")
+    scans = []
+    real_evict = tts_cache.evict
+    monkeypatch.setattr(tts_cache, "evict", lambda: scans.append(1) or real_evict())
+
+    def stored(i):
+        # 各条目独立文件：缓存以硬链接保存，共用 inode 会共用 mtime
+        src = tmp_path / f"src{i}.mp3"
+        src.write_bytes(b"x" * 100)
+        tts_cache.store("v1", f"第{i}句", src, 1.0)
+
+    for i in range(5):
+        stored(i)
+    # 仅首次写入时扫描一次以建立大小估计
+    assert len(scans) == 1
+    monkeypatch.setenv("TTS_CACHE_MAX_BYTES", "550")
+    os.utime(tts_cache._entry_paths(tts_cache.make_key("v1", "第0句"))[0], (1, 1))
+    stored(5)
+    assert len(scans) == 2
+    assert tts_cache.fetch("v1", "第0句", tmp_path / "out.mp3") is None
@@ -0,0 +1,124 @@
+"""
+独立 worker 进程（EXECUTION_MODE=queue）：从持久化任务队列租约领取任务并执行流水线，执行期间定期续约、上报当前步骤。
+可在多台机器上运行，需与 API 共享 data/（任务队列与历史库）和 output/ 目录。
+
+用法：uv run python worker.py [--concurrency N]
+"""
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from api import job_queue, task_store
+from api.history_store import init_db as init_history_db
+from api.task_runner import run_generate_task, run_retry_task
+from config import get_settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("worker")
+
+# 队列为空时的轮询间隔（秒）
+_POLL_SECONDS = 2.0
+
+# 本进程正在执行的任务：task_id -> (job_id, 租约持有者)，供进度回调写回队列
+_active: dict[str, tuple[int, str]] = {}
+_active_lock = threading.Lock()
+
+
+def _report_progress(task_id: str, event: dict) -> None:
+    with _active_lock:
+        lease = _active.get(task_id)
+    if lease and event.get("current_step"):
+        job_queue.heartbeat(lease[0], lease[1], event["current_step"])
+
+
+def _keep_alive(job: job_queue.Job, owner: str, stop: threading.Event, lost: threading.Event) -> None:
+    """定期续约；续约失败时置位 lost，流水线不再开始新阶段、也不发布成品，避免与接手的 worker 同时写输出目录。"""
+    interval = get_settings().job_heartbeat_seconds
+    while not stop.wait(interval):
+        if not job_queue.heartbeat(job.job_id, owner):
+            logger.warning("[worker] task_id=%s 租约已失效（可能已被其他 worker 接手），中止执行", job.task_id)
+            lost.set()
+            return
+
+
+def run_job(job: job_queue.Job, owner: str) -> None:
+    logger.info("[worker] 领取 task_id=%s kind=%s 第 %d 次", job.task_id, job.kind, job.attempts)
+    with _active_lock:
+        _active[job.task_id] = (job.job_id, owner)
+    stop = threading.Event()
+    lost = threading.Event()
+    beat = threading.Thread(target=_keep_alive, args=(job, owner, stop, lost), daemon=True)
+    beat.start()
+    error = None
+    try:
+        # 执行函数自行标记任务失败并返回原因，这里据此把队列任务记为 failed
+        if job.kind == "retry":
+            error = run_retry_task(job.task_id, cancel_event=lost)
+        else:
+            error = run_generate_task(
+                job.task_id,
+                job.payload.get("problem_text"),
+                job.image,
+                job.payload.get("image_mime_type") or "image/jpeg",
+                cancel_event=lost,
+            )
+    except Exception as e:
+        logger.exception("[worker] task_id=%s 执行异常: %s", job.task_id, e)
+        error = str(e)
+    finally:
+        stop.set()
+        with _active_lock:
+            _active.pop(job.task_id, None)
+    job_queue.complete(job.job_id, owner, error)
+
+
+def work_loop(owner: str, stop: threading.Event) -> None:
+    while not stop.is_set():
+        try:
+            job, expired = job_queue.lease(owner)
+        except Exception as e:
+            logger.warning("[worker] 领取任务失败: %s", e)
+            stop.wait(_POLL_SECONDS)
+            continue
+        for task_id in expired:
+            task_store.set_failed(task_id, "执行任务的 worker 多次失联，任务已放弃")
+        if job is None:
+            stop.wait(_POLL_SECONDS)
+            continue
+        run_job(job, owner)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="数学讲解视频流水线 worker")
+    parser.add_argument("--concurrency", type=int, default=get_settings().scheduler_max_jobs, help="同时执行的任务数")
+    args = parser.parse_args()
+    init_history_db()
+    task_store.add_listener(_report_progress)
+    base = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=work_loop, args=(f"{base}/{i}", stop), name=f"worker-{i}", daemon=True)
+        for i in range(max(1, args.concurrency))
+    ]
+    for t in threads:
+        t.start()
+    logger.info("[worker] %s 已启动，并发 %d", base, len(threads))
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        # 执行中的任务不再续约，租约过期后由其他 worker 从检查点续跑
+        logger.info("[worker] 收到中断，停止领取新任务")
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()